@@ -0,0 +1,62 @@
+from collections import namedtuple
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_KEY = 'frami:access:version'
+
+
+class Access(namedtuple('Access', ['groups', 'perms'])):
+    """
+    Snapshot of the groups and permissions of a user.
+
+    :ivar groups: A dict of group names to primary keys.
+    :ivar perms: A set of permission names.
+    """
+
+    @property
+    def group_ids(self):
+        return list(self.groups.values())
+
+
+def get_access(user):
+    """
+    Retrieve an access snapshot for `user`.
+
+    With `ACCESS_CACHE_TIMEOUT` set, snapshots are shared between
+    requests through the cache.  Cached snapshots are keyed on a global
+    version that `invalidate()` replaces, so a change in any group or
+    permission makes every cached snapshot unreachable.
+
+    The permission cache of the auth backend is primed from the
+    snapshot, so later `has_perm()` calls do not query the database.
+    """
+    if not user.is_authenticated:
+        return Access({}, frozenset())
+
+    timeout = settings.ACCESS_CACHE_TIMEOUT
+    key = None
+    access = None
+    if timeout:
+        cache.add(VERSION_KEY, uuid4().hex, None)
+        key = 'frami:access:{}:{}'.format(cache.get(VERSION_KEY), user.pk)
+        access = cache.get(key)
+
+    if access is None:
+        access = Access(
+            dict(user.groups.values_list('name', 'pk')),
+            frozenset(user.get_all_permissions()),
+        )
+        if key:
+            cache.set(key, access, timeout)
+
+    user._perm_cache = set(access.perms)  # pylint: disable=W0212
+    return access
+
+
+def invalidate():
+    """
+    Make every cached access snapshot unreachable.
+    """
+    cache.set(VERSION_KEY, uuid4().hex, None)
@@ -1,5 +1,12 @@
 from django.apps import AppConfig
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate, pre_delete
+
+from .. import archive
+from ..database import apply_pragmas
+from ..sharding import attach, check_rows, delete_user_rows, reserve_ids
 
 
 class ApiConfig(AppConfig):
@@ -9,4 +16,32 @@ class ApiConfig(AppConfig):
         from . import signals
         assert signals  # for pyflakes
 
+        connection_created.connect(
+            apply_pragmas,
+            dispatch_uid='frami.database.apply_pragmas',
+        )
+        connection_created.connect(
+            attach,
+            dispatch_uid='frami.sharding.attach',
+        )
+        connection_created.connect(
+            archive.attach,
+            dispatch_uid='frami.archive.attach',
+        )
+        post_migrate.connect(
+            reserve_ids,
+            sender=self,
+            dispatch_uid='frami.sharding.reserve_ids',
+        )
+        post_migrate.connect(
+            check_rows,
+            sender=self,
+            dispatch_uid='frami.sharding.check_rows',
+        )
+        pre_delete.connect(
+            delete_user_rows,
+            sender=get_user_model(),
+            dispatch_uid='frami.sharding.delete_user_rows',
+        )
+
         return super().ready()
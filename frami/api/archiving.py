@@ -0,0 +1,205 @@
+from collections import Counter, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F, Max, Q
+from django.utils import timezone
+
+from . import caching, changes, scheduling
+from ..sharding import fan_out, is_sharded
+from .models import (
+    Answer,
+    Appointment,
+    AppointmentException,
+    AppointmentRequest,
+    Question,
+    Result,
+    Tombstone,
+)
+
+Source = namedtuple('Source', ['model', 'closed', 'children'])
+
+
+def _closed_appointments(queryset, cutoff):
+    single = Q(recurrence_interval=None, end_date__lt=cutoff)
+    recurring = Q(recurrence_end__lt=cutoff)
+    return queryset.filter(single | recurring)
+
+
+def _answered_questions(queryset, cutoff):
+    answered = Max('answers__modification_date')
+    queryset = queryset.annotate(answered=answered)
+    return queryset.filter(answered__lt=cutoff, modification_date__lt=cutoff)
+
+
+def _old_results(queryset, cutoff):
+    return queryset.filter(modification_date__lt=cutoff)
+
+
+def _unbooked_requests(queryset, cutoff):
+    return queryset.filter(appointment=None, modification_date__lt=cutoff)
+
+
+# Models that are archived, with a function that selects the objects
+# that were closed before a cutoff and the relations of the objects that
+# are archived along with them.  Every model must be in
+# `frami.archive.ARCHIVED`.
+SOURCES = [
+    Source(
+        Appointment,
+        _closed_appointments,
+        [(AppointmentException, 'appointment'),
+         (AppointmentRequest, 'appointment')],
+    ),
+    Source(AppointmentRequest, _unbooked_requests, []),
+    Source(Question, _answered_questions, [(Answer, 'question')]),
+    Source(Result, _old_results, []),
+]
+
+
+def archive(cutoff=None, batch_size=None):
+    """
+    Move objects that were closed before `cutoff` to the archive.
+
+    Objects are moved in batches of `batch_size`.  A batch is committed
+    to the archive before it is deleted, and copies from a batch that
+    wasn't deleted are replaced on the next run, so archiving can be
+    interrupted at any point.  Archived objects are removed from the
+    changes with tombstones.  Their notifications are kept, like those
+    of deleted objects.
+
+    :param cutoff: A datetime, or None for `ARCHIVE_HORIZON_DAYS` ago.
+    :param batch_size: Number of objects per batch, or None for
+        `ARCHIVE_BATCH_SIZE`.
+    :returns: A Counter with the number of archived objects per model.
+    :raises ValueError: If the archive isn't configured.
+    """
+    if not settings.DATABASE_ARCHIVE:
+        raise ValueError('DATABASE_ARCHIVE is not configured')
+    if cutoff is None:
+        days = settings.ARCHIVE_HORIZON_DAYS
+        cutoff = timezone.now() - timedelta(days=days)
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+
+    moved = Counter()
+    for source in SOURCES:
+        for queryset in fan_out(source.model.objects.all()):
+            closed = source.closed(queryset, cutoff).order_by('pk')
+            while True:
+                pks = list(closed.values_list('pk', flat=True)[:batch_size])
+                if not pks:
+                    break
+                _move(source, queryset.db, pks, moved)
+
+    if moved and settings.RESPONSE_CACHE_TIMEOUT:
+        caching.bump_all()
+    return moved
+
+
+def _move(source, alias, pks, moved):
+    primary = router.db_for_write(Tombstone)
+    with transaction.atomic(using=alias):
+        batches = _get_batches(source, alias, pks, primary)
+        with transaction.atomic(using=settings.DATABASE_ARCHIVE):
+            for model, _, objs in batches:
+                _copy(model, objs)
+        _delete(batches, alias, primary)
+        for model, _, objs in batches:
+            if objs:
+                moved[_get_name(model)] += len(objs)
+
+        # Raw deletes don't send signals.
+        if source.model is Appointment:
+            _, _, objs = batches[0]
+            for obj in objs:
+                scheduling.update(obj, deleted=True)
+
+
+def _get_batches(source, alias, pks, primary):
+    """
+    Lock the objects with `pks` and collect them with their children.
+
+    :returns: A list of `(model, queryset, objs)` tuples, starting with
+        the objects of `source`.
+    """
+    queryset = source.model.objects.using(alias).filter(pk__in=pks)
+    # Writes to the batch are held off until it is deleted.
+    queryset.update(id=F('id'))
+    batches = [(source.model, queryset, list(queryset))]
+    for child, field in source.children:
+        child_alias = alias if is_sharded(child) else primary
+        lookup = {'{}__in'.format(field): pks}
+        child_queryset = child.objects.using(child_alias).filter(**lookup)
+        batches.append((child, child_queryset, list(child_queryset)))
+    return batches
+
+
+def _delete(batches, alias, primary):
+    """
+    Delete the archived `batches` and leave tombstones for them.
+
+    Rows on the primary are removed in a transaction of their own, which
+    commits before a batch on a shard is deleted.  A batch that isn't
+    deleted is archived again by the next run.
+    """
+    with transaction.atomic(using=primary):
+        tombstones = []
+        for model, queryset, _ in batches:
+            tombstones += _get_tombstones(model, queryset)
+        Tombstone.objects.using(primary).bulk_create(tombstones)
+        for _, queryset, _ in reversed(batches):
+            if queryset.db == primary:
+                queryset._raw_delete(primary)  # pylint: disable=W0212
+
+    for _, queryset, _ in reversed(batches):
+        if queryset.db != primary:
+            queryset._raw_delete(alias)  # pylint: disable=W0212
+
+
+def _copy(model, objs):
+    """
+    Insert `objs` into the archive as they are.
+
+    `bulk_create()` would renew `auto_now` dates, so the rows are
+    inserted with their column values.  Rows from an earlier run that
+    was interrupted are replaced.
+    """
+    if not objs:
+        return
+    connection = connections[settings.DATABASE_ARCHIVE]
+    opts = model._meta  # pylint: disable=W0212
+    fields = opts.concrete_fields
+    quote = connection.ops.quote_name
+    sql = 'INSERT OR REPLACE INTO {} ({}) VALUES ({})'.format(
+        quote(opts.db_table),
+        ', '.join(quote(f.column) for f in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+    with connection.cursor() as cursor:
+        rows = []
+        for obj in objs:
+            values = [getattr(obj, f.attname) for f in fields]
+            rows.append([
+                f.get_db_prep_save(value, connection)
+                for f, value in zip(fields, values)
+            ])
+        cursor.executemany(sql, rows)
+
+
+def _get_tombstones(model, queryset):
+    """
+    Build tombstones for the objects in `queryset` that are part of the
+    changes.
+    """
+    owners = {s.model: s.owner for s in changes.SOURCES}
+    if model not in owners:
+        return []
+    return [
+        Tombstone(target_name=_get_name(model), target_id=pk, owner_id=owner)
+        for pk, owner in queryset.values_list('pk', owners[model])
+    ]
+
+
+def _get_name(model):
+    return model._meta.model_name  # pylint: disable=W0212
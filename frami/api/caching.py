@@ -0,0 +1,71 @@
+from hashlib import md5
+from uuid import uuid4
+
+from django.core.cache import cache
+
+GLOBAL_KEY = 'frami:response:version'
+
+
+def get_version(key, timeout=None):
+    """
+    Retrieve the version stored in `key`, creating it if necessary.
+
+    :param timeout: Seconds until a created version expires, or None to
+        keep it.
+    :returns: The version.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, timeout)
+        version = cache.get(key)
+    return version
+
+
+def get_version_key(model, owner_id=None):
+    """
+    Build the key of the response version of `model`.
+
+    Without `owner_id`, the version covers every object of `model`.
+    Otherwise it covers the objects owned by `owner_id`.
+    """
+    label = model._meta.label_lower  # pylint: disable=W0212
+    if owner_id is None:
+        return 'frami:response:{}'.format(label)
+    return 'frami:response:{}:{}'.format(label, owner_id)
+
+
+def get_key(model, path, owner_id=None):
+    """
+    Build the key of a cached response.
+
+    The key includes the current versions of all responses and of the
+    visibility scope, so bumping either makes the response unreachable.
+
+    :param model: The model of the response.
+    :param path: The full path of the request, with query parameters.
+    :param owner_id: Primary key of the owner that the response is
+        limited to, or None for unlimited responses.
+    :returns: The cache key.
+    """
+    return 'frami:response:{}:{}:{}'.format(
+        get_version(GLOBAL_KEY),
+        get_version(get_version_key(model, owner_id)),
+        md5('{}:{}'.format(owner_id, path).encode()).hexdigest(),
+    )
+
+
+def bump(model, owner_id=None):
+    """
+    Make the cached responses of `model` and of `owner_id` unreachable.
+    """
+    keys = [get_version_key(model)]
+    if owner_id is not None:
+        keys.append(get_version_key(model, owner_id))
+    cache.set_many({key: uuid4().hex for key in keys}, None)
+
+
+def bump_all():
+    """
+    Make every cached response unreachable.
+    """
+    cache.set(GLOBAL_KEY, uuid4().hex, None)
@@ -0,0 +1,217 @@
+import json
+from base64 import urlsafe_b64decode
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from ..sharding import fan_out
+from .models import (
+    Answer,
+    Appointment,
+    AppointmentRequest,
+    Prescription,
+    PrescriptionRequest,
+    Question,
+    Result,
+    Tombstone,
+)
+from .prefetch import get_related
+from .serializers import (
+    AnswerSerializer,
+    AppointmentRequestSerializer,
+    AppointmentSerializer,
+    PrescriptionRequestSerializer,
+    PrescriptionSerializer,
+    QuestionSerializer,
+    ResultSerializer,
+)
+
+Source = namedtuple('Source', ['model', 'serializer', 'owner', 'permission'])
+
+# Models that are synchronized, with the user that owns each object and
+# the permission that is required to see it.  The order is part of the
+# cursor and must not change.
+SOURCES = [
+    Source(
+        Appointment,
+        AppointmentSerializer,
+        'patient',
+        'api.view_appointment',
+    ),
+    Source(
+        AppointmentRequest,
+        AppointmentRequestSerializer,
+        'creator',
+        'api.view_appointmentrequest',
+    ),
+    Source(Prescription, PrescriptionSerializer, 'patient', 'auth.view_user'),
+    Source(
+        PrescriptionRequest,
+        PrescriptionRequestSerializer,
+        'creator',
+        'auth.view_user',
+    ),
+    Source(Question, QuestionSerializer, 'creator', 'api.view_question'),
+    Source(Answer, AnswerSerializer, 'question__creator', 'api.view_question'),
+    Source(Result, ResultSerializer, 'patient', 'api.view_result'),
+]
+
+
+class CursorError(Exception):
+    pass
+
+
+def get_changes(request, since=None, limit=100, admin=False):
+    """
+    Retrieve objects changed and deleted after `since`.
+
+    Changes are ordered on their modification date, the position of
+    their model in `SOURCES` and their primary key, followed by
+    tombstones for deleted objects.  Each model is scanned with its
+    `(modification_date, id)` index for at most `limit` + 1 rows.
+
+    Modification dates are set before a transaction commits, so a
+    change can become visible after later changes were returned.  The
+    cursor of the last page is therefore set `CHANGES_SETTLE_SECONDS`
+    before the current time, unless `since` is later, and changes
+    within that window are returned again by the next call.  Changes
+    that commit later than that can be missed.  The cursor keeps moving
+    when there are no changes, so it doesn't expire while in use.
+
+    Tombstones are pruned after `TOMBSTONE_RETENTION_DAYS`, so older
+    cursors are rejected and the client has to start over.
+
+    :param request: The request to serialize for.
+    :param since: A cursor from a previous call, or None to start from
+        the beginning.
+    :param limit: Maximum number of changes to return.
+    :param admin: Whether every object is visible, rather than only
+        the objects owned by the requesting user.
+    :returns: A tuple with a list of changes, the cursor of the last
+        change and whether there are more changes.
+    :raises CursorError: If `since` is older than the tombstones.
+    """
+    now = timezone.now()
+    retention = timedelta(days=settings.TOMBSTONE_RETENTION_DAYS)
+    if since and since[0] < now - retention:
+        raise CursorError('Expired cursor')
+
+    user = request.user
+    sources = list(enumerate(SOURCES))
+    sources = [(i, s) for i, s in sources if user.has_perm(s.permission)]
+    rows = _get_rows(sources, since, limit, None if admin else user.pk)
+    rows.sort(key=lambda row: row[0])
+    more = len(rows) > limit
+    rows = rows[:limit]
+    changes = [_get_change(request, key, instance) for key, instance in rows]
+
+    cursor = list(rows[-1][0]) if rows else since
+    if not more:
+        settled = now - timedelta(seconds=settings.CHANGES_SETTLE_SECONDS)
+        cursor = max(since or [], [settled, 0, 0])
+    return changes, cursor, more
+
+
+def prune_tombstones(cutoff=None):
+    """
+    Delete tombstones that were created before `cutoff`.
+
+    :param cutoff: A datetime, or None for `TOMBSTONE_RETENTION_DAYS`
+        ago.
+    :returns: The number of deleted tombstones.
+    """
+    if cutoff is None:
+        days = settings.TOMBSTONE_RETENTION_DAYS
+        cutoff = timezone.now() - timedelta(days=days)
+    count, _ = Tombstone.objects.filter(creation_date__lt=cutoff).delete()
+    return count
+
+
+def decode_cursor(encoded):
+    """
+    Decode a cursor from `get_changes()` encoded as urlsafe base64 JSON.
+    """
+    try:
+        date, index, pk = json.loads(urlsafe_b64decode(encoded).decode())
+        date = parse_datetime(date)
+        if not date or not isinstance(index, int) or not isinstance(pk, int):
+            raise ValueError('invalid cursor')
+    except (TypeError, ValueError):
+        raise CursorError('Invalid cursor')
+    return [date, index, pk]
+
+
+def _get_rows(sources, since, limit, owner_id):
+    """
+    Read at most `limit` + 1 rows after `since` from each of `sources`
+    and from the tombstones, keyed on their position in the changes.
+
+    :param owner_id: Primary key of the user that owns the rows, or None
+        for the rows of every user.
+    :returns: A list of tuples with a key and a model instance.
+    """
+    rows = []
+    for index, source in sources:
+        select, prefetch = get_related(source.serializer())
+        queryset = source.model.objects.select_related(*select)
+        queryset = queryset.prefetch_related(*prefetch)
+        queryset = queryset.filter(_after(since, index, 'modification_date'))
+        if owner_id is not None:
+            queryset = queryset.filter(**{source.owner: owner_id})
+        queryset = queryset.order_by('modification_date', 'pk')
+        for shard in fan_out(queryset, owner_id):
+            page = shard[:limit + 1]
+            rows += [((x.modification_date, index, x.pk), x) for x in page]
+
+    tombstones = Tombstone.objects.filter(
+        _after(since, len(SOURCES), 'creation_date'),
+        target_name__in=[_get_name(s.model) for _, s in sources],
+    )
+    if owner_id is not None:
+        tombstones = tombstones.filter(owner_id=owner_id)
+    tombstones = tombstones.order_by('creation_date', 'pk')[:limit + 1]
+    rows += [((x.creation_date, len(SOURCES), x.pk), x) for x in tombstones]
+    return rows
+
+
+def _get_change(request, key, instance):
+    """
+    Render `instance`, a row of `_get_rows()` at `key`, as a change.
+    """
+    _, index, pk = key
+    if index == len(SOURCES):
+        return {
+            'model': instance.target_name,
+            'id': instance.target_id,
+            'data': None,
+        }
+    source = SOURCES[index]
+    serializer = source.serializer(instance, context={'request': request})
+    return {
+        'model': _get_name(source.model),
+        'id': pk,
+        'data': serializer.data,
+    }
+
+
+def _after(cursor, index, date_field):
+    """
+    Build a condition for rows of `SOURCES[index]` ordered after `cursor`.
+    """
+    if not cursor:
+        return Q()
+    date, cursor_index, pk = cursor
+    later = Q(**{'{}__gt'.format(date_field): date})
+    if index < cursor_index:
+        return later
+    if index > cursor_index:
+        return later | Q(**{date_field: date})
+    return later | Q(**{date_field: date, 'pk__gt': pk})
+
+
+def _get_name(model):
+    return model._meta.model_name  # pylint: disable=W0212
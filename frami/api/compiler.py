@@ -0,0 +1,97 @@
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import fields
+from rest_framework.relations import PrimaryKeyRelatedField, SlugRelatedField
+from rest_framework.serializers import ModelSerializer
+
+# Fields that render database values unchanged.
+PLAIN_FIELDS = (
+    fields.BooleanField,
+    fields.CharField,
+    fields.EmailField,
+    fields.IntegerField,
+    fields.SlugField,
+)
+
+# Fields that render database values with `to_representation()`.
+CONVERTED_FIELDS = (
+    fields.ChoiceField,
+    fields.DateField,
+    fields.DateTimeField,
+    fields.DecimalField,
+    fields.FloatField,
+    fields.TimeField,
+    fields.UUIDField,
+)
+
+
+def compile_serializer(serializer):
+    """
+    Compile a read-only representation function for `serializer`.
+
+    The function takes a row of `values_list()` on the lookups in its
+    `lookups` attribute and returns the same representation as
+    `serializer.to_representation()` of the corresponding instance,
+    without going through the attribute lookups of each field.
+
+    Only serializers that render plain model fields and foreign keys as
+    primary keys or slugs can be compiled.
+
+    :param serializer: A ModelSerializer instance.
+    :returns: A function, or None if the serializer can't be compiled.
+    """
+    representation = type(serializer).to_representation
+    if representation is not ModelSerializer.to_representation:
+        return None
+
+    opts = serializer.Meta.model._meta  # pylint: disable=W0212
+    lookups, names, converters = [], [], []
+
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+
+        lookup = _get_lookup(opts, field)
+        if lookup is None:
+            return None
+
+        if type(field) in CONVERTED_FIELDS:  # pylint: disable=C0123
+            converters.append((len(lookups), field.to_representation))
+        lookups.append(lookup)
+        names.append(field.field_name)
+
+    size = len(lookups)
+
+    def represent(row):
+        # Rows may have trailing values beyond the lookups.
+        values = list(row[:size])
+        for i, convert in converters:
+            if values[i] is not None:
+                values[i] = convert(values[i])
+        return OrderedDict(zip(names, values))
+
+    represent.lookups = lookups
+    return represent
+
+
+def _get_lookup(opts, field):  # pylint: disable=R0911
+    try:
+        model_field = opts.get_field(field.source)
+    except FieldDoesNotExist:
+        return None
+
+    if model_field.many_to_many or model_field.one_to_many:
+        return None
+
+    kind = type(field)
+    if model_field.is_relation:
+        if kind is SlugRelatedField:
+            return '{}__{}'.format(field.source, field.slug_field)
+        if kind is PrimaryKeyRelatedField and field.pk_field is None:
+            return field.source
+        return None
+
+    if kind in PLAIN_FIELDS or kind in CONVERTED_FIELDS:
+        return field.source
+    return None
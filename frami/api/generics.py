@@ -1,12 +1,27 @@
 from collections import Callable
 from operator import attrgetter
 
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db.models import QuerySet
 from django.http import Http404
 from rest_framework.exceptions import PermissionDenied
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.serializers import ListSerializer
 from rest_framework.viewsets import GenericViewSet
 
+from ..archive import is_archived
+from ..replicas import is_pinned, pin, use_primary, use_replica
+from ..sharding import (
+    fan_out,
+    is_sharded,
+    shard_for_pk,
+    shard_for_user,
+    use_shard,
+)
+from .access import get_access
 from .permissions import ModelAndObjectPermission
+from .prefetch import get_only, get_related
 
 
 class BaseViewSet(GenericViewSet):
@@ -15,12 +30,96 @@ class BaseViewSet(GenericViewSet):
     filter_value = 'user.pk'
     admin_groups = ['admin']
     permission_classes = (ModelAndObjectPermission, )
+    replica_actions = ('list', 'retrieve')
 
-    def is_admin(self, user):
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            use_primary()
+            use_shard(None)
+
+    def initial(self, request, *args, **kwargs):
+        """
+        Route the reads of `replica_actions` to a replica.
+
+        Authentication and permissions are checked on the primary.
+        Sessions that write are pinned to the primary for a while, so
+        that they see their own writes.
+        """
+        super().initial(request, *args, **kwargs)
+        if request.method not in SAFE_METHODS:
+            pin(request)
+        elif self.action in self.replica_actions and not is_pinned(request):
+            use_replica()
+        self.route_shard()
+
+    def route_shard(self):
+        """
+        Route the sharded queries of the request to one shard.
+
+        Other users than those in `admin_groups` only see their own
+        objects, which are in their shard.  Detail routes of sharded
+        models are served from the shard that allocated the primary key.
+        Lists of users in `admin_groups` query every shard, see
+        `get_shard_querysets()`.
+        """
+        if not self.is_admin():
+            user = self.request.user
+            use_shard(shard_for_user(user.pk) if user.pk else None)
+        elif self.detail and is_sharded(self.queryset.model):
+            lookup = self.lookup_url_kwarg or self.lookup_field
+            use_shard(shard_for_pk(self.kwargs.get(lookup)))
+
+    def perform_authentication(self, request):
+        """
+        Authenticate and attach an access snapshot as `request.access`.
+        """
+        super().perform_authentication(request)
+        request.access = get_access(request.user)
+
+    def is_admin(self):
+        """
+        Check if the requesting user is in `admin_groups`.
+        """
+        groups = self.request.access.groups
+        return any(g in groups for g in self.admin_groups)
+
+    def get_fields(self):
+        """
+        Retrieve the field names requested with `?fields=`.
+
+        Fields can only be trimmed on safe requests, since writes need
+        every field of the serializer.
+        """
+        if self.request.method not in SAFE_METHODS:
+            return None
+        value = self.request.query_params.get('fields')
+        if not value:
+            return None
+        return set(value.split(','))
+
+    def get_serializer(self, *args, **kwargs):
         """
-        Check if `user` is in `admin_groups`.
+        Retrieve a serializer trimmed to the fields in `?fields=`.
         """
-        return any(user.groups.filter(name=g) for g in self.admin_groups)
+        serializer = super().get_serializer(*args, **kwargs)
+        names = self.get_fields()
+        if names is not None:
+            child = serializer
+            if isinstance(serializer, ListSerializer):
+                child = serializer.child
+            for name in list(child.fields):
+                if name not in names:
+                    child.fields.pop(name)
+        return serializer
+
+    def get_cursor_fields(self):
+        """
+        Retrieve the fields that the paginator orders on.
+        """
+        default = getattr(self.paginator, 'cursor_fields', ())
+        return list(getattr(self, 'cursor_fields', default))
 
     def get_queryset(self):
         """
@@ -28,9 +127,20 @@ class BaseViewSet(GenericViewSet):
 
         Users in `admin_groups` retrieves a complete queryset.  Other
         users are limited to objects that matches `filter_field`.
+
+        Related objects rendered by the serializer are joined or
+        prefetched, so listing does a constant number of queries.  With
+        `?fields=`, only the columns of the requested fields are loaded.
         """
         queryset = super().get_queryset()
-        if self.is_admin(self.request.user):
+        serializer = self.get_serializer()
+        select, prefetch = get_related(serializer)
+        queryset = queryset.select_related(*select)
+        queryset = queryset.prefetch_related(*prefetch)
+        only = self.get_fields() is not None and get_only(serializer)
+        if only:
+            queryset = queryset.only(*only, *self.get_cursor_fields())
+        if self.is_admin():
             return queryset
 
         field = self.filter_field
@@ -42,16 +152,60 @@ class BaseViewSet(GenericViewSet):
 
         return queryset.filter(**{field: value})
 
+    def get_shard_querysets(self, queryset):
+        """
+        Split a list queryset of a user in `admin_groups` into a queryset
+        per shard.
+
+        Lists of other users are bound to the shard of the user, since
+        streamed lists are read after `dispatch()` has reset the shard
+        of the thread.
+        """
+        if self.detail:
+            return [queryset]
+        if not self.is_admin():
+            user = self.request.user
+            return fan_out(queryset, user.pk) if user.pk else [queryset]
+        return fan_out(queryset)
+
     def get_object(self):
         """
         Retrieve an object.
 
-        If the object doesn't exist, 404 is raised for users in
-        `admin_groups` and 403 is raised for other users.
+        Objects that aren't found are looked up in the archive on safe
+        requests.  If the object doesn't exist, 404 is raised for users
+        in `admin_groups` and 403 is raised for other users.
         """
         try:
             return super().get_object()
         except Http404 as e:
-            if self.is_admin(self.request.user):
+            obj = self.get_archived_object()
+            if obj is not None:
+                return obj
+            if self.is_admin():
                 raise e
             raise PermissionDenied()
+
+    def get_archived_object(self):
+        """
+        Retrieve an object from the archive, or None if it isn't there
+        or the request isn't safe.
+
+        Archived objects are read-only.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        safe = self.request.method in SAFE_METHODS
+        if not safe or not is_archived(queryset.model):
+            return None
+
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = queryset.using(settings.DATABASE_ARCHIVE)
+        try:
+            obj = queryset.get(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+        except (queryset.model.DoesNotExist, TypeError, ValueError,
+                ValidationError):
+            return None
+        self.check_object_permissions(self.request, obj)
+        return obj
@@ -12,6 +12,12 @@ groups = {
         'change_appointment',
         'view_appointment',
 
+        # AppointmentException
+        'add_appointmentexception',
+        'change_appointmentexception',
+        'delete_appointmentexception',
+        'view_appointmentexception',
+
         # AppointmentRequest
         'delete_appointmentrequest',
         'view_appointmentrequest',
@@ -53,6 +59,9 @@ groups = {
         'delete_appointment',
         'view_appointment',
 
+        # AppointmentException
+        'view_appointmentexception',
+
         # AppointmentRequest
         'add_appointmentrequest',
         'delete_appointmentrequest',
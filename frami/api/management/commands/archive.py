@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ...archiving import archive
+
+
+class Command(BaseCommand):
+    help = 'Move closed records to the archive.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horizon', type=int, help='days')
+        parser.add_argument('--batch-size', type=int)
+
+    def handle(self, *_args, **options):
+        cutoff = None
+        if options['horizon'] is not None:
+            cutoff = timezone.now() - timedelta(days=options['horizon'])
+
+        try:
+            moved = archive(cutoff, options['batch_size'])
+        except ValueError as e:
+            raise CommandError(e)
+        counts = sorted(moved.items())
+        self.stdout.write(
+            ' '.join('{}={}'.format(*x) for x in counts) or 'archived nothing'
+        )
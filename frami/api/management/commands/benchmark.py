@@ -0,0 +1,281 @@
+import random
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections, transaction
+from django.utils import timezone
+
+from ....database import get_database
+from ...compiler import compile_serializer
+from ...models import Appointment, AppointmentRequest, Result
+from ...prefetch import get_related
+from ...scheduling import get_schedule
+from ...serializers import (
+    AppointmentRequestSerializer,
+    AppointmentSerializer,
+    ResultSerializer,
+)
+
+
+class Command(BaseCommand):
+    help = 'Measure the throughput of the API internals.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'benchmark',
+            choices=['database', 'schedule', 'serializers'],
+        )
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument(
+            '--profile',
+            action='append',
+            choices=['sqlite', 'sqlite-wal', 'postgresql'],
+        )
+
+    def handle(self, *_args, **options):
+        if options['benchmark'] == 'database':
+            self.database(
+                options['rows'],
+                options['repeat'],
+                options['threads'],
+                options['profile'] or ['sqlite', 'sqlite-wal'],
+            )
+            return
+
+        # Benchmark data is never committed.
+        with transaction.atomic():
+            getattr(self, options['benchmark'])(
+                options['rows'],
+                options['repeat'],
+            )
+            transaction.set_rollback(True)
+
+    def report(self, name, rows, elapsed):
+        self.stdout.write(
+            '{} rows={} rate={:.1f}/s'.format(name, rows, rows / elapsed)
+        )
+
+    def database(self, rows, repeat, threads, profiles):
+        """
+        Compare database profiles under concurrent mixed load.
+
+        Each thread acts as a series of requests that read a range of
+        rows or, one time in five, update a row.  Connections
+        are closed after every request, as Django does, so profiles
+        without persistent connections pay for reconnecting.  SQLite
+        profiles run on a scratch file; PostgreSQL runs on a scratch
+        table in the configured database.
+        """
+        default = settings.DATABASES['default']
+        for profile in profiles:
+            with tempfile.TemporaryDirectory() as directory:
+                path = '{}/db.sqlite3'.format(directory)
+                database = get_database({'PROFILE': profile}, path)
+                engine = database['ENGINE']
+                if profile == 'postgresql' and engine == default['ENGINE']:
+                    database = dict(default)
+                alias = 'benchmark-{}'.format(profile)
+                connections.databases[alias] = database
+                try:
+                    elapsed, errors = min(
+                        _load(alias, rows, threads) for _ in range(repeat)
+                    )
+                finally:
+                    _drop(alias)
+                    del connections.databases[alias]
+            self.report(
+                '{} threads={} errors={}'.format(profile, threads, errors),
+                rows,
+                elapsed,
+            )
+
+    def schedule(self, rows, repeat):
+        """
+        Measure free slot searches over a week in warm schedules.
+        """
+        prefix = 'benchmark-{}'.format(time.time())
+        staff = [
+            User.objects.create(username='{}-{}'.format(prefix, i))
+            for i in range(20)
+        ]
+        start = timezone.now().replace(minute=0, second=0, microsecond=0)
+        # Back-to-back appointments of 20 minutes every 30 minutes.
+        Appointment.objects.bulk_create(
+            Appointment(
+                patient=staff[0],
+                staff=staff[i % len(staff)],
+                creator=staff[0],
+                start_date=start + timedelta(minutes=i // len(staff) * 30),
+                end_date=start + timedelta(minutes=i // len(staff) * 30 + 20),
+            ) for i in range(rows)
+        )
+
+        end = start + timedelta(days=7)
+        duration = timedelta(minutes=10)
+        for user in staff:
+            get_schedule(user.pk)
+        elapsed = min(
+            _measure(
+                lambda: [
+                    list(get_schedule(x.pk).free(start, end, duration))
+                    for x in staff
+                ]
+            ) for _ in range(repeat)
+        )
+        self.report('free-slots', len(staff), elapsed)
+
+    def serializers(self, rows, repeat):
+        """
+        Compare the DRF serializers to their compiled counterparts.
+        """
+        user = User.objects.create(username='benchmark-{}'.format(time.time()))
+        now = timezone.now()
+        Appointment.objects.bulk_create(
+            Appointment(
+                patient=user,
+                staff=user,
+                creator=user,
+                start_date=now,
+                end_date=now,
+                note='note {}'.format(i),
+            ) for i in range(rows)
+        )
+        AppointmentRequest.objects.bulk_create(
+            AppointmentRequest(
+                creator=user,
+                start_date=now,
+                end_date=now,
+                subject='subject {}'.format(i),
+                message='message {}'.format(i),
+            ) for i in range(rows)
+        )
+        Result.objects.bulk_create(
+            Result(
+                patient=user,
+                creator=user,
+                kind='kind {}'.format(i),
+                result='result {}'.format(i),
+            ) for i in range(rows)
+        )
+
+        for serializer_class in [
+                AppointmentSerializer,
+                AppointmentRequestSerializer,
+                ResultSerializer,
+        ]:
+            serializer = serializer_class()
+            queryset = serializer_class.Meta.model.objects.filter(
+                creator=user,
+            )
+            select, prefetch = get_related(serializer)
+            represent = compile_serializer(serializer)
+
+            elapsed = min(
+                _measure(
+                    lambda: serializer_class(
+                        queryset.select_related(*select).prefetch_related(
+                            *prefetch
+                        ),
+                        many=True,
+                    ).data
+                ) for _ in range(repeat)
+            )
+            self.report(serializer_class.__name__, rows, elapsed)
+
+            elapsed = min(
+                _measure(
+                    lambda: [
+                        represent(row)
+                        for row in queryset.values_list(*represent.lookups)
+                    ]
+                ) for _ in range(repeat)
+            )
+            self.report(
+                '{} (compiled)'.format(serializer_class.__name__),
+                rows,
+                elapsed,
+            )
+
+
+def _load(alias, rows, threads):
+    """
+    Run `rows` requests against `alias` from `threads` threads.
+
+    :returns: A tuple with the elapsed time and the number of requests
+        that failed, e.g. on lock timeouts.
+    """
+    _drop(alias)
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            'CREATE TABLE frami_benchmark '
+            '(id INTEGER PRIMARY KEY, value INTEGER NOT NULL)'
+        )
+        cursor.execute(
+            'INSERT INTO frami_benchmark (id, value) VALUES {}'.format(
+                ', '.join('({}, 0)'.format(i) for i in range(1, 1001))
+            )
+        )
+    connections[alias].close()
+
+    errors = []
+
+    def work(count, seed):
+        rng = random.Random(seed)
+        connection = connections[alias]
+        failed = 0
+        for _ in range(count):
+            key = rng.randint(1, 1000)
+            try:
+                with transaction.atomic(using=alias):
+                    with connection.cursor() as cursor:
+                        if rng.random() < 0.2:
+                            cursor.execute(
+                                'UPDATE frami_benchmark SET value = value + 1 '
+                                'WHERE id = %s',
+                                [key],
+                            )
+                        else:
+                            cursor.execute(
+                                'SELECT SUM(value) FROM frami_benchmark '
+                                'WHERE id BETWEEN %s AND %s',
+                                [key, key + 100],
+                            )
+                            cursor.fetchall()
+            except DatabaseError:
+                failed += 1
+            # End of request.
+            connection.close_if_unusable_or_obsolete()
+        connection.close()
+        errors.append(failed)
+
+    workers = [
+        threading.Thread(
+            target=work,
+            args=(rows // threads + (i < rows % threads), i),
+        ) for i in range(threads)
+    ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start, sum(errors)
+
+
+def _drop(alias):
+    with connections[alias].cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS frami_benchmark')
+    connections[alias].close()
+
+
+def _measure(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
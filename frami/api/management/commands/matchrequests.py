@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from ...matching import match_pending
+
+
+class Command(BaseCommand):
+    help = 'Create appointments for pending appointment requests.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', required=True)
+        parser.add_argument('--end', required=True)
+        parser.add_argument('--duration', type=int, default=30)
+        parser.add_argument('--creator', required=True)
+
+    def handle(self, *_args, **options):
+        start = _parse_date(options['start'])
+        end = _parse_date(options['end'])
+        if start >= end:
+            raise CommandError('start must be before end')
+        if options['duration'] < 1:
+            raise CommandError('duration must be positive')
+        try:
+            creator = User.objects.get(username=options['creator'])
+        except User.DoesNotExist:
+            raise CommandError('Invalid creator')
+
+        appointments = match_pending(
+            start,
+            end,
+            timedelta(minutes=options['duration']),
+            creator,
+        )
+        self.stdout.write('created={}'.format(len(appointments)))
+
+
+def _parse_date(value):
+    try:
+        date = parse_datetime(value)
+    except ValueError:
+        date = None
+    if date is None:
+        raise CommandError('Invalid date: {}'.format(value))
+    return date
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...notifications import drain, get_lag
+
+
+class Command(BaseCommand):
+    help = 'Materialize notifications from the outbox.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=1.0)
+        parser.add_argument('--once', action='store_true')
+
+    def handle(self, *_args, **options):
+        while True:
+            start = time.monotonic()
+            count = drain(options['batch_size'])
+            elapsed = time.monotonic() - start
+            lag = get_lag()
+
+            if count:
+                self.stdout.write(
+                    'processed={} rate={:.1f}/s lag={:.3f}s'.format(
+                        count,
+                        count / elapsed if elapsed else count,
+                        lag.total_seconds() if lag else 0,
+                    )
+                )
+            if options['once'] and not lag:
+                break
+            if count < options['batch_size']:
+                time.sleep(options['interval'])
@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ...changes import prune_tombstones
+
+
+class Command(BaseCommand):
+    help = 'Delete tombstones that are older than the retention.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention', type=int, help='days')
+
+    def handle(self, *_args, **options):
+        cutoff = None
+        if options['retention'] is not None:
+            cutoff = timezone.now() - timedelta(days=options['retention'])
+
+        count = prune_tombstones(cutoff)
+        self.stdout.write('pruned {} tombstones'.format(count))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ....replicas import replicate
+
+
+class Command(BaseCommand):
+    help = 'Copy the SQLite primary to the replicas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=1.0)
+        parser.add_argument('--once', action='store_true')
+
+    def handle(self, *_args, **options):
+        while True:
+            start = time.monotonic()
+            try:
+                replicate()
+            except ValueError as e:
+                raise CommandError(e)
+            elapsed = time.monotonic() - start
+            self.stdout.write('replicated in {:.3f}s'.format(elapsed))
+
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,251 @@
+from collections import defaultdict
+from heapq import heappop, heappush
+from itertools import chain
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections, router, transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from . import caching, scheduling, signals
+from .models import Appointment, AppointmentRequest, Notification
+from .scheduling import Schedule, get_overlapping, lock_users
+
+
+def get_pending(start, end):
+    """
+    Retrieve requests without an appointment that accept dates between
+    `start` and `end`.
+    """
+    return AppointmentRequest.objects.filter(
+        appointment__isnull=True,
+        start_date__lt=end,
+        end_date__gt=start,
+    )
+
+
+def match(requests, schedules, busy, start, end, duration):
+    """
+    Assign requests to free slots of the staff schedules.
+
+    The free time of every schedule between `start` and `end` is split
+    into slots of `duration`, which are visited in chronological order.
+    Each slot goes to the released request with the earliest end date
+    that prefers the staff member of the slot, or no one, and whose
+    creator is free at the time.  Requests that can no longer fit
+    before their end date are dropped.  Earliest deadline first is
+    optimal for slots of equal length when there are no preferences.
+
+    :param requests: A list of AppointmentRequest instances.
+    :param schedules: A dict of staff primary keys to schedules.
+    :param busy: A dict of patient primary keys to schedules with their
+        appointments.  It is updated with the assignments.
+    :param start: Start of the range to schedule in.
+    :param end: End of the range to schedule in.
+    :param duration: Length of each appointment, as a timedelta.
+    :returns: A list of tuples with a request, a staff primary key and
+        a start date.
+    """
+    requests = sorted(requests, key=lambda x: (x.start_date, x.pk))
+    released, assignments, i = [], [], 0
+    for slot, staff_id in _get_slots(schedules, start, end, duration):
+        while i < len(requests) and requests[i].start_date <= slot:
+            request = requests[i]
+            heappush(released, (request.end_date, request.pk, request))
+            i += 1
+
+        request = _assign(released, busy, slot, staff_id, duration)
+        if request:
+            assignments.append((request, staff_id, slot))
+
+    return assignments
+
+
+def match_pending(start, end, duration, creator):
+    """
+    Create appointments for the pending requests between `start` and
+    `end`.
+
+    The affected staff and patients are locked before their schedules
+    are read, so concurrent bookings can't overlap the appointments.
+    The appointments, the links from the requests and the
+    notifications are written with batched inserts and updates.
+
+    :param start: Start of the range to schedule in.
+    :param end: End of the range to schedule in.
+    :param duration: Length of each appointment, as a timedelta.
+    :param creator: The user that creates the appointments.
+    :returns: A list of the created appointments.
+    """
+    with transaction.atomic():
+        staff_ids = set(
+            User.objects.filter(groups__name='admin').values_list(
+                'pk',
+                flat=True,
+            )
+        )
+        creator_ids = set(
+            get_pending(start, end).values_list('creator', flat=True)
+        )
+        lock_users(staff_ids | creator_ids)
+        # Requests of users that weren't locked are left for later.
+        requests = list(
+            get_pending(start, end).filter(creator__in=creator_ids)
+        )
+
+        schedules, busy = _get_schedules(staff_ids, start, end)
+        assignments = match(requests, schedules, busy, start, end, duration)
+        if not assignments:
+            return []
+
+        appointments = _create_appointments([
+            Appointment(
+                patient_id=request.creator_id,
+                staff_id=staff_id,
+                creator=creator,
+                start_date=slot,
+                end_date=slot + duration,
+                note=request.subject,
+            ) for request, staff_id, slot in assignments
+        ])
+
+        _link_requests(assignments, appointments)
+
+        # Bulk writes don't send signals.
+        signals.notify(
+            appointments,
+            Notification.CREATED,
+            signals.appointment.users,
+            signals.appointment.groups,
+        )
+        for appointment in appointments:
+            scheduling.update(appointment)
+        if settings.RESPONSE_CACHE_TIMEOUT:
+            for patient_id in {x.patient_id for x in appointments}:
+                caching.bump(Appointment, patient_id)
+
+    return appointments
+
+
+def _get_slots(schedules, start, end, duration):
+    """
+    Split the free time of `schedules` between `start` and `end` into
+    slots of `duration`.
+
+    :returns: A sorted list of tuples with a start date and a staff
+        primary key.
+    """
+    slots = []
+    for staff_id, schedule in schedules.items():
+        for gap_start, gap_end in schedule.free(start, end, duration):
+            slot = gap_start
+            while slot + duration <= gap_end:
+                slots.append((slot, staff_id))
+                slot += duration
+    slots.sort()
+    return slots
+
+
+def _assign(released, busy, slot, staff_id, duration):
+    """
+    Pop the request in `released` that takes the slot of `staff_id` at
+    `slot`, and add it to the schedule of its creator in `busy`.
+
+    Requests that can no longer fit are dropped, and requests that
+    can't take the slot are pushed back.
+
+    :returns: A request, or None if no request can take the slot.
+    """
+    skipped = []
+    assigned = None
+    while released:
+        item = heappop(released)
+        request = item[2]
+        if request.end_date < slot + duration:
+            continue
+        patient = busy.setdefault(request.creator_id, Schedule())
+        if (request.staff_id not in (None, staff_id)
+                or any(patient.overlapping(slot, slot + duration))):
+            skipped.append(item)
+            continue
+        # Negated to not collide with the appointments.
+        patient.add(slot, slot + duration, -request.pk)
+        assigned = request
+        break
+    for item in skipped:
+        heappush(released, item)
+    return assigned
+
+
+def _get_schedules(staff_ids, start, end):
+    """
+    Read the appointments between `start` and `end` into schedules.
+
+    :returns: A tuple with a dict of the schedules of `staff_ids` and a
+        defaultdict of the schedules of patients, by primary key.
+    """
+    schedules = {staff_id: Schedule() for staff_id in staff_ids}
+    busy = defaultdict(Schedule)
+    overlapping = chain.from_iterable(
+        queryset.prefetch_related('exceptions')
+        for queryset in get_overlapping(start, end)
+    )
+    for appointment in overlapping:
+        targets = [busy[appointment.patient_id]]
+        if appointment.staff_id in schedules:
+            targets.append(schedules[appointment.staff_id])
+        for schedule in targets:
+            if appointment.recurrence_interval:
+                schedule.add_rule(appointment)
+            else:
+                schedule.add(
+                    appointment.start_date,
+                    appointment.end_date,
+                    appointment.pk,
+                )
+    return schedules, busy
+
+
+def _link_requests(assignments, appointments):
+    """
+    Link the requests of `assignments` to their `appointments`.
+    """
+    now = timezone.now()
+    for (request, _, _), appointment in zip(assignments, appointments):
+        request.appointment = appointment
+        request.modification_date = now
+    AppointmentRequest.objects.bulk_update(
+        [request for request, _, _ in assignments],
+        ['appointment', 'modification_date'],
+    )
+
+
+def _create_appointments(appointments):
+    """
+    Insert `appointments` in their shards and set their primary keys.
+
+    Backends that can't return the primary keys of a bulk insert hold
+    the write lock, from `lock_users()` on the primary and from a no-op
+    update on other shards, so the rows after the previous maximum
+    primary key are the inserted rows, in order.
+    """
+    by_alias = defaultdict(list)
+    for appointment in appointments:
+        alias = router.db_for_write(Appointment, instance=appointment)
+        by_alias[alias].append(appointment)
+
+    for alias, objs in by_alias.items():
+        queryset = Appointment.objects.using(alias)
+        if connections[alias].features.can_return_ids_from_bulk_insert:
+            queryset.bulk_create(objs)
+            continue
+
+        with transaction.atomic(using=alias):
+            queryset.filter(pk=0).update(id=F('id'))
+            previous = queryset.aggregate(pk=Max('pk'))['pk'] or 0
+            queryset.bulk_create(objs)
+            pks = queryset.filter(pk__gt=previous).order_by('pk')
+            for obj, pk in zip(objs, pks.values_list('pk', flat=True)):
+                obj.pk = pk
+    return appointments
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.2 on 2026-10-18 06:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('api', '0009_groupnotification_notification_usernotification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uuid', models.UUIDField(editable=False)),
+                ('creation_date', models.DateTimeField(auto_now_add=True)),
+                ('event', models.CharField(choices=[('changed', 'changed'), ('created', 'created'), ('deleted', 'deleted')], max_length=255)),
+                ('users', models.TextField()),
+                ('groups', models.TextField()),
+                ('target_name', models.CharField(max_length=255)),
+                ('target_id', models.PositiveIntegerField()),
+                ('target_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.ContentType')),
+            ],
+        ),
+    ]
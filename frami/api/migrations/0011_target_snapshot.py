@@ -0,0 +1,25 @@
+# Generated by Django 2.2.2 on 2026-10-18 07:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_notificationoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='target_snapshot',
+            field=models.TextField(blank=True, default=''),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='target_snapshot',
+            field=models.TextField(blank=True, default=''),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 2.2.2 on 2026-10-18 07:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('auth', '0011_update_proxy_permissions'),
+        ('api', '0011_target_snapshot'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='groupnotification',
+            old_name='group',
+            new_name='flat_group',
+        ),
+        migrations.RenameField(
+            model_name='usernotification',
+            old_name='user',
+            new_name='flat_user',
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='group',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='auth.Group'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunSQL(
+            sql=[
+                'UPDATE api_notification SET group_id = ('
+                'SELECT flat_group_id FROM api_groupnotification '
+                'WHERE notification_ptr_id = api_notification.id)',
+                'UPDATE api_notification SET user_id = ('
+                'SELECT flat_user_id FROM api_usernotification '
+                'WHERE notification_ptr_id = api_notification.id)',
+            ],
+            reverse_sql=[
+                'INSERT INTO api_groupnotification '
+                '(notification_ptr_id, flat_group_id) '
+                'SELECT id, group_id FROM api_notification '
+                'WHERE group_id IS NOT NULL',
+                'INSERT INTO api_usernotification '
+                '(notification_ptr_id, flat_user_id) '
+                'SELECT id, user_id FROM api_notification '
+                'WHERE user_id IS NOT NULL',
+            ],
+        ),
+        migrations.DeleteModel(
+            name='GroupNotification',
+        ),
+        migrations.DeleteModel(
+            name='UserNotification',
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'read', 'creation_date'], name='api_notific_user_id_3dd905_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['group', 'read', 'creation_date'], name='api_notific_group_i_af16d8_idx'),
+        ),
+        migrations.CreateModel(
+            name='GroupNotification',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('api.notification',),
+        ),
+        migrations.CreateModel(
+            name='UserNotification',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('api.notification',),
+        ),
+    ]
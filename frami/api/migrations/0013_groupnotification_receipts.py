@@ -0,0 +1,88 @@
+# Generated by Django 2.2.2 on 2026-10-18 06:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def add_marks(apps, schema_editor):
+    """
+    Replace the shared read flag with a high-water mark per group member.
+
+    The mark is set below the first unread notification of the group,
+    and receipts are only added for read notifications above it.
+    """
+    Notification = apps.get_model('api', 'Notification')
+    Mark = apps.get_model('api', 'GroupNotificationMark')
+    Receipt = apps.get_model('api', 'GroupNotificationReceipt')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+
+    group_ids = Notification.objects.filter(
+        group__isnull=False,
+        read=True,
+    ).values_list('group', flat=True).distinct()
+    for group_id in group_ids:
+        notifications = Notification.objects.filter(group=group_id)
+        unread = notifications.filter(read=False).aggregate(
+            first=models.Min('pk'),
+        )['first']
+        if unread is None:
+            last_read = notifications.aggregate(last=models.Max('pk'))['last']
+        else:
+            last_read = unread - 1
+        read = list(notifications.filter(
+            read=True,
+            pk__gt=last_read,
+        ).values_list('pk', flat=True))
+
+        user_ids = User.objects.filter(
+            groups=group_id,
+        ).values_list('pk', flat=True)
+        for user_id in user_ids.iterator():
+            Mark.objects.create(
+                user_id=user_id,
+                group_id=group_id,
+                last_read=last_read,
+            )
+            Receipt.objects.bulk_create([
+                Receipt(user_id=user_id, notification_id=pk, read=True)
+                for pk in read
+            ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0012_flatten_notification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupNotificationReceipt',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('read', models.BooleanField()),
+                ('notification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.Notification')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'notification')},
+            },
+        ),
+        migrations.CreateModel(
+            name='GroupNotificationMark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modification_date', models.DateTimeField(auto_now=True)),
+                ('last_read', models.PositiveIntegerField(default=0)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='auth.Group')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'group')},
+            },
+        ),
+        migrations.RunPython(add_marks, migrations.RunPython.noop),
+    ]
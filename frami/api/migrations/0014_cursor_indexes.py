@@ -0,0 +1,53 @@
+# Generated by Django 2.2.2 on 2026-10-18 06:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_groupnotification_receipts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['creation_date', 'id'], name='api_appoint_creatio_252bd7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'creation_date', 'id'], name='api_appoint_patient_c9df68_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointmentrequest',
+            index=models.Index(fields=['creation_date', 'id'], name='api_appoint_creatio_8f0eeb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointmentrequest',
+            index=models.Index(fields=['creator', 'creation_date', 'id'], name='api_appoint_creator_260da1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'creation_date', 'id'], name='api_notific_user_id_9aaf87_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['group', 'creation_date', 'id'], name='api_notific_group_i_cc1547_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['creation_date', 'id'], name='api_questio_creatio_b10f79_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['creator', 'creation_date', 'id'], name='api_questio_creator_9fcf86_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='result',
+            index=models.Index(fields=['creation_date', 'id'], name='api_result_creatio_cf563d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='result',
+            index=models.Index(fields=['patient', 'creation_date', 'id'], name='api_result_patient_1c579d_idx'),
+        ),
+    ]
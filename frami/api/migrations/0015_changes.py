@@ -0,0 +1,59 @@
+# Generated by Django 2.2.2 on 2026-10-18 07:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_cursor_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creation_date', models.DateTimeField(auto_now_add=True)),
+                ('target_name', models.CharField(max_length=255)),
+                ('target_id', models.PositiveIntegerField()),
+                ('owner_id', models.PositiveIntegerField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['modification_date', 'id'], name='api_answer_modific_bc444f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['modification_date', 'id'], name='api_appoint_modific_965173_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointmentrequest',
+            index=models.Index(fields=['modification_date', 'id'], name='api_appoint_modific_b8edba_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['modification_date', 'id'], name='api_prescri_modific_8141e9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prescriptionrequest',
+            index=models.Index(fields=['modification_date', 'id'], name='api_prescri_modific_5c54d6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['modification_date', 'id'], name='api_questio_modific_1e2e99_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='result',
+            index=models.Index(fields=['modification_date', 'id'], name='api_result_modific_d8318f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['creation_date', 'id'], name='api_tombsto_creatio_9d4ef9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['owner_id', 'creation_date', 'id'], name='api_tombsto_owner_i_b5ce6f_idx'),
+        ),
+    ]
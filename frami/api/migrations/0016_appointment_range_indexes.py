@@ -0,0 +1,21 @@
+# Generated by Django 2.2.2 on 2026-10-18 07:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_changes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['staff', 'start_date', 'end_date'], name='api_appoint_staff_i_39b800_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'start_date', 'end_date'], name='api_appoint_patient_a7a151_idx'),
+        ),
+    ]
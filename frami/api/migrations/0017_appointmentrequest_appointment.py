@@ -0,0 +1,19 @@
+# Generated by Django 2.2.2 on 2026-10-18 07:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_appointment_range_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointmentrequest',
+            name='appointment',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='request', to='api.Appointment'),
+        ),
+    ]
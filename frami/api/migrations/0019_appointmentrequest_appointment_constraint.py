@@ -0,0 +1,19 @@
+# Generated by Django 2.2.2 on 2026-10-18 08:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_recurrence'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='appointmentrequest',
+            name='appointment',
+            field=models.OneToOneField(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='request', to='api.Appointment'),
+        ),
+    ]
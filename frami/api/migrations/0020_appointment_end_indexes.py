@@ -0,0 +1,37 @@
+# Generated by Django 2.2.2 on 2026-10-18 08:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_appointmentrequest_appointment_constraint'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='api_appoint_staff_i_39b800_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='api_appoint_patient_a7a151_idx',
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['staff', 'end_date', 'start_date'], name='api_appoint_staff_i_d8be10_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['staff', 'recurrence_end', 'start_date'], name='api_appoint_staff_i_2b085a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'end_date', 'start_date'], name='api_appoint_patient_616550_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'recurrence_end', 'start_date'], name='api_appoint_patient_a3bb55_idx'),
+        ),
+    ]
@@ -1,10 +1,194 @@
+from functools import wraps
+from hashlib import md5
+from itertools import islice
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max, prefetch_related_objects
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response, quote_etag
+from rest_framework.decorators import action
 from rest_framework.mixins import CreateModelMixin as _CreateModelMixin
 from rest_framework.mixins import DestroyModelMixin as _DestroyModelMixin
 from rest_framework.mixins import ListModelMixin as _ListModelMixin
 from rest_framework.mixins import RetrieveModelMixin as _RetrieveModelMixin
 from rest_framework.mixins import UpdateModelMixin as _UpdateModelMixin
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
+from . import caching, writes
+from ..replicas import get_replica
+from ..sharding import merge_ordered
+from .compiler import compile_serializer
+
+
+def get_flag(request, name):
+    """
+    Check if the query parameter `name` is set to a true value.
+    """
+    value = request.query_params.get(name, '')
+    return value.lower() in ('1', 'true')
+
+
+class CacheMixin:
+    cache_actions = ('list', 'retrieve')
+
+    def dispatch(self, request, *args, **kwargs):
+        """
+        Cache successful responses for `RESPONSE_CACHE_TIMEOUT` seconds.
+
+        Responses are cached per visibility scope: users in
+        `admin_groups` share responses that are invalidated by any
+        change to the model, while other users get responses that are
+        only invalidated by changes to objects that match their
+        `filter_value`.  Versions are bumped by signal receivers.
+
+        Responses read from a replica may predate the latest version, so
+        only responses read from the primary are cached.
+        """
+        action_name = self.action_map.get(request.method.lower())
+        cached = action_name in self.cache_actions
+        if settings.RESPONSE_CACHE_TIMEOUT and cached:
+            self.get = self.cache_response(self.get)
+        return super().dispatch(request, *args, **kwargs)
+
+    def cache_response(self, handler):
+        @wraps(handler)
+        def fun(request, *args, **kwargs):
+            owner_id = None
+            if not self.is_admin():
+                owner_id = attrgetter(self.filter_value)(request)
+                if not isinstance(owner_id, (int, str)):
+                    return handler(request, *args, **kwargs)
+
+            key = caching.get_key(
+                self.queryset.model,
+                request.get_full_path(),
+                owner_id,
+            )
+            cached = cache.get(key)
+            if cached is not None:
+                data, headers = cached
+                return Response(data, headers=headers)
+
+            response = handler(request, *args, **kwargs)
+            cacheable = get_replica() is None and response.status_code == 200
+            if cacheable and isinstance(response, Response):
+                data = response.data
+                # Drop the serializer reference of ReturnList/ReturnDict.
+                data = list(data) if isinstance(data, list) else dict(data)
+                headers = {
+                    name: value
+                    for name, value in response.items()
+                    if name != 'Content-Type'
+                }
+                cache.set(
+                    key,
+                    (data, headers),
+                    settings.RESPONSE_CACHE_TIMEOUT,
+                )
+            return response
+
+        return fun
+
+
+class ConditionalMixin:
+    conditional_actions = ('list', 'retrieve')
+    conditional_relations = ()
+
+    def dispatch(self, request, *args, **kwargs):
+        """
+        Support conditional requests with `ETag`.
+
+        The ETag is derived from the latest `modification_date` and the
+        number of objects in the queryset of the action, and of the
+        objects in `conditional_relations`.  If it matches the request,
+        304 is returned without serializing anything.
+
+        `Last-Modified` isn't sent, since a timestamp misses deletions,
+        updates within the same second and renamed users.  Conditional
+        requests are only supported with `CONDITIONAL_REQUESTS`, which
+        requires a shared `CACHE`, see `get_etag()`.
+        """
+        action_name = self.action_map.get(request.method.lower())
+        conditional = action_name in self.conditional_actions
+        if settings.CONDITIONAL_REQUESTS and conditional:
+            self.get = self.conditional_response(self.get)
+        return super().dispatch(request, *args, **kwargs)
+
+    def conditional_response(self, handler):
+        @wraps(handler)
+        def fun(request, *args, **kwargs):
+            etag = self.get_etag()
+            if etag is None:
+                return handler(request, *args, **kwargs)
+
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = handler(request, *args, **kwargs)
+                if response.status_code == 200:
+                    response['ETag'] = etag
+            return response
+
+        return fun
+
+    def get_etag(self):
+        """
+        Compute the `ETag` of a request.
+
+        Users are rendered by name, so the ETag also covers the global
+        response version, which is bumped when a user is renamed or
+        deleted.  The version is kept in the shared `CACHE`, so that
+        every process derives the same ETag and sees the bump.
+
+        :returns: A quoted ETag, or None if the request has nothing to
+            validate.
+        """
+        if self.action == 'list':
+            queryset = self.get_list_queryset()
+        else:
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            queryset = self.filter_queryset(self.get_queryset())
+            try:
+                queryset = queryset.filter(
+                    **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+                )
+            except (TypeError, ValueError, ValidationError):
+                return None
+
+        aggregates = {
+            'modified': Max('modification_date'),
+            'count': Count('pk', distinct=True),
+        }
+        for i, relation in enumerate(self.conditional_relations):
+            path = '{}__modification_date'.format(relation)
+            aggregates['modified{}'.format(i)] = Max(path)
+            aggregates['count{}'.format(i)] = Count(relation, distinct=True)
+        results = [
+            shard.order_by().aggregate(**aggregates)
+            for shard in self.get_shard_querysets(queryset)
+        ]
+        values = {}
+        for key in aggregates:
+            column = [r[key] for r in results]
+            if key.startswith('count'):
+                values[key] = sum(column)
+            else:
+                values[key] = max((x for x in column if x), default=None)
+        if self.action != 'list' and not values['count']:
+            return None
+
+        state = [
+            sorted((k, str(v)) for k, v in values.items()),
+            caching.get_version(caching.GLOBAL_KEY),
+            self.request.get_full_path(),
+            self.request.accepted_media_type,
+            self.request.user.pk,
+        ]
+        return quote_etag(md5(repr(state).encode()).hexdigest())
+
 
 class CreateModelMixin(_CreateModelMixin):
     def create(self, request, *args, **kwargs):
@@ -17,31 +201,196 @@ class CreateModelMixin(_CreateModelMixin):
             request.data[creator.field_name] = request.user
         return super().create(request, *args, **kwargs)
 
+    def perform_create(self, serializer):
+        """
+        Save the object through the write coordinator.
+        """
+        perform = super().perform_create
+
+        def create():
+            # Retried batches create the object again.
+            serializer.instance = None
+            perform(serializer)
+
+        writes.run(create, serializer.Meta.model)
+
 
 class DestroyModelMixin(_DestroyModelMixin):
-    pass
+    def perform_destroy(self, instance):
+        """
+        Delete the object through the write coordinator.
+        """
+        perform = super().perform_destroy
+        pk = instance.pk
+
+        def destroy():
+            # Retried batches delete the object again.
+            instance.pk = pk
+            perform(instance)
+
+        writes.run(destroy, type(instance))
 
 
 class ListModelMixin(_ListModelMixin):
+    stream_chunk_size = 500
+
     def list(self, request, *args, **kwargs):
         """
         List a queryset and optionally filter on `filter_field`.
+
+        The queryset is paginated by `pagination_class` if the request
+        asks for a page, and streamed if `?stream=true` is given.
+        Serializers that can be compiled are rendered straight from
+        `values_list()` rows.  Querysets that are split over shards are
+        merged on the cursor fields.
+        """
+        queryset = self.get_list_queryset()
+
+        represent = compile_serializer(self.get_serializer())
+        if represent:
+            fields = represent.lookups + [
+                name for name in self.get_cursor_fields()
+                if name not in represent.lookups
+            ]
+            queryset = queryset.prefetch_related(None)
+            queryset = queryset.values_list(*fields, named=True)
+
+        querysets = self.get_shard_querysets(queryset)
+        if get_flag(request, 'stream'):
+            return self.stream(querysets, represent)
+
+        if len(querysets) > 1:
+            page = self.paginate_querysets(querysets)
+        else:
+            page = self.paginate_queryset(queryset)
+        if page is not None:
+            data = self.get_data(page, represent)
+            return self.get_paginated_response(data)
+
+        if len(querysets) > 1:
+            queryset = self.merge(querysets)
+        return Response(self.get_data(queryset, represent))
+
+    def paginate_querysets(self, querysets):
+        """
+        Paginate the shards of a queryset as one.
+        """
+        if self.paginator is None:
+            return None
+        return self.paginator.paginate_querysets(
+            querysets,
+            self.request,
+            view=self,
+        )
+
+    def merge(self, querysets, chunk_size=None):
+        """
+        Merge the shards of a queryset on the cursor fields.
+        """
+        fields = self.get_cursor_fields() or ['id']
+        return merge_ordered([
+            queryset.order_by(*fields).iterator(chunk_size=chunk_size)
+            if chunk_size else queryset.order_by(*fields)
+            for queryset in querysets
+        ], fields)
+
+    def get_list_queryset(self):
+        """
+        Retrieve the queryset to list, optionally filtered on the value
+        of `filter_field` in the query parameters.
         """
         queryset = self.filter_queryset(self.get_queryset())
 
         filter_name = getattr(self, 'filter_field', None)
-        filter_value = request.query_params.get(filter_name)
+        filter_value = self.request.query_params.get(filter_name)
         if filter_value:
             queryset = queryset.filter(**{filter_name: filter_value})
+        return queryset
+
+    def get_data(self, rows, represent=None):
+        """
+        Serialize a list of instances, or of rows with `represent`.
+        """
+        if represent:
+            return [represent(row) for row in rows]
+        return self.get_serializer(rows, many=True).data
+
+    def stream(self, querysets, represent=None):
+        """
+        Stream the shards of a queryset as a JSON array.
+
+        Rows are fetched and serialized `stream_chunk_size` at a time, so
+        memory use does not depend on the size of the queryset.
+        """
+        size = self.stream_chunk_size
+        queryset = querysets[0]
+        lookups = queryset._prefetch_related_lookups  # pylint: disable=W0212
+        renderer = JSONRenderer()
+
+        def generate():
+            separator = ''
+            yield '['
+            if len(querysets) > 1:
+                rows = self.merge(querysets, chunk_size=size)
+            else:
+                rows = queryset.iterator(chunk_size=size)
+            for chunk in iter(lambda: list(islice(rows, size)), []):
+                # iterator() ignores prefetch_related().
+                prefetch_related_objects(chunk, *lookups)
+                for data in self.get_data(chunk, represent):
+                    yield separator + renderer.render(data).decode()
+                    separator = ','
+            yield ']'
+
+        return StreamingHttpResponse(
+            generate(),
+            content_type=renderer.media_type,
+        )
 
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+
+class ReadMixin:
+    read_field = 'read'
+
+    def filter_queryset(self, queryset):
+        """
+        Optionally filter on the read state with `?read=`.
+        """
+        queryset = super().filter_queryset(queryset)
+        if self.request.query_params.get('read'):
+            read = get_flag(self.request, 'read')
+            queryset = self.filter_read(queryset, read)
+        return queryset
+
+    def filter_read(self, queryset, read):
+        """
+        Filter `queryset` on its read state.
+        """
+        return queryset.filter(**{self.read_field: read})
+
+    @action(detail=False, url_path='unread-count')
+    def unread_count(self, request):  # pylint: disable=W0613
+        """
+        Count unread objects.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        count = self.filter_read(queryset, False).count()
+        return Response({'count': count})
 
 
 class RetrieveModelMixin(_RetrieveModelMixin):
     pass
 
 
+class SnapshotMixin:
+    def get_serializer_context(self):
+        """
+        Serve notification targets from snapshots with `?snapshot=true`.
+        """
+        context = super().get_serializer_context()
+        context['snapshot'] = get_flag(self.request, 'snapshot')
+        return context
+
+
 class UpdateModelMixin(_UpdateModelMixin):
     def update(self, request, *args, **kwargs):
         """
@@ -52,3 +401,10 @@ class UpdateModelMixin(_UpdateModelMixin):
         if creator and not creator.read_only:
             request.data[creator.field_name] = request.user
         return super().update(request, *args, **kwargs)
+
+    def perform_update(self, serializer):
+        """
+        Save the object through the write coordinator.
+        """
+        perform = super().perform_update
+        writes.run(lambda: perform(serializer), serializer.Meta.model)
@@ -4,6 +4,8 @@ from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
 
+from ..sharding import ShardedManager
+
 
 def get_deleted_user():
     return get_user_model().objects.get_or_create(username='deleted')[0]
@@ -15,6 +17,14 @@ class Appointment(models.Model):
     start_date = models.DateTimeField()
     end_date = models.DateTimeField()
     note = models.TextField(blank=True)
+    # Appointments with an interval are rules that repeat every
+    # `recurrence_interval` days, for as long as the occurrences end at
+    # or before `recurrence_end`.
+    recurrence_interval = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+    )
+    recurrence_end = models.DateTimeField(null=True, blank=True)
     patient = models.ForeignKey(
         User,
         related_name='+',
@@ -31,6 +41,41 @@ class Appointment(models.Model):
         on_delete=models.SET(get_deleted_user),
     )
 
+    objects = ShardedManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['creation_date', 'id']),
+            models.Index(fields=['modification_date', 'id']),
+            models.Index(fields=['patient', 'creation_date', 'id']),
+            models.Index(fields=['staff', 'end_date', 'start_date']),
+            models.Index(fields=['staff', 'recurrence_end', 'start_date']),
+            models.Index(fields=['patient', 'end_date', 'start_date']),
+            models.Index(fields=['patient', 'recurrence_end', 'start_date']),
+        ]
+
+
+class AppointmentException(models.Model):
+    """
+    An occurrence of a recurring appointment that is cancelled, or moved
+    to `start_date` and `end_date`.
+    """
+    creation_date = models.DateTimeField(auto_now_add=True)
+    modification_date = models.DateTimeField(auto_now=True)
+    appointment = models.ForeignKey(
+        Appointment,
+        related_name='exceptions',
+        on_delete=models.CASCADE,
+    )
+    date = models.DateTimeField(help_text='Start date of the occurrence')
+    start_date = models.DateTimeField(null=True, blank=True)
+    end_date = models.DateTimeField(null=True, blank=True)
+
+    objects = ShardedManager()
+
+    class Meta:
+        unique_together = [('appointment', 'date')]
+
 
 class AppointmentRequest(models.Model):
     creation_date = models.DateTimeField(auto_now_add=True)
@@ -51,6 +96,24 @@ class AppointmentRequest(models.Model):
         related_name='+',
         on_delete=models.CASCADE,
     )
+    # Appointments may be on a shard, where the primary can't check
+    # them, so requests are unlinked by a `post_delete` receiver on the
+    # primary.
+    appointment = models.OneToOneField(
+        Appointment,
+        related_name='request',
+        on_delete=models.DO_NOTHING,
+        null=True,
+        blank=True,
+        db_constraint=False,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['creation_date', 'id']),
+            models.Index(fields=['modification_date', 'id']),
+            models.Index(fields=['creator', 'creation_date', 'id']),
+        ]
 
 
 class Prescription(models.Model):
@@ -71,6 +134,13 @@ class Prescription(models.Model):
         on_delete=models.SET(get_deleted_user),
     )
 
+    objects = ShardedManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['modification_date', 'id']),
+        ]
+
 
 class PrescriptionRequest(models.Model):
     creation_date = models.DateTimeField(auto_now_add=True)
@@ -86,6 +156,13 @@ class PrescriptionRequest(models.Model):
         on_delete=models.CASCADE,
     )
 
+    objects = ShardedManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['modification_date', 'id']),
+        ]
+
 
 class Question(models.Model):
     subject = models.CharField(max_length=255)
@@ -98,6 +175,15 @@ class Question(models.Model):
         on_delete=models.CASCADE,
     )
 
+    objects = ShardedManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['creation_date', 'id']),
+            models.Index(fields=['modification_date', 'id']),
+            models.Index(fields=['creator', 'creation_date', 'id']),
+        ]
+
 
 class Answer(models.Model):
     message = models.TextField()
@@ -115,6 +201,13 @@ class Answer(models.Model):
         on_delete=models.SET(get_deleted_user),
     )
 
+    objects = ShardedManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['modification_date', 'id']),
+        ]
+
 
 class Result(models.Model):
     kind = models.CharField(max_length=255)
@@ -133,11 +226,21 @@ class Result(models.Model):
         on_delete=models.SET(get_deleted_user),
     )
 
+    objects = ShardedManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['creation_date', 'id']),
+            models.Index(fields=['modification_date', 'id']),
+            models.Index(fields=['patient', 'creation_date', 'id']),
+        ]
+
 
 class Notification(models.Model):
     CHANGED = 'changed'
     CREATED = 'created'
     DELETED = 'deleted'
+    EVENTS = [CHANGED, CREATED, DELETED]
 
     uuid = models.UUIDField(editable=False)
     read = models.BooleanField(default=False)
@@ -145,25 +248,268 @@ class Notification(models.Model):
     modification_date = models.DateTimeField(auto_now=True)
     event = models.CharField(
         max_length=255,
-        choices=[(x, x) for x in [CHANGED, CREATED, DELETED]],
+        choices=[(x, x) for x in EVENTS],
     )
     target_name = models.CharField(max_length=255)
     target_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     target_id = models.PositiveIntegerField()
+    target_snapshot = models.TextField(blank=True)
     target = GenericForeignKey('target_type', 'target_id')
-
-
-class UserNotification(Notification):
     user = models.ForeignKey(
         User,
         related_name='+',
         on_delete=models.CASCADE,
+        null=True,
+        blank=True,
     )
+    group = models.ForeignKey(
+        Group,
+        related_name='+',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'read', 'creation_date']),
+            models.Index(fields=['group', 'read', 'creation_date']),
+            models.Index(fields=['user', 'creation_date', 'id']),
+            models.Index(fields=['group', 'creation_date', 'id']),
+        ]
+
+
+class UserNotificationManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().filter(user__isnull=False)
+
+
+class UserNotification(Notification):
+    objects = UserNotificationManager()
+
+    class Meta:
+        proxy = True
+
+
+class GroupNotificationQuerySet(models.QuerySet):
+    def with_read(self, user, group_ids):
+        """
+        Annotate `user_read` with the read state for `user`, a member of
+        `group_ids`.
+
+        A notification is read if it has a receipt with `read` set, or
+        if it has no receipt and is at or below the high-water mark of
+        `user` for its group.
+        """
+        unread = self.unread(user, group_ids)
+        return self.annotate(
+            user_read=models.Case(
+                models.When(unread, then=models.Value(False)),
+                default=models.Value(True),
+                output_field=models.BooleanField(),
+            ),
+        )
+
+    def filter_read(self, user, group_ids, read):
+        """
+        Filter on the read state for `user`, a member of `group_ids`.
+        """
+        unread = self.unread(user, group_ids)
+        return self.exclude(unread) if read else self.filter(unread)
+
+    @staticmethod
+    def unread(user, group_ids):
+        """
+        Build a condition for notifications that `user`, a member of
+        `group_ids`, hasn't read.
+
+        The marks of `user` are read up front, so that the condition is
+        a range on the primary key per group, with the receipts of
+        `user` as uncorrelated subqueries.  Each term is served by an
+        index.  The groups are passed in from the access snapshot of the
+        request, rather than queried on every list.
+        """
+        marks = GroupNotificationMark.objects.filter(user=user)
+        last_read = dict(marks.values_list('group_id', 'last_read'))
+        receipts = GroupNotificationReceipt.objects.filter(user=user)
+        unread = models.Q(
+            pk__in=receipts.filter(read=False).values('notification_id'),
+        )
+        for group_id in group_ids:
+            unread |= models.Q(
+                group_id=group_id,
+                pk__gt=last_read.get(group_id, 0),
+            )
+        return unread & ~models.Q(
+            pk__in=receipts.filter(read=True).values('notification_id'),
+        )
+
+
+_GroupNotificationManager = models.Manager.from_queryset(
+    GroupNotificationQuerySet,
+)
+
+
+class GroupNotificationManager(_GroupNotificationManager):
+    def get_queryset(self):
+        return super().get_queryset().filter(group__isnull=False)
 
 
 class GroupNotification(Notification):
+    objects = GroupNotificationManager()
+
+    class Meta:
+        proxy = True
+
+    def set_read(self, user, read):
+        """
+        Set the read state of this notification for `user`.
+
+        Receipts are only stored where the state differs from the
+        high-water mark, and the mark is advanced past every
+        notification that has been read.
+        """
+        marks = GroupNotificationMark.objects.filter(
+            user=user,
+            group_id=self.group_id,
+        )
+        mark = marks.values_list('last_read', flat=True).first() or 0
+
+        if read == (self.pk <= mark):
+            GroupNotificationReceipt.objects.filter(
+                user=user,
+                notification=self,
+            ).delete()
+        else:
+            GroupNotificationReceipt.objects.update_or_create(
+                user=user,
+                notification=self,
+                defaults={'read': read},
+            )
+
+        if read:
+            notifications = GroupNotification.objects.filter(
+                group_id=self.group_id,
+            )
+            pks = notifications.values_list('pk', flat=True)
+            receipts = GroupNotificationReceipt.objects.filter(
+                user=user,
+                read=True,
+            )
+            unread = pks.filter(pk__gt=mark).exclude(
+                pk__in=receipts.values('notification'),
+            ).order_by('pk').first()
+
+            if unread is None:
+                # Unread receipts below the mark are kept.
+                unread = pks.order_by('-pk').first() + 1
+            if unread - 1 > mark:
+                GroupNotificationMark.advance(user, self.group_id, unread - 1)
+
+
+class GroupNotificationMark(models.Model):
+    """
+    Per-user high-water mark for the notifications of a group.
+    """
+    modification_date = models.DateTimeField(auto_now=True)
+    last_read = models.PositiveIntegerField(default=0)
+    user = models.ForeignKey(
+        User,
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
     group = models.ForeignKey(
         Group,
         related_name='+',
         on_delete=models.CASCADE,
     )
+
+    class Meta:
+        unique_together = [('user', 'group')]
+
+    @classmethod
+    def advance(cls, user, group_id, last_read):
+        """
+        Move the mark to `last_read` and drop receipts made redundant.
+        """
+        cls.objects.update_or_create(
+            user=user,
+            group_id=group_id,
+            defaults={'last_read': last_read},
+        )
+        GroupNotificationReceipt.objects.filter(
+            user=user,
+            read=True,
+            notification__group_id=group_id,
+            notification__pk__lte=last_read,
+        ).delete()
+
+    @classmethod
+    def mark_all_read(cls, user, group_ids):
+        """
+        Mark every notification in `group_ids` as read for `user`.
+        """
+        last = GroupNotification.objects.filter(
+            group__in=group_ids,
+        ).values('group').annotate(last=models.Max('pk'))
+
+        for row in last:
+            cls.objects.update_or_create(
+                user=user,
+                group_id=row['group'],
+                defaults={'last_read': row['last']},
+            )
+            GroupNotificationReceipt.objects.filter(
+                user=user,
+                notification__group_id=row['group'],
+            ).delete()
+
+
+class GroupNotificationReceipt(models.Model):
+    """
+    Per-user read state that differs from the high-water mark.
+    """
+    read = models.BooleanField()
+    user = models.ForeignKey(
+        User,
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+    notification = models.ForeignKey(
+        Notification,
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+
+    class Meta:
+        unique_together = [('user', 'notification')]
+
+
+class NotificationOutbox(models.Model):
+    uuid = models.UUIDField(editable=False)
+    creation_date = models.DateTimeField(auto_now_add=True)
+    event = models.CharField(
+        max_length=255,
+        choices=[(x, x) for x in Notification.EVENTS],
+    )
+    users = models.TextField()
+    groups = models.TextField()
+    target_name = models.CharField(max_length=255)
+    target_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    target_id = models.PositiveIntegerField()
+    target_snapshot = models.TextField(blank=True)
+
+
+class Tombstone(models.Model):
+    creation_date = models.DateTimeField(auto_now_add=True)
+    target_name = models.CharField(max_length=255)
+    target_id = models.PositiveIntegerField()
+    # Not a foreign key, since the owner may be deleted along with the
+    # target.
+    owner_id = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['creation_date', 'id']),
+            models.Index(fields=['owner_id', 'creation_date', 'id']),
+        ]
@@ -0,0 +1,127 @@
+import json
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    GroupNotification,
+    Notification,
+    NotificationOutbox,
+    UserNotification,
+)
+
+
+def create_notifications(uuid, user_ids, group_ids, **kwargs):
+    """
+    Create notifications for every recipient with a batched insert.
+    """
+    create_batch([
+        dict(uuid=uuid, user_ids=user_ids, group_ids=group_ids, **kwargs),
+    ])
+
+
+def create_batch(batch):
+    """
+    Create notifications for several events with a single batched insert.
+
+    :param batch: A list of dicts with the keyword arguments of
+        `create_notifications()`.
+    """
+    notifications = []
+    for kwargs in batch:
+        kwargs = dict(kwargs)
+        user_ids = kwargs.pop('user_ids')
+        group_ids = kwargs.pop('group_ids')
+        notifications += [
+            UserNotification(user_id=user_id, **kwargs) for user_id in user_ids
+        ]
+        notifications += [
+            GroupNotification(group_id=group_id, **kwargs)
+            for group_id in group_ids
+        ]
+    Notification.objects.bulk_create(notifications)
+
+
+def enqueue(uuid, user_ids, group_ids, target, **kwargs):
+    """
+    Write a single outbox row for an event.
+
+    The row is written in the same transaction as `target`, so it is
+    discarded if that transaction is rolled back.  The notifications
+    themselves are materialized by `drain()`.
+    """
+    enqueue_batch([
+        dict(
+            uuid=uuid,
+            user_ids=user_ids,
+            group_ids=group_ids,
+            target=target,
+            **kwargs
+        ),
+    ])
+
+
+def enqueue_batch(batch):
+    """
+    Write outbox rows for several events with a single batched insert.
+
+    :param batch: A list of dicts with the keyword arguments of
+        `enqueue()`.
+    """
+    rows = []
+    for kwargs in batch:
+        kwargs = dict(kwargs)
+        user_ids = kwargs.pop('user_ids')
+        group_ids = kwargs.pop('group_ids')
+        target = kwargs.pop('target')
+        if not user_ids and not group_ids:
+            continue
+        rows.append(
+            NotificationOutbox(
+                users=json.dumps(user_ids),
+                groups=json.dumps(group_ids),
+                target_type=ContentType.objects.get_for_model(target),
+                target_id=target.pk,
+                **kwargs
+            )
+        )
+    if rows:
+        NotificationOutbox.objects.bulk_create(rows)
+
+
+def drain(batch_size):
+    """
+    Materialize up to `batch_size` outbox rows as notifications with a
+    single batched insert.
+
+    :param batch_size: Maximum number of outbox rows to process.
+    :returns: Number of processed outbox rows.
+    """
+    with transaction.atomic():
+        queryset = NotificationOutbox.objects.order_by('pk')
+        rows = list(queryset.select_for_update(skip_locked=True)[:batch_size])
+        create_batch([
+            dict(
+                uuid=row.uuid,
+                user_ids=json.loads(row.users),
+                group_ids=json.loads(row.groups),
+                target_type_id=row.target_type_id,
+                target_id=row.target_id,
+                target_name=row.target_name,
+                target_snapshot=row.target_snapshot,
+                event=row.event,
+            ) for row in rows
+        ])
+        NotificationOutbox.objects.filter(pk__in=[r.pk for r in rows]).delete()
+    return len(rows)
+
+
+def get_lag():
+    """
+    Retrieve the age of the oldest pending outbox row.
+
+    :returns: A timedelta, or None if the outbox is empty.
+    """
+    row = NotificationOutbox.objects.order_by('pk').first()
+    return timezone.now() - row.creation_date if row else None
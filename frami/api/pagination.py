@@ -0,0 +1,138 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from ..sharding import merge_ordered
+
+
+class KeysetPagination(BasePagination):  # pylint: disable=W0223
+    """
+    Paginate on `cursor_fields` of the view with an opaque cursor.
+
+    Pages are selected with a range condition on the cursor fields
+    rather than an offset, so the cost of a page is independent of its
+    depth and rows inserted between requests are never skipped or
+    repeated.  The response body is a plain list; the URL of the next
+    page is sent in a `Link` header.
+
+    Pagination is opt-in: requests without `page_size` or `cursor` get
+    every row, as clients that don't follow the `Link` header expect.
+    """
+    cursor_fields = ('creation_date', 'id')
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def __init__(self):
+        self.request = None
+        self.next_cursor = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_querysets([queryset], request, view)
+
+    def paginate_querysets(self, querysets, request, view=None):
+        """
+        Paginate querysets with disjoint rows, such as the shards of a
+        queryset, as one.
+
+        Each queryset is read for a page and the pages are merged on the
+        cursor fields.
+
+        :returns: A page, or None if the request doesn't ask for one.
+        """
+        params = request.query_params
+        keys = (self.page_size_query_param, self.cursor_query_param)
+        if not any(key in params for key in keys):
+            return None
+
+        self.request = request
+        fields = getattr(view, 'cursor_fields', self.cursor_fields)
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request, querysets[0].model, fields)
+
+        pages = []
+        for queryset in querysets:
+            queryset = queryset.order_by(*fields)
+            if cursor:
+                queryset = queryset.filter(_after(fields, cursor))
+            pages.append(list(queryset[:page_size + 1]))
+
+        page = pages[0]
+        if len(pages) > 1:
+            page = list(islice(merge_ordered(pages, fields), page_size + 1))
+        if len(page) > page_size:
+            page = page[:page_size]
+            last = page[-1]
+            values = [getattr(last, name) for name in fields]
+            self.next_cursor = self.encode_cursor(values)
+        return page
+
+    def get_paginated_response(self, data):
+        response = Response(data)
+        url = self.get_next_link()
+        if url:
+            response['Link'] = '<{}>; rel="next"'.format(url)
+        return response
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url,
+            self.cursor_query_param,
+            self.next_cursor,
+        )
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request, model, fields):
+        """
+        Decode the cursor of `request` into a list of field values.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        opts = model._meta  # pylint: disable=W0212
+        try:
+            values = json.loads(urlsafe_b64decode(encoded.encode()).decode())
+            if len(values) != len(fields):
+                raise ValueError('invalid length')
+            return [
+                opts.get_field(name).to_python(value)
+                for name, value in zip(fields, values)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound('Invalid cursor')
+
+    @staticmethod
+    def encode_cursor(values):
+        # DjangoJSONEncoder truncates microseconds.
+        data = json.dumps(values, default=lambda x: x.isoformat())
+        return urlsafe_b64encode(data.encode()).decode()
+
+
+def _after(fields, values):
+    """
+    Build a condition for rows ordered after `values` on `fields`.
+    """
+    condition = Q()
+    for i, name in enumerate(fields):
+        equal = {f: v for f, v in zip(fields[:i], values[:i])}
+        condition |= Q(**equal, **{'{}__gt'.format(name): values[i]})
+    return condition
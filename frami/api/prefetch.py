@@ -0,0 +1,163 @@
+from collections import defaultdict
+
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework.relations import (
+    ManyRelatedField,
+    PrimaryKeyRelatedField,
+    RelatedField,
+    SlugRelatedField,
+)
+from rest_framework.serializers import ListSerializer, ModelSerializer
+
+from ..sharding import in_bulk, is_sharded
+
+
+def get_related(serializer):
+    """
+    Derive lookups for the related objects that `serializer` renders.
+
+    Forward and reverse one-to-one relations are joined with
+    `select_related()`.  Many-valued relations and nested list
+    serializers are fetched with `prefetch_related()`, recursively
+    optimized for the nested serializer.  Sharded objects of objects
+    that aren't sharded are fetched from every shard.
+
+    :param serializer: A ModelSerializer instance.
+    :returns: A tuple with a list of `select_related()` lookups and a
+        list of `prefetch_related()` lookups.
+    """
+    select, prefetch = [], []
+    model = serializer.Meta.model
+
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+
+        relation = _get_relation(model, field.source)
+        if not relation:
+            continue
+
+        if isinstance(field, ListSerializer):
+            child = field.child
+            if isinstance(child, ModelSerializer):
+                child_select, child_prefetch = get_related(child)
+                queryset = child.Meta.model.objects.select_related(
+                    *child_select
+                ).prefetch_related(*child_prefetch)
+                if is_sharded(child.Meta.model) and not is_sharded(model):
+                    queryset = queryset.all_shards()
+                prefetch.append(Prefetch(field.source, queryset=queryset))
+        elif isinstance(field, ManyRelatedField):
+            prefetch.append(field.source)
+        elif isinstance(field, RelatedField):
+            if relation.concrete and isinstance(
+                    field,
+                    PrimaryKeyRelatedField,
+            ):
+                # DRF reads the local foreign key value.
+                continue
+            select.append(field.source)
+
+    return select, prefetch
+
+
+def get_only(serializer):
+    """
+    Derive the columns that `serializer` reads from its model.
+
+    Local fields are loaded as-is, foreign keys rendered by a slug only
+    load the slug of the related object, and generic foreign keys load
+    their content type, object id and snapshot columns.  Reverse and
+    many-valued relations need no local columns beyond the primary key.
+
+    :param serializer: A ModelSerializer instance.
+    :returns: A list of `only()` lookups, or None if the serializer
+        renders something other than model fields.
+    """
+    opts = serializer.Meta.model._meta  # pylint: disable=W0212
+    only = [opts.pk.name]
+
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+
+        try:
+            model_field = opts.get_field(field.source)
+        except FieldDoesNotExist:
+            return None
+
+        if isinstance(model_field, GenericForeignKey):
+            only += [model_field.ct_field, model_field.fk_field]
+            snapshot = getattr(field, 'snapshot_field', None)
+            if snapshot:
+                only.append(snapshot)
+        elif model_field.is_relation and not model_field.concrete:
+            continue
+        else:
+            only.append(field.source)
+            if isinstance(field, SlugRelatedField):
+                only.append('{}__{}'.format(field.source, field.slug_field))
+
+    return only
+
+
+def _get_relation(model, source):
+    try:
+        field = model._meta.get_field(source)  # pylint: disable=W0212
+    except FieldDoesNotExist:
+        return None
+    if not field.is_relation or isinstance(field, GenericForeignKey):
+        return None
+    return field
+
+
+def prefetch_generic(instances, name, serializers):
+    """
+    Resolve a generic foreign key for many instances at once.
+
+    Targets are fetched with one query per content type and shard,
+    with the lookups derived from the matching serializer in
+    `serializers` applied.  The results are cached on each instance.
+
+    :param instances: A list of model instances.
+    :param name: Name of the GenericForeignKey.
+    :param serializers: A list of ModelSerializer classes.
+    """
+    if not instances:
+        return
+
+    field = type(instances[0])._meta.get_field(name)  # pylint: disable=W0212
+    ct_attname = '{}_id'.format(field.ct_field)
+
+    by_type = defaultdict(list)
+    for obj in instances:
+        by_type[getattr(obj, ct_attname)].append(obj)
+
+    for ct_id, objs in by_type.items():
+        model = ContentType.objects.get_for_id(ct_id).model_class()
+        queryset = _get_queryset(model, serializers)
+        targets = in_bulk(
+            queryset,
+            [getattr(o, field.fk_field) for o in objs],
+        )
+        for obj in objs:
+            target = targets.get(getattr(obj, field.fk_field))
+            if target:
+                field.set_cached_value(obj, target)
+
+
+def _get_queryset(model, serializers):
+    """
+    Build a queryset of `model` with the lookups of the first serializer
+    in `serializers` that renders it.
+    """
+    queryset = model._base_manager.all()  # pylint: disable=W0212
+    for serializer in serializers:
+        if issubclass(model, serializer.Meta.model):
+            select, prefetch = get_related(serializer())
+            queryset = queryset.select_related(*select)
+            return queryset.prefetch_related(*prefetch)
+    return queryset
@@ -0,0 +1,96 @@
+from datetime import timedelta
+
+from django.db.models import Q
+
+
+def in_range(start, end):
+    """
+    Build a condition for appointments with occurrences that may overlap
+    `start` to `end`.
+
+    Recurring appointments match if any part of their rule is in the
+    range, so their occurrences must be expanded with `expand()`.
+    """
+    ends = Q(end_date__gt=start) | Q(recurrence_end__gt=start)
+    return Q(start_date__lt=end) & ends
+
+
+def expand(appointment, start, end, exceptions=None):
+    """
+    Expand the occurrences of `appointment` that overlap `start` to
+    `end`.
+
+    Only the occurrences in the range are computed, so long rules are
+    as cheap to expand as short ones.
+    Intervals are added in UTC and don't follow daylight saving time.
+
+    :param appointment: An Appointment instance.
+    :param start: Start of the range.
+    :param end: End of the range.
+    :param exceptions: The exceptions of `appointment`, or None to
+        retrieve them.  Prefetch them when expanding many appointments.
+    :returns: A list of tuples with the start and end date of each
+        occurrence and the start date that it has in the rule, sorted
+        on start date.
+    """
+    first, last = appointment.start_date, appointment.end_date
+    if not appointment.recurrence_interval:
+        if first < end and last > start:
+            return [(first, last, first)]
+        return []
+
+    if exceptions is None:
+        exceptions = appointment.exceptions.all() if appointment.pk else []
+    exceptions = {x.date: x for x in exceptions}
+
+    duration = last - first
+    step = timedelta(days=appointment.recurrence_interval)
+    # The index of the first occurrence that ends after `start`.
+    i = max(0, (start - first - duration) // step + 1)
+    occurrences = []
+    date = first + i * step
+    while date < end and date + duration <= appointment.recurrence_end:
+        if date not in exceptions:
+            occurrences.append((date, date + duration, date))
+        date += step
+
+    for exception in exceptions.values():
+        if exception.start_date is None:
+            continue
+        if exception.start_date < end and exception.end_date > start:
+            occurrences.append(
+                (exception.start_date, exception.end_date, exception.date)
+            )
+
+    occurrences.sort()
+    return occurrences
+
+
+def is_occurrence(appointment, date):
+    """
+    Check if `date` is the start date of an occurrence in the rule of
+    `appointment`.
+    """
+    if not appointment.recurrence_interval or date < appointment.start_date:
+        return False
+    step = timedelta(days=appointment.recurrence_interval)
+    duration = appointment.end_date - appointment.start_date
+    aligned = (date - appointment.start_date) % step == timedelta()
+    return aligned and date + duration <= appointment.recurrence_end
+
+
+def intersects(a, b):
+    """
+    Check if any interval in `a` overlaps an interval in `b`.
+
+    Both lists must be sorted on start date.
+    """
+    i = j = 0
+    while i < len(a) and j < len(b):
+        if a[i][1] <= b[j][0]:
+            i += 1
+        elif b[j][1] <= a[i][0]:
+            j += 1
+        else:
+            return True
+    return False
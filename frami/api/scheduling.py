@@ -0,0 +1,279 @@
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime
+from heapq import merge
+from uuid import uuid4
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, Q
+
+from ..sharding import fan_out
+from .caching import get_version
+from .models import Appointment
+from .recurrence import expand, intersects
+
+# Process-level index of staff primary keys to schedules, guarded by
+# `_lock`.  Schedules are reloaded when their version in the cache
+# changes, so processes that share a cache see each other's changes.
+# Versions expire after `VERSION_TIMEOUT` seconds, which bounds how
+# long a process without a shared cache serves a schedule that another
+# process changed.
+_schedules = {}
+_lock = threading.Lock()
+
+VERSION_TIMEOUT = 300
+
+
+class Schedule:
+    """
+    Appointments of a staff member as intervals sorted on start date.
+
+    Recurring appointments are kept as rules that are expanded in the
+    ranges that are searched.  Schedules are patched from `on_commit()`
+    callbacks while requests search them, so every access holds a lock.
+
+    :ivar version: The cache version that the schedule was loaded at.
+    """
+
+    def __init__(self, intervals=(), version=None):
+        self.version = version
+        self._lock = threading.Lock()
+        self._intervals = []
+        self._by_pk = {}
+        self._rules = {}
+        self._longest = None
+        for start, end, pk in intervals:
+            self.add(start, end, pk)
+
+    def __contains__(self, pk):
+        with self._lock:
+            return pk in self._by_pk or pk in self._rules
+
+    def __len__(self):
+        with self._lock:
+            return len(self._intervals) + len(self._rules)
+
+    def add(self, start, end, pk):
+        """
+        Add or move the interval of appointment `pk`.
+        """
+        with self._lock:
+            self._remove(pk)
+            insort(self._intervals, (start, end, pk))
+            self._by_pk[pk] = (start, end)
+            if self._longest is None or end - start > self._longest:
+                self._longest = end - start
+
+    def add_rule(self, appointment):
+        """
+        Add or replace the recurring `appointment`, with its exceptions
+        prefetched.
+        """
+        with self._lock:
+            self._remove(appointment.pk)
+            self._rules[appointment.pk] = appointment
+
+    def remove(self, pk):
+        """
+        Remove the interval or rule of appointment `pk`, if any.
+        """
+        with self._lock:
+            self._remove(pk)
+
+    def _remove(self, pk):
+        self._rules.pop(pk, None)
+        if pk in self._by_pk:
+            start, end = self._by_pk.pop(pk)
+            del self._intervals[bisect_left(self._intervals, (start, end, pk))]
+
+    def overlapping(self, start, end):
+        """
+        Yield the intervals and occurrences that overlap `start` to `end`,
+        sorted on start date.
+        """
+        with self._lock:
+            intervals = list(self._overlapping(start, end))
+            rules = list(self._rules.items())
+        occurrences = []
+        for pk, rule in rules:
+            expanded = expand(rule, start, end)
+            occurrences += [(x[0], x[1], pk) for x in expanded]
+        occurrences.sort()
+        return merge(intervals, occurrences)
+
+    def _overlapping(self, start, end):
+        """
+        Yield the intervals that overlap `start` to `end`.
+
+        Intervals are sorted on their start, so only the intervals that
+        start less than the longest interval before `start` need to be
+        considered.
+        """
+        if not self._intervals:
+            return
+        i = bisect_left(self._intervals, (start - self._longest, ))
+        for interval in self._intervals[i:]:
+            if interval[0] >= end:
+                break
+            if interval[1] > start:
+                yield interval
+
+    def free(self, start, end, duration):
+        """
+        Yield the gaps between `start` and `end` of at least `duration`.
+
+        :param start: Start of the range to search.
+        :param end: End of the range to search.
+        :param duration: Minimum length of a gap, as a timedelta.
+        :returns: Tuples of start and end dates.
+        """
+        cursor = start
+        for busy_start, busy_end, _ in self.overlapping(start, end):
+            if busy_start - cursor >= duration:
+                yield cursor, busy_start
+            cursor = max(cursor, busy_end)
+        if end - cursor >= duration:
+            yield cursor, end
+
+
+def get_schedule(staff_id):
+    """
+    Retrieve the schedule of `staff_id`, loading it if necessary.
+    """
+    version = get_version(_get_version_key(staff_id), VERSION_TIMEOUT)
+    with _lock:
+        schedule = _schedules.get(staff_id)
+    if schedule is None or schedule.version != version:
+        schedule = Schedule(version=version)
+        for queryset in fan_out(Appointment.objects.filter(staff_id=staff_id)):
+            intervals = queryset.filter(recurrence_interval=None)
+            for interval in intervals.values_list(
+                    'start_date',
+                    'end_date',
+                    'pk',
+            ):
+                schedule.add(*interval)
+            rules = queryset.exclude(recurrence_interval=None)
+            for rule in rules.prefetch_related('exceptions'):
+                schedule.add_rule(rule)
+        with _lock:
+            _schedules[staff_id] = schedule
+    return schedule
+
+
+def update(appointment, deleted=False):
+    """
+    Apply a saved or deleted appointment to the loaded schedules.
+
+    The versions of the affected schedules are bumped at once, so they
+    are reloaded until the change is committed and patched into them.
+    Schedules are dropped for recurring appointments, whose exceptions
+    may have changed, and for appointments with dates that haven't
+    been converted from strings.
+    """
+    pk = appointment.pk
+    interval = (appointment.start_date, appointment.end_date, pk)
+    recurring = bool(appointment.recurrence_interval)
+    converted = all(isinstance(x, datetime) for x in interval[:2])
+    with _lock:
+        staff_ids = {k for k, v in _schedules.items() if pk in v}
+    staff_ids.add(appointment.staff_id)
+
+    versions = {}
+    for staff_id in staff_ids:
+        versions[staff_id] = uuid4().hex
+        cache.set(
+            _get_version_key(staff_id),
+            versions[staff_id],
+            VERSION_TIMEOUT,
+        )
+
+    def apply():
+        for staff_id, version in versions.items():
+            with _lock:
+                schedule = _schedules.get(staff_id)
+                if schedule is None:
+                    continue
+                if recurring or not converted:
+                    del _schedules[staff_id]
+                    continue
+            if deleted or staff_id != appointment.staff_id:
+                schedule.remove(pk)
+                schedule.version = version
+            else:
+                schedule.add(*interval)
+                schedule.version = version
+
+    transaction.on_commit(apply)
+
+
+def get_overlapping(start, end, staff_id=None, patient_id=None):
+    """
+    Retrieve appointments of `staff_id` or `patient_id` that overlap
+    `start` to `end`.
+
+    Recurring appointments are included as described in `in_range()`.
+    The condition is split into a term per owner and end date, so that
+    each term is a range scan on the appointments that end after
+    `start`, on the `(staff, end_date, start_date)`,
+    `(staff, recurrence_end, start_date)` and the matching `patient`
+    indexes.
+
+    :returns: A list with a queryset per shard.
+    """
+    owners = []
+    if staff_id is not None:
+        owners.append(Q(staff_id=staff_id))
+    if patient_id is not None:
+        owners.append(Q(patient_id=patient_id))
+    ends = [Q(end_date__gt=start), Q(recurrence_end__gt=start)]
+
+    condition = Q()
+    for owner in owners or [Q()]:
+        for ending in ends:
+            condition |= owner & ending
+    return fan_out(Appointment.objects.filter(condition, start_date__lt=end))
+
+
+def has_overlap(intervals, staff_id, patient_id, exclude=None):
+    """
+    Check if any of `intervals` overlap an appointment of `staff_id` or
+    `patient_id`.
+
+    :param intervals: A list of tuples with start and end dates, sorted
+        on start date.
+    :param exclude: Primary key of an appointment to ignore.
+    :returns: Whether an appointment overlaps.
+    """
+    if not intervals:
+        return False
+    start, end = intervals[0][0], max(x[1] for x in intervals)
+    for queryset in get_overlapping(start, end, staff_id, patient_id):
+        if exclude is not None:
+            queryset = queryset.exclude(pk=exclude)
+        for appointment in queryset.prefetch_related('exceptions'):
+            if intersects(intervals, expand(appointment, start, end)):
+                return True
+    return False
+
+
+def lock_users(user_ids):
+    """
+    Lock the rows of `user_ids` until the end of the transaction.
+
+    Bookings for the same users are thereby serialized, so an overlap
+    check and the following write can't interleave with another
+    booking.  SQLite has no row locks, but the no-op update takes the
+    database write lock before anything is read.
+    """
+    queryset = User.objects.filter(pk__in=sorted(user_ids)).order_by('pk')
+    if connection.features.has_select_for_update:
+        list(queryset.select_for_update().values_list('pk'))
+    else:
+        queryset.update(id=F('id'))
+
+
+def _get_version_key(staff_id):
+    return 'frami:schedule:{}'.format(staff_id)
@@ -1,16 +1,29 @@
+import json
+from collections import OrderedDict
+
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import Group, User
 from django.contrib.auth.password_validation import validate_password
+from django.db import transaction
+from django.db.models import Manager, prefetch_related_objects
+from rest_framework.renderers import JSONRenderer
 from rest_framework.serializers import (
+    BooleanField,
+    DateTimeField,
+    IntegerField,
+    ListSerializer,
     ModelSerializer,
     PrimaryKeyRelatedField,
     RelatedField,
+    Serializer,
     SlugRelatedField,
+    ValidationError,
 )
 
 from .models import (
     Answer,
     Appointment,
+    AppointmentException,
     AppointmentRequest,
     GroupNotification,
     Prescription,
@@ -19,6 +32,9 @@ from .models import (
     Result,
     UserNotification,
 )
+from .prefetch import get_related, prefetch_generic
+from .recurrence import expand, intersects, is_occurrence
+from .scheduling import has_overlap, lock_users
 
 
 class AppointmentSerializer(ModelSerializer):
@@ -39,6 +55,181 @@ class AppointmentSerializer(ModelSerializer):
         model = Appointment
         fields = '__all__'
 
+    def validate(self, attrs):
+        names = [
+            'start_date',
+            'end_date',
+            'recurrence_interval',
+            'recurrence_end',
+        ]
+        start_date, end_date, interval, end = [
+            attrs.get(name, getattr(self.instance, name, None))
+            for name in names
+        ]
+        if start_date >= end_date:
+            raise ValidationError('end_date must be after start_date')
+        if bool(interval) != bool(end):
+            raise ValidationError(
+                'recurrence_interval and recurrence_end must be set together'
+            )
+        if end and end < end_date:
+            raise ValidationError('recurrence_end must be after end_date')
+        return attrs
+
+    def create(self, validated_data):
+        with transaction.atomic():
+            self.check_overlap(validated_data)
+            return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            self.check_overlap(validated_data, instance)
+            return super().update(instance, validated_data)
+
+    @staticmethod
+    def check_overlap(attrs, instance=None):
+        """
+        Reject appointments with occurrences that overlap another
+        appointment of the same staff or patient.
+
+        The staff and patient are locked first, so concurrent bookings
+        for either of them are checked one at a time.
+        """
+        values = {
+            name: attrs.get(name, getattr(instance, name, None))
+            for name in [
+                'staff',
+                'patient',
+                'start_date',
+                'end_date',
+                'recurrence_interval',
+                'recurrence_end',
+            ]
+        }
+        lock_users([values['staff'].pk, values['patient'].pk])
+
+        appointment = Appointment(**values)
+        occurrences = expand(
+            appointment,
+            appointment.start_date,
+            appointment.recurrence_end or appointment.end_date,
+            instance.exceptions.all() if instance else [],
+        )
+        if has_overlap(
+                occurrences,
+                values['staff'].pk,
+                values['patient'].pk,
+                exclude=instance.pk if instance else None,
+        ):
+            raise ValidationError(
+                'The appointment overlaps another appointment'
+            )
+
+
+class AppointmentExceptionSerializer(ModelSerializer):
+    appointment = PrimaryKeyRelatedField(
+        queryset=Appointment.objects.exclude(recurrence_interval=None),
+    )
+
+    class Meta:
+        model = AppointmentException
+        fields = '__all__'
+
+    def validate(self, attrs):
+        values = {
+            name: attrs.get(name, getattr(self.instance, name, None))
+            for name in ['appointment', 'date', 'start_date', 'end_date']
+        }
+        if not is_occurrence(values['appointment'], values['date']):
+            raise ValidationError('date is not an occurrence')
+        if (values['start_date'] is None) != (values['end_date'] is None):
+            raise ValidationError(
+                'start_date and end_date must be set together'
+            )
+        dates = [
+            values['appointment'].start_date,
+            values['start_date'],
+            values['end_date'],
+            values['appointment'].recurrence_end,
+        ]
+        if values['start_date'] is not None and dates != sorted(dates):
+            raise ValidationError(
+                'start_date and end_date must be in order and within the '
+                'recurrence'
+            )
+        return attrs
+
+    def create(self, validated_data):
+        with transaction.atomic():
+            self.check_overlap(validated_data)
+            exception = super().create(validated_data)
+            exception.appointment.save(update_fields=['modification_date'])
+            return exception
+
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            self.check_overlap(validated_data, instance)
+            exception = super().update(instance, validated_data)
+            exception.appointment.save(update_fields=['modification_date'])
+            return exception
+
+    @staticmethod
+    def check_overlap(attrs, instance=None):
+        """
+        Reject moved occurrences that overlap another occurrence or
+        appointment of the same staff or patient.
+        """
+        values = {
+            name: attrs.get(name, getattr(instance, name, None))
+            for name in ['appointment', 'date', 'start_date', 'end_date']
+        }
+        if values['start_date'] is None:
+            return
+
+        appointment = values['appointment']
+        lock_users([appointment.staff_id, appointment.patient_id])
+        moved = [(values['start_date'], values['end_date'])]
+        siblings = [
+            x for x in expand(appointment, *moved[0]) if x[2] != values['date']
+        ]
+        if intersects(moved, siblings) or has_overlap(
+                moved,
+                appointment.staff_id,
+                appointment.patient_id,
+                exclude=appointment.pk,
+        ):
+            raise ValidationError(
+                'The appointment overlaps another appointment'
+            )
+
+
+class RangeQuerySerializer(Serializer):  # pylint: disable=W0223
+    start = DateTimeField()
+    end = DateTimeField()
+
+    @staticmethod
+    def validate(attrs):
+        if attrs['start'] >= attrs['end']:
+            raise ValidationError('start must be before end')
+        return attrs
+
+
+class FreeSlotQuerySerializer(RangeQuerySerializer):  # pylint: disable=W0223
+    staff = SlugRelatedField(
+        slug_field='username',
+        queryset=User.objects.filter(groups__name='admin'),
+    )
+    duration = IntegerField(min_value=1, help_text='Minutes')
+
+
+class FreeSlotSerializer(Serializer):  # pylint: disable=W0223
+    start = DateTimeField()
+    end = DateTimeField()
+
+
+class MatchQuerySerializer(RangeQuerySerializer):  # pylint: disable=W0223
+    duration = IntegerField(min_value=1, help_text='Minutes')
+
 
 class AppointmentRequestSerializer(ModelSerializer):
     creator = SlugRelatedField(
@@ -50,6 +241,7 @@ class AppointmentRequestSerializer(ModelSerializer):
         queryset=User.objects.filter(groups__name='admin'),
         required=False,
     )
+    appointment = PrimaryKeyRelatedField(read_only=True)
 
     class Meta:
         model = AppointmentRequest
@@ -146,7 +338,16 @@ class UserSerializer(ModelSerializer):
         return make_password(value)
 
 
+def get_snapshot(instance):
+    """
+    Serialize `instance` as a JSON-encoded notification target.
+    """
+    data = GenericFieldSerializer(read_only=True).to_representation(instance)
+    return JSONRenderer().render(data).decode()
+
+
 class GenericFieldSerializer(RelatedField):  # pylint: disable=W0223
+    snapshot_field = 'target_snapshot'
     serializers = [
         AppointmentSerializer,
         AppointmentRequestSerializer,
@@ -157,19 +358,64 @@ class GenericFieldSerializer(RelatedField):  # pylint: disable=W0223
         ResultSerializer,
     ]
 
+    def get_attribute(self, instance):
+        """
+        Retrieve the target, or its snapshot.
+
+        The snapshot is used if the `snapshot` context flag is set or
+        if the target no longer exists.
+        """
+        snapshot = getattr(instance, self.snapshot_field, '')
+        if snapshot and self.context.get('snapshot'):
+            return json.loads(snapshot, object_pairs_hook=OrderedDict)
+
+        value = super().get_attribute(instance)
+        if value is None and snapshot:
+            return json.loads(snapshot, object_pairs_hook=OrderedDict)
+        return value
+
     def to_representation(self, value):
+        if isinstance(value, dict):
+            return value
         for serializer in self.serializers:
             if isinstance(value, serializer.Meta.model):
                 return serializer(value).data
         raise Exception('Could not find model')
 
 
+class NotificationListSerializer(ListSerializer):  # pylint: disable=W0223
+    def to_representation(self, data):
+        """
+        Serialize notifications with related objects fetched in bulk.
+
+        Targets are resolved with one query per content type instead of
+        one query per notification.  Targets served from snapshots are
+        not fetched at all.
+        """
+        iterable = data.all() if isinstance(data, Manager) else data
+        instances = list(iterable)
+
+        select, prefetch = get_related(self.child)
+        prefetch_related_objects(instances, *select, *prefetch)
+        field = self.child.fields.get('target')
+        if field:
+            snapshot = self.context.get('snapshot')
+            prefetch_generic(
+                [x for x in instances if not (snapshot and x.target_snapshot)],
+                field.source,
+                field.serializers,
+            )
+
+        return super().to_representation(instances)
+
+
 class UserNotificationSerializer(ModelSerializer):
     target = GenericFieldSerializer(read_only=True)
     user = SlugRelatedField(slug_field='username', queryset=User.objects.all())
 
     class Meta:
         model = UserNotification
+        list_serializer_class = NotificationListSerializer
         fields = (
             'uuid',
             'target',
@@ -189,12 +435,22 @@ class UserNotificationSerializer(ModelSerializer):
         )
 
 
+class ReadField(BooleanField):
+    def get_attribute(self, instance):
+        """
+        Prefer the per-user read state annotated by `with_read()`.
+        """
+        return getattr(instance, 'user_read', instance.read)
+
+
 class GroupNotificationSerializer(ModelSerializer):
     target = GenericFieldSerializer(read_only=True)
     group = SlugRelatedField(slug_field='name', queryset=Group.objects.all())
+    read = ReadField(required=False)
 
     class Meta:
         model = GroupNotification
+        list_serializer_class = NotificationListSerializer
         fields = (
             'uuid',
             'target',
@@ -212,3 +468,13 @@ class GroupNotificationSerializer(ModelSerializer):
             'group',
             'event',
         )
+
+    def update(self, instance, validated_data):
+        """
+        Update the read state of the requesting user.
+        """
+        if 'read' in validated_data:
+            user = self.context['request'].user
+            instance.set_read(user, validated_data['read'])
+            instance.user_read = validated_data['read']
+        return instance
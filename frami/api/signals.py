@@ -1,22 +1,37 @@
 from operator import attrgetter
 from uuid import uuid4
 
-from django.contrib.auth.models import Group
-from django.db.models.signals import post_delete, post_save
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_save,
+)
 from django.dispatch import receiver
 
+from . import access, caching, scheduling
+from .changes import SOURCES
 from .models import (
     Answer,
     Appointment,
     AppointmentRequest,
-    GroupNotification,
     Notification,
     Prescription,
     PrescriptionRequest,
     Question,
     Result,
-    UserNotification,
+    Tombstone,
 )
+from .notifications import create_batch, enqueue_batch
+from .serializers import get_snapshot
+
+# Process-level cache of group names to primary keys.  It is cleared
+# whenever a group is saved or deleted.
+_group_ids = {}
 
 
 def notification(signal, sender, users=None, groups=None):
@@ -34,30 +49,245 @@ def notification(signal, sender, users=None, groups=None):
 
     @receiver(signal, sender=sender, dispatch_uid=dispatch_uid)
     def fun(instance, **kwargs):
-        uuid = uuid4()
-        for user in users or []:
-            user = attrgetter(user)(instance)
-            if user:
-                UserNotification.objects.create(
-                    uuid=uuid,
-                    user=user,
-                    target=instance,
-                    target_name=_get_sender_name(sender),
-                    event=_get_signal_name(signal, kwargs.get('created')),
-                )
-        for group in groups or []:
-            group = Group.objects.get(name=group)
-            GroupNotification.objects.create(
-                uuid=uuid,
-                group=group,
+        notify(
+            [instance],
+            _get_signal_name(signal, kwargs.get('created')),
+            users,
+            groups,
+        )
+
+    fun.users = users or []
+    fun.groups = groups or []
+    return fun
+
+
+def notify(instances, event, users=None, groups=None):
+    """
+    Deliver notifications about several instances in one batch.
+
+    :param instances: A list of model instances.
+    :param event: Name of the event.
+    :param users: A list of users on each instance to notify.
+    :param groups: A list of groups to notify.
+    """
+    group_ids = _get_group_ids(groups or [])
+    batch = []
+    for instance in instances:
+        user_ids = [_get_user_id(instance, user) for user in users or []]
+        batch.append(
+            dict(
+                uuid=uuid4(),
+                user_ids=[pk for pk in user_ids if pk],
+                group_ids=group_ids,
                 target=instance,
-                target_name=_get_sender_name(sender),
-                event=_get_signal_name(signal, kwargs.get('created')),
+                target_snapshot=(
+                    get_snapshot(instance)
+                    if settings.NOTIFICATION_SNAPSHOTS else ''
+                ),
+                target_name=_get_sender_name(type(instance)),
+                event=event,
             )
+        )
+    deliver = enqueue_batch if settings.NOTIFICATION_OUTBOX else create_batch
+    deliver(batch)
+
+
+def cached_response(sender, model, owner):
+    """
+    Register invalidation of cached responses.
+
+    Changes to `sender` bump the response versions of `model` and of
+    the owner of the changed object, both before and after the
+    transaction commits.  If an update moves an object to another
+    owner, the version of the previous owner is bumped as well.
+
+    :param sender: Model to act on.
+    :param model: Model of the responses that render `sender`.
+    :param owner: Path to the user on `sender` that owns the object.
+    :returns: Invalidation function.
+    """
+    dispatch_uid = 'cache_{}'.format(_get_sender_name(sender))
+
+    # The receiver is only referenced by the signal.
+    # pylint: disable=W0612
+    @receiver(
+        pre_save,
+        sender=sender,
+        dispatch_uid=dispatch_uid + '_move',
+        weak=False,
+    )
+    def move(instance, raw=False, **_kwargs):
+        if not settings.RESPONSE_CACHE_TIMEOUT or raw:
+            return
+        if instance._state.adding:  # pylint: disable=W0212
+            return
+        queryset = sender._base_manager.filter(  # pylint: disable=W0212
+            pk=instance.pk,
+        )
+        for owner_id in queryset.values_list(
+                owner.replace('.', '__'),
+                flat=True,
+        ):
+            caching.bump(model, owner_id)
+
+    @receiver(post_save, sender=sender, dispatch_uid=dispatch_uid + '_save')
+    @receiver(
+        post_delete,
+        sender=sender,
+        dispatch_uid=dispatch_uid + '_delete',
+    )
+    def fun(instance, **_kwargs):
+        if not settings.RESPONSE_CACHE_TIMEOUT:
+            return
+        owner_id = _get_owner_id(instance, owner)
+        caching.bump(model, owner_id)
+        transaction.on_commit(lambda: caching.bump(model, owner_id))
 
     return fun
 
 
+def tombstone(sender, owner):
+    """
+    Register tombstones for deleted objects.
+
+    A tombstone is also recorded for the previous owner when an update
+    moves an object to another owner, since the object disappears from
+    the changes visible to that owner.
+
+    :param sender: Model to act on.
+    :param owner: Path to the user on `sender` that owns the object.
+    :returns: Tombstone function.
+    """
+    dispatch_uid = 'tombstone_{}'.format(_get_sender_name(sender))
+
+    # The receiver is only referenced by the signal.
+    # pylint: disable=W0612
+    @receiver(
+        pre_save,
+        sender=sender,
+        dispatch_uid=dispatch_uid + '_move',
+        weak=False,
+    )
+    def move(instance, raw=False, **_kwargs):
+        if raw or instance._state.adding:  # pylint: disable=W0212
+            return
+        queryset = sender._base_manager.filter(  # pylint: disable=W0212
+            pk=instance.pk,
+        )
+        for owner_id in queryset.values_list(owner, flat=True):
+            if owner_id != _get_owner_id(instance, owner):
+                Tombstone.objects.create(
+                    target_name=_get_sender_name(sender),
+                    target_id=instance.pk,
+                    owner_id=owner_id,
+                )
+
+    @receiver(post_delete, sender=sender, dispatch_uid=dispatch_uid)
+    def fun(instance, **_kwargs):
+        Tombstone.objects.create(
+            target_name=_get_sender_name(sender),
+            target_id=instance.pk,
+            owner_id=_get_owner_id(instance, owner),
+        )
+
+    return fun
+
+
+def _get_owner_id(instance, owner):
+    try:
+        return _get_user_id(instance, owner.replace('__', '.'))
+    except ObjectDoesNotExist:
+        return None
+
+
+def _get_user_id(instance, user):
+    """
+    Resolve the primary key of `user` without fetching the user itself.
+    """
+    path, _, name = user.rpartition('.')
+    obj = attrgetter(path)(instance) if path else instance
+    if obj is None:
+        return None
+    field = obj._meta.get_field(name)  # pylint: disable=W0212
+    return getattr(obj, field.attname)
+
+
+def _get_group_ids(names):
+    missing = [name for name in names if name not in _group_ids]
+    if missing:
+        queryset = Group.objects.filter(name__in=missing)
+        _group_ids.update(queryset.values_list('name', 'pk'))
+    return [_group_ids[name] for name in names]
+
+
+@receiver(post_save, sender=Group, dispatch_uid='group_ids_save')
+@receiver(post_delete, sender=Group, dispatch_uid='group_ids_delete')
+def _clear_group_ids(**_kwargs):
+    _group_ids.clear()
+
+
+@receiver(post_delete, sender=User, dispatch_uid='access_user_delete')
+@receiver(post_save, sender=Group, dispatch_uid='access_group_save')
+@receiver(post_delete, sender=Group, dispatch_uid='access_group_delete')
+@receiver(
+    m2m_changed,
+    sender=User.groups.through,
+    dispatch_uid='access_user_groups',
+)
+@receiver(
+    m2m_changed,
+    sender=User.user_permissions.through,
+    dispatch_uid='access_user_permissions',
+)
+@receiver(
+    m2m_changed,
+    sender=Group.permissions.through,
+    dispatch_uid='access_group_permissions',
+)
+def _invalidate_access(**_kwargs):
+    access.invalidate()
+
+
+@receiver(post_save, sender=User, dispatch_uid='access_user_save')
+def _invalidate_user_access(update_fields=None, **_kwargs):
+    # Logins only update `last_login`.
+    if update_fields is None or {'is_active', 'is_superuser'} & update_fields:
+        access.invalidate()
+
+
+@receiver(post_delete, sender=User, dispatch_uid='cache_user_delete')
+def _invalidate_responses(**_kwargs):
+    # Rows that referred to the user are reassigned without signals.  The
+    # version is also part of ETags, so it is bumped without the cache.
+    caching.bump_all()
+
+
+@receiver(post_save, sender=User, dispatch_uid='cache_user_save')
+def _invalidate_user_responses(update_fields=None, **_kwargs):
+    # Responses render usernames.
+    if update_fields is None or 'username' in update_fields:
+        caching.bump_all()
+
+
+@receiver(post_save, sender=Appointment, dispatch_uid='schedule_save')
+def _update_schedule(instance, **_kwargs):
+    scheduling.update(instance)
+
+
+@receiver(post_delete, sender=Appointment, dispatch_uid='schedule_delete')
+def _remove_schedule(instance, **_kwargs):
+    scheduling.update(instance, deleted=True)
+
+
+@receiver(post_delete, sender=Appointment, dispatch_uid='request_unlink')
+def _unlink_requests(instance, **_kwargs):
+    # A shard can't write to the primary while the primary is written
+    # to by the receivers of the deletion.
+    AppointmentRequest.objects.filter(appointment_id=instance.pk).update(
+        appointment=None,
+    )
+
+
 def _get_sender_name(sender):
     return sender._meta.model_name  # pylint: disable=W0212
 
@@ -113,3 +343,41 @@ result = notification(
     sender=Result,
     users=['patient'],
 )
+
+answer_cache = cached_response(
+    sender=Answer,
+    model=Question,
+    owner='question.creator',
+)
+
+appointment_cache = cached_response(
+    sender=Appointment,
+    model=Appointment,
+    owner='patient',
+)
+
+prescription_cache = cached_response(
+    sender=Prescription,
+    model=Prescription,
+    owner='patient',
+)
+
+prescription_request_cache = cached_response(
+    sender=PrescriptionRequest,
+    model=Prescription,
+    owner='prescription.patient',
+)
+
+question_cache = cached_response(
+    sender=Question,
+    model=Question,
+    owner='creator',
+)
+
+result_cache = cached_response(
+    sender=Result,
+    model=Result,
+    owner='patient',
+)
+
+tombstones = [tombstone(sender=s.model, owner=s.owner) for s in SOURCES]
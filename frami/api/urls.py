@@ -1,7 +1,10 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
 
+from .views import ChangesView, NotificationStreamView, WriteQueueView
 from .viewsets import (
     AnswerViewSet,
+    AppointmentExceptionViewSet,
     AppointmentRequestViewSet,
     AppointmentViewSet,
     GroupNotificationViewSet,
@@ -16,6 +19,7 @@ from .viewsets import (
 router = DefaultRouter()
 router.register(r'answer', AnswerViewSet)
 router.register(r'appointment', AppointmentViewSet)
+router.register(r'appointment-exception', AppointmentExceptionViewSet)
 router.register(r'appointment-request', AppointmentRequestViewSet)
 router.register(r'group-notification', GroupNotificationViewSet)
 router.register(r'prescription', PrescriptionViewSet)
@@ -25,4 +29,8 @@ router.register(r'result', ResultViewSet)
 router.register(r'user', UserViewSet)
 router.register(r'user-notification', UserNotificationViewSet)
 
-urlpatterns = router.urls
+urlpatterns = router.urls + [
+    path('changes/', ChangesView.as_view()),
+    path('notification-stream/', NotificationStreamView.as_view()),
+    path('write-queue/', WriteQueueView.as_view()),
+]
@@ -0,0 +1,171 @@
+import time
+from operator import itemgetter
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import NotFound, PermissionDenied
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .access import get_access
+from .changes import CursorError, decode_cursor, get_changes
+from .models import GroupNotification, Notification, UserNotification
+from .pagination import KeysetPagination
+from .serializers import (
+    GroupNotificationSerializer,
+    UserNotificationSerializer,
+)
+from .writes import get_coordinator
+
+
+class ChangesView(APIView):
+    """
+    List objects that changed or were deleted since a cursor.
+
+    The response contains at most `page_size` changes, the cursor to
+    pass as `?since=` in the next request and whether more changes are
+    available.  Deleted objects are listed with `null` data.
+    """
+    permission_classes = (IsAuthenticated, )
+    admin_groups = ['admin']
+
+    def get(self, request):
+        groups = get_access(request.user).groups
+        since = request.query_params.get('since')
+        try:
+            if since:
+                since = decode_cursor(since.encode())
+            changes, cursor, more = get_changes(
+                request,
+                since=since,
+                limit=KeysetPagination().get_page_size(request),
+                admin=any(g in groups for g in self.admin_groups),
+            )
+        except CursorError as e:
+            raise NotFound(str(e))
+        if cursor:
+            cursor = KeysetPagination.encode_cursor(cursor)
+        return Response({'changes': changes, 'cursor': cursor, 'more': more})
+
+
+class NotificationStreamView(APIView):
+    """
+    Stream new user and group notifications as server-sent events.
+
+    The stream is closed after `NOTIFICATION_STREAM_TIMEOUT` seconds
+    and the client is expected to reconnect with `Last-Event-ID`.  At
+    most `NOTIFICATION_STREAM_BATCH` events are sent per poll, so a
+    client that reconnects far behind catches up over several polls
+    and connections.
+
+    Each open stream holds a worker for its whole lifetime, so the API
+    has to be served by a threaded or asynchronous server, such as
+    gunicorn with `gthread` or `gevent` workers, with enough workers
+    for the connected clients.
+    """
+    permission_classes = (IsAuthenticated, )
+
+    def get(self, request):
+        last_id = (
+            request.META.get('HTTP_LAST_EVENT_ID')
+            or request.query_params.get('last_event_id')
+        )
+        if last_id and last_id.isdigit():
+            last_id = int(last_id)
+        else:
+            last = Notification.objects.order_by('-pk').first()
+            last_id = last.pk if last else 0
+
+        response = StreamingHttpResponse(
+            self.stream(
+                request.user,
+                get_access(request.user).group_ids,
+                last_id,
+            ),
+            content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def stream(self, user, groups, last_id):
+        """
+        Yield events for notifications newer than `last_id` for `user`, a
+        member of `groups`.
+        """
+        renderer = JSONRenderer()
+        deadline = time.monotonic() + settings.NOTIFICATION_STREAM_TIMEOUT
+        yield 'retry: {}\n\n'.format(
+            int(settings.NOTIFICATION_STREAM_INTERVAL * 1000)
+        )
+
+        while True:
+            events = self.fetch(
+                user,
+                groups,
+                last_id,
+                settings.NOTIFICATION_STREAM_BATCH,
+            )
+            for event_id, name, data in events:
+                yield 'id: {}\nevent: {}\ndata: {}\n\n'.format(
+                    event_id,
+                    name,
+                    renderer.render(data).decode(),
+                )
+                last_id = event_id
+
+            if time.monotonic() >= deadline:
+                break
+            yield ': keep-alive\n\n'
+            time.sleep(settings.NOTIFICATION_STREAM_INTERVAL)
+
+    @staticmethod
+    def fetch(user, groups, last_id, limit):
+        """
+        Retrieve events for the first `limit` notifications newer than
+        `last_id`.
+        """
+        sources = [
+            (
+                'user-notification',
+                UserNotification.objects.filter(user=user),
+                UserNotificationSerializer,
+            ),
+            (
+                'group-notification',
+                GroupNotification.objects.with_read(user, groups).filter(
+                    group__in=groups,
+                ),
+                GroupNotificationSerializer,
+            ),
+        ]
+        events = []
+        for name, queryset, serializer in sources:
+            queryset = queryset.filter(pk__gt=last_id).order_by('pk')
+            objs = list(queryset[:limit])
+            data = serializer(objs, many=True).data
+            events += [(o.pk, name, d) for o, d in zip(objs, data)]
+        return sorted(events, key=itemgetter(0))[:limit]
+
+
+class WriteQueueView(APIView):
+    """
+    Report the counters of the write coordinator of the process.
+
+    A growing `depth` or `wait` shows saturation before writes start to
+    fail.
+    """
+    permission_classes = (IsAuthenticated, )
+    admin_groups = ['admin']
+
+    def get(self, request):
+        groups = get_access(request.user).groups
+        if not any(g in groups for g in self.admin_groups):
+            raise PermissionDenied()
+
+        coordinator = get_coordinator()
+        if coordinator is None:
+            return Response({'enabled': False})
+        return Response(dict(coordinator.get_stats(), enabled=True))
@@ -1,32 +1,55 @@
+from datetime import timedelta
+
 from django.contrib.auth.models import User
+from django.db import transaction
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.fields import DateTimeField
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
 from .generics import BaseViewSet
+from .matching import match_pending
 from .mixins import (
+    CacheMixin,
+    ConditionalMixin,
     CreateModelMixin,
     DestroyModelMixin,
     ListModelMixin,
+    ReadMixin,
     RetrieveModelMixin,
+    SnapshotMixin,
     UpdateModelMixin,
 )
 from .models import (
     Answer,
     Appointment,
+    AppointmentException,
     AppointmentRequest,
     GroupNotification,
+    GroupNotificationMark,
     Prescription,
     PrescriptionRequest,
     Question,
     Result,
     UserNotification,
 )
+from .recurrence import expand, in_range
+from .scheduling import get_schedule
 from .serializers import (
     AnswerSerializer,
+    AppointmentExceptionSerializer,
     AppointmentRequestSerializer,
     AppointmentSerializer,
+    FreeSlotQuerySerializer,
+    FreeSlotSerializer,
     GroupNotificationSerializer,
+    MatchQuerySerializer,
     PrescriptionRequestSerializer,
     PrescriptionSerializer,
     QuestionSerializer,
+    RangeQuerySerializer,
     ResultSerializer,
     UserNotificationSerializer,
     UserSerializer,
@@ -34,6 +57,8 @@ from .serializers import (
 
 
 class AppointmentViewSet(
+        CacheMixin,
+        ConditionalMixin,
         CreateModelMixin,
         DestroyModelMixin,
         ListModelMixin,
@@ -45,8 +70,79 @@ class AppointmentViewSet(
     serializer_class = AppointmentSerializer
     filter_field = 'patient'
 
+    @action(detail=False, url_path='free-slots')
+    def free_slots(self, request):  # pylint: disable=R0201
+        """
+        Search for gaps of at least `duration` minutes between `start`
+        and `end` in the schedule of `staff`.
+        """
+        query = FreeSlotQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        schedule = get_schedule(params['staff'].pk)
+        slots = schedule.free(
+            params['start'],
+            params['end'],
+            timedelta(minutes=params['duration']),
+        )
+        data = [{'start': start, 'end': end} for start, end in slots]
+        return Response(FreeSlotSerializer(data, many=True).data)
+
+    @action(detail=False)
+    def occurrences(self, request):
+        """
+        Expand the appointments between `start` and `end` into their
+        occurrences, sorted on start date.
+
+        Each occurrence is rendered as its appointment with the dates of
+        the occurrence and the start date that it has in the rule as
+        `occurrence`.
+        """
+        query = RangeQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        start, end = query.validated_data['start'], query.validated_data['end']
+
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.filter(in_range(start, end))
+        appointments = list(queryset.prefetch_related('exceptions'))
+        serializer = self.get_serializer(appointments, many=True)
+
+        field = DateTimeField()
+        occurrences = []
+        for appointment, data in zip(appointments, serializer.data):
+            occurrences += [(x, data) for x in expand(appointment, start, end)]
+        occurrences.sort(key=lambda x: x[0])
+        return Response([
+            dict(
+                data,
+                start_date=field.to_representation(occurrence_start),
+                end_date=field.to_representation(occurrence_end),
+                occurrence=field.to_representation(date),
+            ) for (occurrence_start, occurrence_end, date), data in occurrences
+        ])
+
+
+class AppointmentExceptionViewSet(
+        CreateModelMixin,
+        DestroyModelMixin,
+        ListModelMixin,
+        RetrieveModelMixin,
+        UpdateModelMixin,
+        BaseViewSet,
+):
+    queryset = AppointmentException.objects.all()
+    serializer_class = AppointmentExceptionSerializer
+    filter_field = 'appointment__patient'
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            super().perform_destroy(instance)
+            instance.appointment.save(update_fields=['modification_date'])
+
 
 class AppointmentRequestViewSet(
+        ConditionalMixin,
         CreateModelMixin,
         DestroyModelMixin,
         ListModelMixin,
@@ -56,6 +152,36 @@ class AppointmentRequestViewSet(
     queryset = AppointmentRequest.objects.all()
     serializer_class = AppointmentRequestSerializer
 
+    @action(
+        detail=False,
+        methods=['post'],
+        permission_classes=(IsAuthenticated, ),
+    )
+    def match(self, request):
+        """
+        Create appointments of `duration` minutes for the pending
+        requests between `start` and `end`.
+        """
+        if not request.user.has_perm('api.add_appointment'):
+            raise PermissionDenied()
+
+        query = MatchQuerySerializer(data=request.data)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        appointments = match_pending(
+            params['start'],
+            params['end'],
+            timedelta(minutes=params['duration']),
+            request.user,
+        )
+        serializer = AppointmentSerializer(
+            appointments,
+            many=True,
+            context=self.get_serializer_context(),
+        )
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
 
 class UserViewSet(
         CreateModelMixin,
@@ -68,9 +194,12 @@ class UserViewSet(
     queryset = User.objects.all()
     serializer_class = UserSerializer
     filter_field = 'id'
+    cursor_fields = ('date_joined', 'id')
 
 
 class PrescriptionViewSet(
+        CacheMixin,
+        ConditionalMixin,
         CreateModelMixin,
         DestroyModelMixin,
         RetrieveModelMixin,
@@ -79,6 +208,7 @@ class PrescriptionViewSet(
 ):
     queryset = Prescription.objects.all()
     serializer_class = PrescriptionSerializer
+    conditional_relations = ('refill_request', )
     filter_field = 'patient'
 
 
@@ -97,6 +227,8 @@ class AnswerViewSet(CreateModelMixin, BaseViewSet):
 
 
 class QuestionViewSet(
+        CacheMixin,
+        ConditionalMixin,
         CreateModelMixin,
         ListModelMixin,
         RetrieveModelMixin,
@@ -104,9 +236,12 @@ class QuestionViewSet(
 ):
     queryset = Question.objects.all()
     serializer_class = QuestionSerializer
+    conditional_relations = ('answers', )
 
 
 class ResultViewSet(
+        CacheMixin,
+        ConditionalMixin,
         CreateModelMixin,
         DestroyModelMixin,
         ListModelMixin,
@@ -120,6 +255,9 @@ class ResultViewSet(
 
 
 class UserNotificationViewSet(
+        ConditionalMixin,
+        SnapshotMixin,
+        ReadMixin,
         ListModelMixin,
         UpdateModelMixin,
         BaseViewSet,
@@ -131,12 +269,46 @@ class UserNotificationViewSet(
 
 
 class GroupNotificationViewSet(
+        SnapshotMixin,
+        ReadMixin,
         ListModelMixin,
         UpdateModelMixin,
         BaseViewSet,
 ):
     queryset = GroupNotification.objects.all()
     serializer_class = GroupNotificationSerializer
-    filter_field = 'group__name__in'
-    filter_value = 'user.groups.all'
+    filter_field = 'group__in'
+    filter_value = 'access.group_ids'
     admin_groups = []
+
+    def get_queryset(self):
+        return super().get_queryset().with_read(
+            self.request.user,
+            self.request.access.group_ids,
+        )
+
+    def filter_read(self, queryset, read):
+        return queryset.filter_read(
+            self.request.user,
+            self.request.access.group_ids,
+            read,
+        )
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='read-all',
+        permission_classes=(IsAuthenticated, ),
+    )
+    def read_all(self, request):
+        """
+        Mark every notification in the groups of the user as read.
+        """
+        opts = self.queryset.model._meta  # pylint: disable=W0212
+        perm = '{}.change_{}'.format(opts.app_label, opts.model_name)
+        if not request.user.has_perm(perm):
+            raise PermissionDenied()
+
+        groups = request.access.group_ids
+        GroupNotificationMark.mark_all_read(request.user, groups)
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,256 @@
+import logging
+import queue
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import OperationalError, close_old_connections, transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from ..sharding import is_sharded
+
+logger = logging.getLogger(__name__)
+
+# Base and cap of the jittered exponential backoff, in seconds.
+BACKOFF = 0.01
+MAX_BACKOFF = 1.0
+
+_lock = threading.Lock()
+_coordinator = None
+
+
+class QueueFull(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many concurrent writes, try again later.'
+    default_code = 'write_queue_full'
+
+
+class WriteTimeout(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The write timed out, try again later.'
+    default_code = 'write_timeout'
+
+
+class _Write:
+    STARTED = 'started'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, function):
+        self.function = function
+        self.queued = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # Set to STARTED by the writer once the write is run, or to
+        # CANCELLED by the submitter once it stops waiting, whichever
+        # comes first.
+        self.lock = threading.Lock()
+        self.state = None
+
+    def start(self):
+        with self.lock:
+            self.state = self.state or self.STARTED
+            return self.state == self.STARTED
+
+    def cancel(self):
+        with self.lock:
+            self.state = self.state or self.CANCELLED
+            return self.state == self.CANCELLED
+
+
+class Coordinator:
+    """
+    Funnel write transactions through a bounded queue and a single
+    writer thread.
+
+    The writer takes up to `batch_size` queued writes and runs them in
+    one transaction, each in a savepoint so that a failing write is
+    rolled back alone.  A batch that fails on a locked database is
+    retried with jittered exponential backoff.  Writes that wait for
+    longer than `timeout` seconds are abandoned.
+
+    :ivar stats: Counters of the coordinator, see `get_stats()`.
+    """
+
+    def __init__(self, size, batch_size, retries, timeout=None):
+        self.batch_size = batch_size
+        self.retries = retries
+        self.timeout = timeout
+        self._queue = queue.Queue(size)
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'writes': 0,
+            'batches': 0,
+            'retries': 0,
+            'failures': 0,
+            'max_depth': 0,
+            'wait': 0.0,
+            'max_wait': 0.0,
+        }
+
+    def submit(self, function):
+        """
+        Run `function` in a write transaction and wait for its result.
+
+        :returns: The result of `function`.
+        :raises QueueFull: If the queue is full.
+        :raises WriteTimeout: If the write wasn't committed within the
+            timeout of the coordinator.  A write that wasn't started by
+            then is abandoned, one that was may still be committed.
+        :raises: Any exception raised by `function` or by the commit.
+        """
+        write = _Write(function)
+        try:
+            self._queue.put_nowait(write)
+        except queue.Full:
+            with self._stats_lock:
+                self.stats['failures'] += 1
+            raise QueueFull()
+
+        with self._stats_lock:
+            self.stats['max_depth'] = max(
+                self.stats['max_depth'],
+                self._queue.qsize(),
+            )
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name='frami-writer',
+                    daemon=True,
+                )
+                self._thread.start()
+
+        if not write.done.wait(self.timeout):
+            write.cancel()
+            with self._stats_lock:
+                self.stats['failures'] += 1
+            raise WriteTimeout()
+        if write.error is not None:
+            raise write.error  # pylint: disable=E0702
+        return write.result
+
+    def get_stats(self):
+        """
+        Retrieve the counters of the coordinator.
+
+        `wait` is the total time that writes waited in the queue, in
+        seconds, and `depth` the number of writes that are waiting.
+        """
+        with self._stats_lock:
+            return dict(self.stats, depth=self._queue.qsize())
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            now = time.monotonic()
+            with self._stats_lock:
+                self.stats['writes'] += len(batch)
+                self.stats['batches'] += 1
+                for write in batch:
+                    wait = now - write.queued
+                    self.stats['wait'] += wait
+                    self.stats['max_wait'] = max(self.stats['max_wait'], wait)
+
+            try:
+                self._commit(batch)
+            except Exception as e:  # pylint: disable=W0703
+                # The commit itself failed, e.g. on a deferred constraint
+                # or an `on_commit()` hook, so no write of the batch can
+                # be trusted to have been saved.
+                logger.exception('write batch failed')
+                self._fail(batch, e)
+            finally:
+                close_old_connections()
+                for write in batch:
+                    write.done.set()
+
+    def _commit(self, batch):
+        for attempt in range(self.retries + 1):
+            try:
+                with transaction.atomic():
+                    for write in batch:
+                        self._apply(write)
+                return
+            except OperationalError as e:
+                if attempt == self.retries:
+                    logger.warning('write batch failed: %s', e)
+                    self._fail(batch, e)
+                    return
+                with self._stats_lock:
+                    self.stats['retries'] += 1
+                time.sleep(
+                    random.uniform(0, min(MAX_BACKOFF, BACKOFF * 2**attempt))
+                )
+
+    @staticmethod
+    def _apply(write):
+        """
+        Run `write` in a savepoint of the batch, unless it was cancelled.
+
+        :raises OperationalError: To retry the batch.
+        """
+        write.result, write.error = None, None
+        if not write.start():
+            return
+        try:
+            with transaction.atomic():
+                write.result = write.function()
+        except OperationalError:
+            raise
+        except Exception as e:  # pylint: disable=W0703
+            write.error = e
+
+    def _fail(self, batch, error):
+        with self._stats_lock:
+            self.stats['failures'] += len(batch)
+        for write in batch:
+            write.result, write.error = None, error
+
+
+def get_coordinator():
+    """
+    Retrieve the coordinator of the process, or None if writes are not
+    coordinated.
+    """
+    global _coordinator  # pylint: disable=W0603
+    if not settings.WRITE_QUEUE_SIZE:
+        return None
+    with _lock:
+        if _coordinator is None:
+            _coordinator = Coordinator(
+                settings.WRITE_QUEUE_SIZE,
+                settings.WRITE_BATCH_SIZE,
+                settings.WRITE_RETRIES,
+                settings.WRITE_TIMEOUT or None,
+            )
+        return _coordinator
+
+
+def run(function, model=None):
+    """
+    Run the write `function` through the coordinator, if enabled.
+
+    Writes inside a transaction belong to it and run at once, as they
+    can't be moved to the connection of the writer thread.  Writes of
+    sharded models run at once as well, since the transactions of the
+    writer only cover the primary.
+
+    :param function: The write to run.
+    :param model: The model that `function` writes, if any.
+    :returns: The result of `function`.
+    """
+    coordinator = get_coordinator()
+    if coordinator is None or transaction.get_connection().in_atomic_block:
+        return function()
+    if model is not None and is_sharded(model):
+        return function()
+    return coordinator.submit(function)
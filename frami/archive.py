@@ -0,0 +1,48 @@
+from django.conf import settings
+
+from .database import attach_primary
+
+# Models that are moved to the archive once they are closed, see
+# `frami.api.archiving`.
+ARCHIVED = [
+    'api.answer',
+    'api.appointment',
+    'api.appointmentexception',
+    'api.appointmentrequest',
+    'api.question',
+    'api.result',
+]
+
+
+class ArchiveRouter:
+    """
+    Create only the tables of archived models in the archive.
+
+    Objects are read from and written to the archive explicitly, so
+    queries are left to the next router.
+    """
+
+    @staticmethod
+    def allow_migrate(db, app_label, model_name=None, **_hints):
+        if db != settings.DATABASE_ARCHIVE:
+            return None
+        return '{}.{}'.format(app_label, model_name) in ARCHIVED
+
+
+def is_archived(model):
+    """
+    Check if closed objects of `model` are moved to the archive.
+    """
+    label = model._meta.label_lower  # pylint: disable=W0212
+    return bool(settings.DATABASE_ARCHIVE) and label in ARCHIVED
+
+
+def attach(connection, **_kwargs):
+    """
+    Attach the primary to a new connection to the archive, so that
+    joins with users resolve there.
+
+    Connected to `connection_created`.
+    """
+    if connection.alias == settings.DATABASE_ARCHIVE:
+        attach_primary(connection)
@@ -0,0 +1,141 @@
+import re
+
+from django.db import connections
+
+# Database profiles that can be selected with `DATABASE.PROFILE` in
+# config.json.  `sqlite` is the historical default, with a rollback
+# journal and a new connection for every request.
+PROFILES = {
+    'sqlite': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'CONN_MAX_AGE': 0,
+        'PRAGMAS': {},
+    },
+    'sqlite-wal': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'CONN_MAX_AGE': 600,
+        # Applied in order; the busy timeout has to be in place before
+        # the journal mode, which takes a lock to change.
+        'PRAGMAS': {
+            'busy_timeout': 5000,
+            'journal_mode': 'wal',
+            'synchronous': 'normal',
+            'mmap_size': 256 * 1024 * 1024,
+            'cache_size': -64 * 1024,
+        },
+    },
+    'postgresql': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'CONN_MAX_AGE': 600,
+        'NAME': 'frami',
+    },
+}
+
+# Settings that may be overridden per profile.
+OVERRIDES = {
+    'sqlite': ['NAME', 'CONN_MAX_AGE', 'PRAGMAS'],
+    'sqlite-wal': ['NAME', 'CONN_MAX_AGE', 'PRAGMAS'],
+    'postgresql': [
+        'NAME',
+        'CONN_MAX_AGE',
+        'USER',
+        'PASSWORD',
+        'HOST',
+        'PORT',
+    ],
+}
+
+PRAGMAS = [
+    'busy_timeout',
+    'cache_size',
+    'journal_mode',
+    'mmap_size',
+    'synchronous',
+]
+
+# Schema name of the primary in connections that attach it.
+PRIMARY = 'frami_primary'
+
+
+def get_database(config, default_name):
+    """
+    Build the settings of a database from its entry in config.json.
+
+    :param config: A dict with a `PROFILE` and overrides of the settings
+        of the profile.
+    :param default_name: Path of the SQLite database, for profiles that
+        use SQLite.
+    :returns: A dict with the settings of the database.
+    :raises ValueError: If the configuration is invalid.
+    """
+    if not isinstance(config, dict):
+        raise ValueError('DATABASE must be an object')
+
+    profile = config.get('PROFILE', 'sqlite')
+    if profile not in PROFILES:
+        raise ValueError(
+            'DATABASE.PROFILE must be one of {}'.format(sorted(PROFILES))
+        )
+
+    unknown = set(config) - set(OVERRIDES[profile]) - {'PROFILE'}
+    if unknown:
+        raise ValueError(
+            'DATABASE has unknown keys for {}: {}'.format(
+                profile,
+                sorted(unknown),
+            )
+        )
+
+    if not isinstance(config.get('PRAGMAS', {}), dict):
+        raise ValueError('DATABASE.PRAGMAS must be an object')
+
+    database = dict(PROFILES[profile])
+    if 'PRAGMAS' in database:
+        database['NAME'] = default_name
+        database['PRAGMAS'] = dict(database['PRAGMAS'])
+        database['PRAGMAS'].update(config.get('PRAGMAS', {}))
+    ignored = ('PROFILE', 'PRAGMAS')
+    database.update((k, v) for k, v in config.items() if k not in ignored)
+
+    if not isinstance(database['CONN_MAX_AGE'], int):
+        raise ValueError('DATABASE.CONN_MAX_AGE must be an int')
+    for name, value in database.get('PRAGMAS', {}).items():
+        if name not in PRAGMAS:
+            raise ValueError(
+                'DATABASE.PRAGMAS has unknown pragma {}'.format(name)
+            )
+        # Pragmas can't be parameterized, so only plain values are
+        # accepted.
+        plain = isinstance(value, str) and re.fullmatch(r'\w+', value)
+        if not isinstance(value, int) and not plain:
+            raise ValueError('DATABASE.PRAGMAS.{} is invalid'.format(name))
+    return database
+
+
+def apply_pragmas(connection, **_kwargs):
+    """
+    Apply the `PRAGMAS` of the settings of a new SQLite connection.
+
+    Connected to `connection_created`.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = connection.settings_dict.get('PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
+
+
+def attach_primary(connection):
+    """
+    Attach the primary to a SQLite connection to another database.
+
+    Tables that the database doesn't have, such as users, then resolve
+    to the primary.  Foreign keys to those tables can't be enforced by
+    SQLite, so the checks are disabled.
+    """
+    primary = connections['default'].settings_dict['NAME']
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA foreign_keys = OFF')
+        sql = 'ATTACH DATABASE %s AS {}'.format(PRIMARY)
+        cursor.execute(sql, [str(primary)])
@@ -0,0 +1,98 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+# Alias of the replica that reads are routed to in the current thread,
+# or None for the primary.
+_state = threading.local()
+
+PIN_KEY = 'frami_replica_pin'
+
+
+class ReplicaRouter:
+    """
+    Route reads to a replica between `use_replica()` and
+    `use_primary()`, and everything else to the primary.
+    """
+
+    @staticmethod
+    def db_for_read(_model, **_hints):
+        return get_replica()
+
+    @staticmethod
+    def db_for_write(_model, **_hints):
+        return 'default'
+
+    @staticmethod
+    def allow_relation(_obj1, _obj2, **_hints):
+        return True
+
+    @staticmethod
+    def allow_migrate(db, _app_label, **_hints):
+        # Replicas get their schema from the primary.
+        return db not in settings.DATABASE_REPLICAS
+
+
+def use_replica():
+    """
+    Route the reads of the current thread to a random replica.
+    """
+    replicas = settings.DATABASE_REPLICAS
+    _state.alias = random.choice(replicas) if replicas else None
+
+
+def use_primary():
+    """
+    Route the reads of the current thread to the primary.
+    """
+    _state.alias = None
+
+
+def get_replica():
+    """
+    Retrieve the alias of the replica that the reads of the current
+    thread are routed to, or None for the primary.
+    """
+    return getattr(_state, 'alias', None)
+
+
+def pin(request):
+    """
+    Serve the session of `request` from the primary for
+    `REPLICA_PIN_SECONDS`, so that it reads its own writes before they
+    have been replicated.
+    """
+    if settings.DATABASE_REPLICAS:
+        request.session[PIN_KEY] = time.time() + settings.REPLICA_PIN_SECONDS
+
+
+def is_pinned(request):
+    """
+    Check if the session of `request` is pinned to the primary.
+    """
+    return request.session.get(PIN_KEY, 0) > time.time()
+
+
+def replicate(source='default', targets=None):
+    """
+    Copy the SQLite database `source` to the replicas in `targets`.
+
+    The copy uses the online backup API of SQLite, so it is consistent
+    while `source` is written to.  It stands in for real replication in
+    development and tests.
+
+    :param source: Alias of the primary.
+    :param targets: Aliases of the replicas, or None for every replica.
+    :raises ValueError: If a database isn't SQLite.
+    """
+    primary = connections[source]
+    for alias in settings.DATABASE_REPLICAS if targets is None else targets:
+        replica = connections[alias]
+        if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise ValueError('Only SQLite databases can be replicated')
+        primary.ensure_connection()
+        replica.ensure_connection()
+        primary.connection.backup(replica.connection)
@@ -2,6 +2,8 @@ import json
 import pathlib
 import sys
 
+from frami.database import get_database
+
 PROJECT = 'frami'
 LOCAL_DIR = pathlib.Path.home() / '.frami'
 INSTALLED_APPS = [
@@ -24,9 +26,16 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'frami.api.pagination.KeysetPagination',
+    'PAGE_SIZE': 100,
     'TEST_REQUEST_DEFAULT_FORMAT': 'json',
 }
 ROOT_URLCONF = 'frami.urls'
+DATABASE_ROUTERS = [
+    'frami.archive.ArchiveRouter',
+    'frami.sharding.ShardRouter',
+    'frami.replicas.ReplicaRouter',
+]
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -43,12 +52,6 @@ TEMPLATES = [
     },
 ]
 WSGI_APPLICATION = 'frami.wsgi.application'
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': str(LOCAL_DIR / 'db.sqlite3'),
-    }
-}
 VALIDATORS = [
     'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
     'django.contrib.auth.password_validation.MinimumLengthValidator',
@@ -62,8 +65,17 @@ USE_I18N = True
 USE_L10N = True
 USE_TZ = True
 STATIC_URL = '/static/'
+NOTIFICATION_STREAM_INTERVAL = 1.0
+NOTIFICATION_STREAM_TIMEOUT = 60.0
+NOTIFICATION_STREAM_BATCH = 100
+LOCAL_CACHE = 'django.core.cache.backends.locmem.LocMemCache'
+UNSHARED_CACHES = [
+    LOCAL_CACHE,
+    'django.core.cache.backends.dummy.DummyCache',
+]
 
-try:
+# Each setting is validated in turn, which pylint counts as branches.
+try:  # pylint: disable=R1260
     config = LOCAL_DIR / 'config.json'
     with config.open() as f:
         extra = json.load(f)
@@ -79,6 +91,131 @@ try:
     if not isinstance(SECRET_KEY, str) or not SECRET_KEY:
         raise ValueError('SECRET_KEY must be a >0-length string')
 
+    NOTIFICATION_OUTBOX = extra.get('NOTIFICATION_OUTBOX', False)
+    if not isinstance(NOTIFICATION_OUTBOX, bool):
+        raise ValueError('NOTIFICATION_OUTBOX must be a bool')
+
+    ACCESS_CACHE_TIMEOUT = extra.get('ACCESS_CACHE_TIMEOUT', 0)
+    if not isinstance(ACCESS_CACHE_TIMEOUT, int):
+        raise ValueError('ACCESS_CACHE_TIMEOUT must be an int')
+
+    RESPONSE_CACHE_TIMEOUT = extra.get('RESPONSE_CACHE_TIMEOUT', 0)
+    if not isinstance(RESPONSE_CACHE_TIMEOUT, int):
+        raise ValueError('RESPONSE_CACHE_TIMEOUT must be an int')
+
+    CONDITIONAL_REQUESTS = extra.get('CONDITIONAL_REQUESTS', False)
+    if not isinstance(CONDITIONAL_REQUESTS, bool):
+        raise ValueError('CONDITIONAL_REQUESTS must be a bool')
+
+    cache = extra.get('CACHE', {'BACKEND': LOCAL_CACHE})
+    backend = cache.get('BACKEND') if isinstance(cache, dict) else None
+    if not isinstance(backend, str):
+        raise ValueError('CACHE must be a dict with a BACKEND')
+    CACHES = {'default': cache}
+    # Cached responses, ETags and access snapshots are invalidated
+    # through versions in the cache, which every process has to see.
+    versioned = [
+        RESPONSE_CACHE_TIMEOUT,
+        ACCESS_CACHE_TIMEOUT,
+        CONDITIONAL_REQUESTS,
+    ]
+    if any(versioned) and backend in UNSHARED_CACHES:
+        raise ValueError(
+            'RESPONSE_CACHE_TIMEOUT, ACCESS_CACHE_TIMEOUT and '
+            'CONDITIONAL_REQUESTS require a CACHE that is shared between '
+            'processes'
+        )
+
+    NOTIFICATION_SNAPSHOTS = extra.get('NOTIFICATION_SNAPSHOTS', False)
+    if not isinstance(NOTIFICATION_SNAPSHOTS, bool):
+        raise ValueError('NOTIFICATION_SNAPSHOTS must be a bool')
+
+    default = get_database(
+        extra.get('DATABASE', {}),
+        str(LOCAL_DIR / 'db.sqlite3'),
+    )
+    DATABASES = {'default': default}
+
+    replicas = extra.get('DATABASE_REPLICAS', [])
+    if not isinstance(replicas, list):
+        raise ValueError('DATABASE_REPLICAS must be a list')
+    DATABASE_REPLICAS = []
+    for i, replica in enumerate(replicas):
+        alias = 'replica{}'.format(i)
+        DATABASES[alias] = get_database(
+            replica,
+            str(LOCAL_DIR / '{}.sqlite3'.format(alias)),
+        )
+        # Tests read their own writes from the primary.
+        DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+        DATABASE_REPLICAS.append(alias)
+
+    shards = extra.get('DATABASE_SHARDS', [])
+    if not isinstance(shards, list):
+        raise ValueError('DATABASE_SHARDS must be a list')
+    DATABASE_SHARDS = []
+    for i, shard in enumerate(shards, 1):
+        alias = 'shard{}'.format(i)
+        DATABASES[alias] = get_database(
+            shard,
+            str(LOCAL_DIR / '{}.sqlite3'.format(alias)),
+        )
+        # Shards attach the primary, which only SQLite can do.
+        databases = [DATABASES['default'], DATABASES[alias]]
+        if not all('PRAGMAS' in x for x in databases):
+            raise ValueError('DATABASE_SHARDS requires SQLite databases')
+        DATABASE_SHARDS.append(alias)
+
+    archive = extra.get('DATABASE_ARCHIVE')
+    DATABASE_ARCHIVE = None
+    if archive is not None:
+        DATABASES['archive'] = get_database(
+            archive,
+            str(LOCAL_DIR / 'archive.sqlite3'),
+        )
+        # The archive attaches the primary, which only SQLite can do.
+        databases = [DATABASES['default'], DATABASES['archive']]
+        if not all('PRAGMAS' in x for x in databases):
+            raise ValueError('DATABASE_ARCHIVE requires SQLite databases')
+        DATABASE_ARCHIVE = 'archive'
+
+    ARCHIVE_HORIZON_DAYS = extra.get('ARCHIVE_HORIZON_DAYS', 730)
+    if not isinstance(ARCHIVE_HORIZON_DAYS, int) or ARCHIVE_HORIZON_DAYS < 1:
+        raise ValueError('ARCHIVE_HORIZON_DAYS must be a positive int')
+
+    ARCHIVE_BATCH_SIZE = extra.get('ARCHIVE_BATCH_SIZE', 500)
+    if not isinstance(ARCHIVE_BATCH_SIZE, int) or ARCHIVE_BATCH_SIZE < 1:
+        raise ValueError('ARCHIVE_BATCH_SIZE must be a positive int')
+
+    retention = extra.get('TOMBSTONE_RETENTION_DAYS', 90)
+    if not isinstance(retention, int) or retention < 1:
+        raise ValueError('TOMBSTONE_RETENTION_DAYS must be a positive int')
+    TOMBSTONE_RETENTION_DAYS = retention
+
+    CHANGES_SETTLE_SECONDS = extra.get('CHANGES_SETTLE_SECONDS', 5)
+    if not isinstance(CHANGES_SETTLE_SECONDS, (int, float)):
+        raise ValueError('CHANGES_SETTLE_SECONDS must be a number')
+
+    REPLICA_PIN_SECONDS = extra.get('REPLICA_PIN_SECONDS', 5)
+    if not isinstance(REPLICA_PIN_SECONDS, int):
+        raise ValueError('REPLICA_PIN_SECONDS must be an int')
+
+    WRITE_QUEUE_SIZE = extra.get('WRITE_QUEUE_SIZE', 0)
+    if not isinstance(WRITE_QUEUE_SIZE, int):
+        raise ValueError('WRITE_QUEUE_SIZE must be an int')
+
+    WRITE_BATCH_SIZE = extra.get('WRITE_BATCH_SIZE', 20)
+    if not isinstance(WRITE_BATCH_SIZE, int) or WRITE_BATCH_SIZE < 1:
+        raise ValueError('WRITE_BATCH_SIZE must be a positive int')
+
+    WRITE_RETRIES = extra.get('WRITE_RETRIES', 5)
+    if not isinstance(WRITE_RETRIES, int):
+        raise ValueError('WRITE_RETRIES must be an int')
+
+    WRITE_TIMEOUT = extra.get('WRITE_TIMEOUT', 30)
+    if not isinstance(WRITE_TIMEOUT, (int, float)):
+        raise ValueError('WRITE_TIMEOUT must be a number')
+
     EMAIL_HOST = extra.get('EMAIL_HOST')
     EMAIL_HOST_USER = extra.get('EMAIL_HOST_USER')
     EMAIL_HOST_PASSWORD = extra.get('EMAIL_HOST_PASSWORD')
@@ -0,0 +1,344 @@
+import threading
+from heapq import merge
+from operator import attrgetter
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, models, transaction
+from django.db.models.deletion import Collector
+
+from .database import attach_primary
+
+# Patient-scoped models, with the field that holds the patient that
+# places a row.  Rows of the models in `PARENTS` follow their parent.
+PATIENTS = {
+    'api.appointment': 'patient_id',
+    'api.prescription': 'patient_id',
+    'api.question': 'creator_id',
+    'api.result': 'patient_id',
+}
+PARENTS = {
+    'api.answer': 'question_id',
+    'api.appointmentexception': 'appointment_id',
+    'api.prescriptionrequest': 'prescription_id',
+}
+
+# Shard `i` allocates primary keys from `i << SHARD_BITS`, so the shard
+# of an object follows from its primary key.
+SHARD_BITS = 40
+
+# Alias of the shard that sharded reads are routed to in the current
+# thread, or None for the primary.
+_state = threading.local()
+
+
+class ShardRouter:
+    """
+    Route patient-scoped models to the shard of their patient.
+
+    Objects are routed on their patient, or their parent, and queries
+    without an object to the shard selected with `use_shard()`.  Other
+    models are left to the next router.
+    """
+
+    @staticmethod
+    def db_for_read(model, **hints):
+        return _route(model, hints.get('instance'))
+
+    @staticmethod
+    def db_for_write(model, **hints):
+        return _route(model, hints.get('instance'))
+
+    @staticmethod
+    def allow_relation(_obj1, _obj2, **_hints):
+        return True
+
+    @staticmethod
+    def allow_migrate(db, app_label, model_name=None, **_hints):
+        if db not in settings.DATABASE_SHARDS:
+            return None
+        # Other tables are read from the primary, see `attach()`.
+        label = '{}.{}'.format(app_label, model_name)
+        return label in PATIENTS or label in PARENTS
+
+
+class ShardedQuerySet(models.QuerySet):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._all_shards = False
+
+    def all_shards(self):
+        """
+        Read the objects from every shard if the queryset isn't bound to
+        a database.
+
+        This is meant for prefetching the sharded objects of objects on
+        the primary, such as the prescriptions of users, which are
+        spread over the shards of their patients.
+        """
+        clone = self._chain()
+        clone._all_shards = True  # pylint: disable=W0212
+        return clone
+
+    def get(self, *args, **kwargs):
+        """
+        Retrieve an object, from the shard that allocated its primary key
+        if the queryset isn't bound to a database.
+        """
+        pk = kwargs.get('pk', kwargs.get('id'))
+        if self._db is None and pk is not None and is_sharded(self.model):
+            alias = shard_for_pk(pk)
+            if alias is not None:
+                return self.using(alias).get(*args, **kwargs)
+        return super().get(*args, **kwargs)
+
+    def create(self, **kwargs):
+        """
+        Create an object in the shard of its patient.
+        """
+        obj = self.model(**kwargs)
+        self._for_write = True
+        obj.save(force_insert=True, using=self._db)
+        return obj
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._all_shards = self._all_shards  # pylint: disable=W0212
+        return clone
+
+    def _fetch_all(self):
+        every = self._all_shards and is_sharded(self.model)
+        if every and self._db is None and self._result_cache is None:
+            self._result_cache = [
+                obj for alias in get_shards()
+                for obj in self._chain().using(alias)
+            ]
+        super()._fetch_all()
+
+
+ShardedManager = models.Manager.from_queryset(ShardedQuerySet)
+
+
+def get_shards():
+    """
+    Retrieve the aliases of the shards, starting with the primary.
+    """
+    return ['default'] + settings.DATABASE_SHARDS
+
+
+def is_sharded(model):
+    """
+    Check if the rows of `model` are spread over the shards.
+    """
+    label = model._meta.label_lower  # pylint: disable=W0212
+    sharded = label in PATIENTS or label in PARENTS
+    return bool(settings.DATABASE_SHARDS) and sharded
+
+
+def shard_for_user(user_id):
+    """
+    Retrieve the alias of the shard of the patient `user_id`.
+    """
+    shards = get_shards()
+    return shards[int(user_id) % len(shards)]
+
+
+def shard_for_pk(pk):
+    """
+    Retrieve the alias of the shard that allocated `pk`, or None if no
+    shard did.
+    """
+    shards = get_shards()
+    try:
+        index = int(pk) >> SHARD_BITS
+    except (TypeError, ValueError):
+        return None
+    return shards[index] if 0 <= index < len(shards) else None
+
+
+def get_shard(instance):
+    """
+    Retrieve the alias of the shard of `instance`, or None if it isn't
+    sharded or its patient isn't set.
+    """
+    if not is_sharded(type(instance)):
+        return None
+    if not instance._state.adding:  # pylint: disable=W0212
+        return instance._state.db  # pylint: disable=W0212
+
+    label = instance._meta.label_lower  # pylint: disable=W0212
+    if label in PATIENTS:
+        user_id = getattr(instance, PATIENTS[label])
+        return None if user_id is None else shard_for_user(user_id)
+    return shard_for_pk(getattr(instance, PARENTS[label]))
+
+
+def use_shard(alias):
+    """
+    Route sharded queries of the current thread to `alias`, or to the
+    primary if None.
+    """
+    _state.alias = alias
+
+
+def fan_out(queryset, user_id=None):
+    """
+    Split `queryset` into a queryset per shard.
+
+    :param user_id: A patient that owns every object in `queryset`, to
+        only query the shard of the patient.
+    :returns: A list of querysets.
+    """
+    if not is_sharded(queryset.model):
+        return [queryset]
+    if user_id is not None:
+        return [queryset.using(shard_for_user(user_id))]
+    return [queryset.using(alias) for alias in get_shards()]
+
+
+def merge_ordered(iterables, fields):
+    """
+    Merge iterables of objects or rows that are ordered on `fields`.
+    """
+    return merge(*iterables, key=attrgetter(*fields))
+
+
+def in_bulk(queryset, pks):
+    """
+    Like `QuerySet.in_bulk()`, with each object read from its shard.
+    """
+    if not is_sharded(queryset.model):
+        return queryset.in_bulk(pks)
+
+    by_shard = {}
+    for pk in pks:
+        by_shard.setdefault(shard_for_pk(pk), []).append(pk)
+    objects = {}
+    for alias, shard_pks in by_shard.items():
+        if alias is not None:
+            objects.update(queryset.using(alias).in_bulk(shard_pks))
+    return objects
+
+
+def attach(connection, **_kwargs):
+    """
+    Prepare a new connection to the primary or a shard.
+
+    Shards only hold the patient-scoped tables, and attach the primary
+    so that joins with users and other shared tables resolve there.
+    Foreign keys from a shard to the primary aren't enforced, see
+    `delete_user_rows()`.
+
+    Connected to `connection_created`.
+    """
+    if connection.alias in settings.DATABASE_SHARDS:
+        attach_primary(connection)
+
+
+def delete_user_rows(sender, instance, **_kwargs):
+    """
+    Apply the `on_delete` of foreign keys to a user that is deleted to
+    the rows on the shards.
+
+    Django only collects related objects from the database of the
+    deleted user, and the shards can't enforce their foreign keys to
+    the primary.
+
+    Connected to `pre_delete` of users.
+    """
+    # pylint: disable=W0212
+    fields = []
+    for model in apps.get_models():
+        if not is_sharded(model):
+            continue
+        fields += [
+            field for field in model._meta.concrete_fields
+            if field.many_to_one and issubclass(sender, field.related_model)
+        ]
+    for alias in settings.DATABASE_SHARDS:
+        collector = Collector(using=alias)
+        for field in fields:
+            related = field.model._base_manager.using(alias).filter(
+                **{field.name: instance}
+            )
+            if related.exists():
+                field.remote_field.on_delete(collector, field, related, alias)
+        with transaction.atomic(using=alias):
+            collector.delete()
+
+
+def reserve_ids(using, **_kwargs):
+    """
+    Start the primary keys of the tables of a shard at its range.
+
+    Connected to `post_migrate`.
+    """
+    if using not in settings.DATABASE_SHARDS:
+        return
+
+    start = get_shards().index(using) << SHARD_BITS
+    with connections[using].cursor() as cursor:
+        for label in sorted(PATIENTS.keys() | PARENTS.keys()):
+            opts = apps.get_model(label)._meta  # pylint: disable=W0212
+            table = opts.db_table
+            cursor.execute(
+                'SELECT seq FROM sqlite_sequence WHERE name = %s',
+                [table],
+            )
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute(
+                    'INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)',
+                    [table, start],
+                )
+            elif row[0] < start:
+                cursor.execute(
+                    'UPDATE sqlite_sequence SET seq = %s WHERE name = %s',
+                    [start, table],
+                )
+
+
+def check_rows(using, **_kwargs):
+    """
+    Refuse to migrate the primary or a shard while rows of patients are
+    in another database than the shard of their patient.
+
+    Rows are never moved between shards, so enabling sharding on a
+    primary with rows, or changing the number of shards, would hide the
+    rows of every patient that maps to another shard.
+
+    Connected to `post_migrate`.
+
+    :raises ValueError: If a database holds rows of another shard.
+    """
+    if not settings.DATABASE_SHARDS or using not in get_shards():
+        return
+
+    # pylint: disable=W0212
+    misplaced = []
+    for alias in get_shards():
+        tables = connections[alias].introspection.table_names()
+        for label, field in sorted(PATIENTS.items()):
+            model = apps.get_model(label)
+            if model._meta.db_table not in tables:
+                continue
+            queryset = model._base_manager.using(alias)
+            user_ids = queryset.values_list(field, flat=True).distinct()
+            if any(shard_for_user(pk) != alias for pk in user_ids.iterator()):
+                misplaced.append('{} in {}'.format(label, alias))
+    if misplaced:
+        raise ValueError(
+            'rows are not in the shard of their patient: {}'.format(
+                ', '.join(misplaced)
+            )
+        )
+
+
+def _route(model, instance):
+    if not is_sharded(model):
+        return None
+    alias = get_shard(instance) if instance is not None else None
+    if alias is None:
+        alias = getattr(_state, 'alias', None)
+    # Reads from the primary are left to the replica router.
+    return alias if alias != 'default' else None
@@ -0,0 +1,60 @@
+from django.contrib.auth.models import AnonymousUser, Group
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from pytest import mark
+from rest_framework import status
+
+from frami.api.access import VERSION_KEY, get_access
+
+
+def count(api, url):
+    with CaptureQueriesContext(connection) as ctx:
+        res = api.get(url)
+    assert res.status_code == status.HTTP_200_OK, res.data
+    return len(ctx), res
+
+
+def test_anonymous():
+    access = get_access(AnonymousUser())
+    assert not access.groups
+    assert not access.perms
+    assert not access.group_ids
+
+
+def test_snapshot(regular_user):
+    access = get_access(regular_user)
+    assert list(access.groups) == ['patient']
+    assert access.group_ids == [Group.objects.get(name='patient').pk]
+    assert 'api.view_result' in access.perms
+    assert regular_user.has_perm('api.view_result')
+
+
+@mark.usefixtures('admin_user')
+def test_cache(api, settings, regular_user):
+    settings.ACCESS_CACHE_TIMEOUT = 60
+    cache.clear()
+
+    assert api.login(username=regular_user.username, password='password')
+    cold, _ = count(api, '/api/group-notification/')
+    warm, _ = count(api, '/api/group-notification/')
+    assert warm < cold
+
+    version = cache.get(VERSION_KEY)
+    regular_user.save(update_fields=['last_login'])
+    assert cache.get(VERSION_KEY) == version
+
+    # Membership changes are picked up by the next request.
+    regular_user.groups.add(Group.objects.get(name='admin'))
+    assert cache.get(VERSION_KEY) != version
+    _, res = count(api, '/api/user/')
+    assert len(res.data) == 2
+
+    regular_user.groups.remove(Group.objects.get(name='admin'))
+    _, res = count(api, '/api/user/')
+    assert len(res.data) == 1
+
+    version = cache.get(VERSION_KEY)
+    regular_user.is_active = False
+    regular_user.save()
+    assert cache.get(VERSION_KEY) != version
@@ -1,4 +1,8 @@
 # pylint: disable=W0621
+from datetime import timedelta
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from pytest import fixture, mark
 from rest_framework import status
@@ -164,3 +168,79 @@ def test_update(api, admin_user, regular_user, extra_users, appointments):
     assert res.data['patient'] == appt.patient.username
     assert res.data['staff'] == admin_user.username
     assert res.data['creator'] == admin_user.username
+
+
+def test_overlap(api, admin_user, regular_user, extra_users, create_user):
+    other_staff = create_user('other-staff', 'admin')
+    start = timezone.now()
+    hour = timedelta(hours=1)
+
+    def book(staff, patient, begin, end, pk=None):
+        data = {
+            'start_date': begin.isoformat(),
+            'end_date': end.isoformat(),
+            'patient': patient.username,
+            'staff': staff.username,
+        }
+        if pk:
+            return api.patch(url_pk.format(pk=pk), data)
+        return api.post(url, data)
+
+    assert api.login(username=admin_user.username, password='password')
+    res = book(admin_user, regular_user, start, start + hour)
+    assert res.status_code == status.HTTP_201_CREATED, res.data
+    pk = res.data['id']
+
+    # Same staff or patient.
+    res = book(admin_user, extra_users[0], start + hour / 2, start + 2 * hour)
+    assert res.status_code == status.HTTP_400_BAD_REQUEST, res.data
+    res = book(other_staff, regular_user, start + hour / 2, start + 2 * hour)
+    assert res.status_code == status.HTTP_400_BAD_REQUEST, res.data
+
+    # Adjacent and unrelated appointments.
+    res = book(admin_user, regular_user, start + hour, start + 2 * hour)
+    assert res.status_code == status.HTTP_201_CREATED, res.data
+    other = res.data['id']
+    res = book(other_staff, extra_users[0], start, start + hour)
+    assert res.status_code == status.HTTP_201_CREATED, res.data
+
+    # Updates are checked against other appointments only.
+    res = book(admin_user, regular_user, start, start + hour / 2, pk)
+    assert res.status_code == status.HTTP_200_OK, res.data
+    res = book(admin_user, regular_user, start, start + 2 * hour, pk)
+    assert res.status_code == status.HTTP_400_BAD_REQUEST, res.data
+
+    # Empty and negative intervals.
+    for end in [start, start - hour]:
+        res = book(other_staff, extra_users[1], start, end)
+        assert res.status_code == status.HTTP_400_BAD_REQUEST, res.data
+    res = api.patch(url_pk.format(pk=other), {'note': 'x'})
+    assert res.status_code == status.HTTP_200_OK, res.data
+    assert Appointment.objects.count() == 3
+
+
+def test_overlap_lock(api, admin_user, regular_user):
+    start = timezone.now()
+    assert api.login(username=admin_user.username, password='password')
+    with CaptureQueriesContext(connection) as ctx:
+        res = api.post(
+            url, {
+                'start_date': start.isoformat(),
+                'end_date': (start + timedelta(hours=1)).isoformat(),
+                'patient': regular_user.username,
+                'staff': admin_user.username,
+            }
+        )
+    assert res.status_code == status.HTTP_201_CREATED, res.data
+
+    # The users are locked before the overlap check.
+    sql = [q['sql'] for q in ctx.captured_queries]
+    lock = next(
+        i for i, q in enumerate(sql) if q.startswith('UPDATE "auth_user"')
+    )
+    check = next(i for i, q in enumerate(sql) if '"end_date" >' in q)
+    insert = next(
+        i for i, q in enumerate(sql)
+        if q.startswith('INSERT INTO "api_appointment"')
+    )
+    assert lock < check < insert
@@ -0,0 +1,276 @@
+# pylint: disable=W0212,W0621
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connections
+from django.utils import timezone
+from pytest import fixture, mark
+from rest_framework import status
+
+from frami.api.archiving import archive
+from frami.api.models import (
+    Answer,
+    Appointment,
+    AppointmentException,
+    AppointmentRequest,
+    Notification,
+    Question,
+    Result,
+    Tombstone,
+)
+from frami.database import get_database
+from frami.sharding import shard_for_user
+
+url_result = '/api/result/'
+url_question = '/api/question/'
+old = timezone.now() - timedelta(days=1000)
+
+
+@fixture
+def archive_db(settings, tmpdir, committed_db):  # pylint: disable=W0613
+    # The archive attaches the primary, which only sees committed rows.
+    connections.databases['archive'] = get_database(
+        {},
+        str(tmpdir / 'archive.sqlite3'),
+    )
+    settings.DATABASE_ARCHIVE = 'archive'
+    call_command('migrate', database='archive', verbosity=0)
+    # Migrations enable the foreign key checks again.
+    connections['archive'].close()
+    yield 'archive'
+    connections['archive'].close()
+    del connections['archive']
+    del connections.databases['archive']
+
+
+def age(obj, **dates):
+    dates.setdefault('modification_date', old)
+    type(obj).objects.filter(pk=obj.pk).update(**dates)
+
+
+@fixture
+def records(archive_db, admin_user, regular_user):  # pylint: disable=W0613
+    results = [
+        Result.objects.create(
+            kind='kind {}'.format(i),
+            result='result',
+            patient=regular_user,
+            creator=admin_user,
+        ) for i in range(3)
+    ]
+    age(results[0], creation_date=old)
+    age(results[1])
+
+    question = Question.objects.create(
+        subject='answered',
+        message='message',
+        creator=regular_user,
+    )
+    answer = Answer.objects.create(
+        message='message',
+        question=question,
+        creator=admin_user,
+    )
+    unanswered = Question.objects.create(
+        subject='unanswered',
+        message='message',
+        creator=regular_user,
+    )
+    for obj in [question, answer, unanswered]:
+        age(obj)
+
+    appointment = Appointment.objects.create(
+        patient=regular_user,
+        staff=admin_user,
+        creator=admin_user,
+        start_date=old,
+        end_date=old + timedelta(hours=1),
+        recurrence_interval=7,
+        recurrence_end=old + timedelta(days=14, hours=1),
+    )
+    exception = AppointmentException.objects.create(
+        appointment=appointment,
+        date=old + timedelta(days=7),
+    )
+    request = AppointmentRequest.objects.create(
+        staff=admin_user,
+        creator=regular_user,
+        start_date=old,
+        end_date=old,
+        subject='subject',
+        message='message',
+        appointment=appointment,
+    )
+    unbooked = AppointmentRequest.objects.create(
+        staff=admin_user,
+        creator=regular_user,
+        start_date=old,
+        end_date=old,
+        subject='unbooked',
+        message='message',
+    )
+    age(unbooked)
+    pending = AppointmentRequest.objects.create(
+        staff=admin_user,
+        creator=regular_user,
+        start_date=old,
+        end_date=old,
+        subject='pending',
+        message='message',
+    )
+    return {
+        'results': results,
+        'question': question,
+        'answer': answer,
+        'unanswered': unanswered,
+        'appointment': appointment,
+        'exception': exception,
+        'request': request,
+        'unbooked': unbooked,
+        'pending': pending,
+    }
+
+
+def test_archive(records, regular_user):
+    notifications = list(Notification.objects.order_by('pk'))
+    moved = archive(batch_size=1)
+    assert moved == {
+        'answer': 1,
+        'appointment': 1,
+        'appointmentexception': 1,
+        'appointmentrequest': 2,
+        'question': 1,
+        'result': 2,
+    }
+    assert list(Result.objects.values_list('pk', flat=True)) == [
+        records['results'][2].pk,
+    ]
+    assert list(Question.objects.values_list('pk', flat=True)) == [
+        records['unanswered'].pk,
+    ]
+    assert list(AppointmentRequest.objects.values_list('pk', flat=True)) == [
+        records['pending'].pk,
+    ]
+    for model in [Answer, Appointment]:
+        assert not model.objects.exists()
+
+    # Archived objects are removed from the changes, and their
+    # notifications are kept.
+    tombstones = Tombstone.objects.values_list('target_name', 'owner_id')
+    names = [
+        'answer',
+        'appointment',
+        'appointmentrequest',
+        'appointmentrequest',
+        'question',
+        'result',
+        'result',
+    ]
+    expected = [(name, regular_user.pk) for name in names]
+    assert sorted(tombstones) == sorted(expected)
+    assert list(Notification.objects.order_by('pk')) == notifications
+
+    # Rows are archived as they were.
+    archived = Result.objects.using('archive').get(pk=records['results'][0].pk)
+    assert archived.creation_date == old
+    assert archived.modification_date == old
+    answer = Answer.objects.using('archive').get()
+    assert answer.question.subject == 'answered'
+    assert answer.creator.username == 'adm'
+    request = AppointmentRequest.objects.using('archive').get(
+        pk=records['request'].pk,
+    )
+    assert request.appointment_id == records['appointment'].pk
+
+    assert not archive()
+
+    # Copies from an interrupted run are replaced.
+    result = Result.objects.create(
+        kind='kind',
+        result='result',
+        patient=records['results'][2].patient,
+        creator=records['results'][2].creator,
+    )
+    age(result)
+    Result.objects.using('archive').create(
+        pk=result.pk,
+        kind='stale',
+        result='result',
+        patient=result.patient,
+        creator=result.creator,
+    )
+    assert archive() == {'result': 1}
+    assert Result.objects.using('archive').get(pk=result.pk).kind == 'kind'
+
+
+@mark.usefixtures('shards', 'archive_db')
+def test_shards(admin_user, regular_user, extra_users):
+    patient = [u for u in extra_users if shard_for_user(u.pk) != 'default'][0]
+    appointment = Appointment.objects.create(
+        patient=patient,
+        staff=admin_user,
+        creator=admin_user,
+        start_date=old,
+        end_date=old + timedelta(hours=1),
+    )
+    request = AppointmentRequest.objects.create(
+        staff=admin_user,
+        creator=regular_user,
+        start_date=old,
+        end_date=old,
+        subject='subject',
+        message='message',
+        appointment=appointment,
+    )
+    assert appointment._state.db != request._state.db
+
+    # Requests on the primary are archived along with their appointment.
+    assert archive() == {'appointment': 1, 'appointmentrequest': 1}
+    assert not Appointment.objects.using(appointment._state.db).exists()
+    assert not AppointmentRequest.objects.exists()
+    archived = AppointmentRequest.objects.using('archive').get()
+    assert archived.appointment_id == appointment.pk
+    tombstones = Tombstone.objects.values_list('target_id', 'owner_id')
+    assert sorted(tombstones) == sorted([
+        (appointment.pk, patient.pk),
+        (request.pk, regular_user.pk),
+    ])
+
+
+def test_detail(api, records, admin_user, regular_user, extra_users):
+    archive()
+    result = records['results'][0]
+    question = records['question']
+
+    assert api.login(username=regular_user.username, password='password')
+    res = api.get(url_result)
+    assert [x['id'] for x in res.data] == [records['results'][2].pk]
+    res = api.get('{}{}/'.format(url_result, result.pk))
+    assert res.status_code == status.HTTP_200_OK
+    assert res.data['kind'] == result.kind
+    assert res.data['creator'] == admin_user.username
+    res = api.get('{}{}/'.format(url_question, question.pk))
+    assert res.status_code == status.HTTP_200_OK
+    assert [x['id'] for x in res.data['answers']] == [records['answer'].pk]
+
+    # Archived objects are read-only.
+    res = api.patch('{}{}/'.format(url_result, result.pk), {'unread': False})
+    assert res.status_code == status.HTTP_403_FORBIDDEN
+
+    assert api.login(username=extra_users[0].username, password='password')
+    res = api.get('{}{}/'.format(url_result, result.pk))
+    assert res.status_code == status.HTTP_403_FORBIDDEN
+
+    assert api.login(username=admin_user.username, password='password')
+    res = api.get('{}{}/'.format(url_result, result.pk))
+    assert res.status_code == status.HTTP_200_OK
+    res = api.get('{}{}/'.format(url_result, result.pk + 100))
+    assert res.status_code == status.HTTP_404_NOT_FOUND
+
+
+@mark.usefixtures('archive_db')
+def test_command():
+    out = StringIO()
+    call_command('archive', horizon=30, stdout=out)
+    assert out.getvalue() == 'archived nothing\n'
@@ -0,0 +1,150 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from pytest import fixture, mark
+from rest_framework import status
+
+from frami.api import caching
+from frami.api.models import Answer, Prescription, PrescriptionRequest, Result
+
+
+@fixture(params=['locmem', 'filebased'])
+def response_cache(request, settings, tmp_path):
+    settings.RESPONSE_CACHE_TIMEOUT = 60
+    if request.param == 'filebased':
+        backend = 'django.core.cache.backends.filebased.FileBasedCache'
+        settings.CACHES = {
+            'default': {
+                'BACKEND': backend,
+                'LOCATION': str(tmp_path),
+            },
+        }
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def get(api, url, **params):
+    with CaptureQueriesContext(connection) as ctx:
+        res = api.get(url, params)
+    assert res.status_code == status.HTTP_200_OK, res.data
+    return len(ctx), res
+
+
+@mark.usefixtures('response_cache', 'results')
+def test_hit(api, regular_user):
+    assert api.login(username=regular_user.username, password='password')
+
+    cold, res = get(api, '/api/result/', page_size=2)
+    warm, cached = get(api, '/api/result/', page_size=2)
+    assert warm < cold
+    assert cached.content == res.content
+    assert cached['Link'] == res['Link']
+    assert cached['Content-Type'] == res['Content-Type']
+
+    # Query parameters are part of the key.
+    _, res = get(api, '/api/result/', page_size=1)
+    assert len(res.data) == 1
+
+
+@mark.usefixtures('response_cache', 'results')
+def test_scope(api, admin_user, regular_user):
+    assert api.login(username=admin_user.username, password='password')
+    _, res = get(api, '/api/result/')
+    assert len(res.data) == 18
+
+    assert api.login(username=regular_user.username, password='password')
+    _, res = get(api, '/api/result/')
+    assert len(res.data) == 3
+
+
+@mark.usefixtures('response_cache', 'results')
+def test_invalidate(api, admin_user, regular_user, extra_users):
+    assert api.login(username=regular_user.username, password='password')
+    get(api, '/api/result/')
+    warm, _ = get(api, '/api/result/')
+
+    # Changes for other patients keep the cached response.
+    Result.objects.create(patient=extra_users[0], creator=admin_user)
+    queries, res = get(api, '/api/result/')
+    assert len(res.data) == 3
+    assert queries == warm
+
+    result = Result.objects.create(patient=regular_user, creator=admin_user)
+    _, res = get(api, '/api/result/')
+    assert len(res.data) == 4
+    _, res = get(api, '/api/result/{}/'.format(result.pk))
+    assert res.data['kind'] == ''
+
+    result.kind = 'kind'
+    result.save()
+    _, res = get(api, '/api/result/{}/'.format(result.pk))
+    assert res.data['kind'] == 'kind'
+
+    # Moving a result invalidates the previous owner.
+    result.patient = extra_users[0]
+    result.save()
+    _, res = get(api, '/api/result/')
+    assert len(res.data) == 3
+
+    # Deleting a result invalidates admin responses.
+    assert api.login(username=admin_user.username, password='password')
+    _, res = get(api, '/api/result/')
+    count = len(res.data)
+    Result.objects.filter(patient=regular_user).first().delete()
+    _, res = get(api, '/api/result/')
+    assert len(res.data) == count - 1
+
+
+@mark.usefixtures('response_cache')
+def test_related(api, admin_user, regular_user):
+    prescription = Prescription.objects.create(
+        patient=regular_user,
+        creator=admin_user,
+    )
+    url = '/api/prescription/{}/'.format(prescription.pk)
+    assert api.login(username=admin_user.username, password='password')
+    _, res = get(api, url)
+    assert res.data['refill_request'] is None
+
+    request = PrescriptionRequest.objects.create(
+        prescription=prescription,
+        creator=regular_user,
+    )
+    _, res = get(api, url)
+    assert res.data['refill_request'] == request.pk
+
+    # Usernames are rendered for every model.
+    admin_user.username = 'renamed'
+    admin_user.save()
+    _, res = get(api, url)
+    assert res.data['creator'] == 'renamed'
+
+
+@mark.usefixtures('response_cache')
+def test_nested(api, admin_user, regular_user):
+    assert api.login(username=regular_user.username, password='password')
+    res = api.post('/api/question/', {'subject': 's', 'message': 'm'})
+    assert res.status_code == status.HTTP_201_CREATED, res.data
+    _, res = get(api, '/api/question/')
+    assert res.data[0]['answers'] == []
+
+    Answer.objects.create(
+        question_id=res.data[0]['id'],
+        creator=admin_user,
+        message='answer',
+    )
+    _, res = get(api, '/api/question/')
+    assert res.data[0]['answers'][0]['message'] == 'answer'
+
+
+@mark.usefixtures('results')
+def test_disabled(api, settings, regular_user):
+    settings.RESPONSE_CACHE_TIMEOUT = 0
+    cache.clear()
+    assert api.login(username=regular_user.username, password='password')
+    first, _ = get(api, '/api/result/')
+    second, _ = get(api, '/api/result/')
+    assert first == second
+    key = caching.get_key(Result, '/api/result/', regular_user.pk)
+    assert cache.get(key) is None
@@ -0,0 +1,182 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.utils import timezone
+from pytest import fixture, mark
+from rest_framework import status
+
+from frami.api.changes import decode_cursor
+from frami.api.models import Answer, Question, Result, Tombstone
+from frami.api.pagination import KeysetPagination
+
+url = '/api/changes/'
+
+
+@fixture(autouse=True)
+def settle(settings):
+    settings.CHANGES_SETTLE_SECONDS = 0
+
+
+def sync(api, since=None, **params):
+    if since:
+        params['since'] = since
+    res = api.get(url, params)
+    assert res.status_code == status.HTTP_200_OK, res.data
+    return res.data
+
+
+def test_changes(api, admin_user, regular_user, extra_users, results):
+    assert api.login(username=regular_user.username, password='password')
+    data = sync(api)
+    changes = [(x['model'], x['id']) for x in data['changes']]
+    assert changes == [('result', r.pk) for r in results[regular_user]]
+    assert data['changes'][0]['data']['kind'] == results[regular_user][0].kind
+    assert not data['more']
+
+    cursor = data['cursor']
+    assert sync(api, cursor)['changes'] == []
+    idle = sync(api, cursor)['cursor']
+    assert decode_cursor(idle.encode()) >= decode_cursor(cursor.encode())
+
+    # Other patients' changes are not visible.
+    Result.objects.create(patient=extra_users[0], creator=admin_user)
+    result = results[regular_user][1]
+    result.kind = 'changed'
+    result.save()
+    question = Question.objects.create(creator=regular_user)
+    answer = Answer.objects.create(question=question, creator=admin_user)
+    deleted = results[regular_user][0].pk
+    results[regular_user][0].delete()
+
+    data = sync(api, cursor)
+    assert [(x['model'], x['id']) for x in data['changes']] == [
+        ('result', result.pk),
+        ('question', question.pk),
+        ('answer', answer.pk),
+        ('result', deleted),
+    ]
+    assert data['changes'][0]['data']['kind'] == 'changed'
+    assert data['changes'][-1]['data'] is None
+
+
+@mark.usefixtures('results')
+def test_pages(api, admin_user):
+    assert api.login(username=admin_user.username, password='password')
+    # Equal modification dates are ordered by id.
+    date = Result.objects.first().modification_date
+    Result.objects.update(modification_date=date)
+
+    seen = []
+    cursor = None
+    while True:
+        data = sync(api, cursor, page_size=4)
+        seen += [x['id'] for x in data['changes']]
+        cursor = data['cursor']
+        if not data['more']:
+            break
+    assert seen == sorted(Result.objects.values_list('pk', flat=True))
+
+
+def test_move(api, regular_user, extra_users, results):
+    assert api.login(username=regular_user.username, password='password')
+    cursor = sync(api)['cursor']
+
+    result = results[regular_user][0]
+    result.patient = extra_users[0]
+    result.save()
+    data = sync(api, cursor)
+    change = {'model': 'result', 'id': result.pk, 'data': None}
+    assert data['changes'] == [change]
+
+    tombstone = Tombstone.objects.get()
+    assert tombstone.owner_id == regular_user.pk
+
+
+def test_settle(api, settings, regular_user, results):
+    settings.CHANGES_SETTLE_SECONDS = 60
+    assert api.login(username=regular_user.username, password='password')
+    data = sync(api)
+    assert len(data['changes']) == len(results[regular_user])
+
+    # Recent changes are returned again, along with changes that
+    # committed late.
+    cursor = data['cursor']
+    assert decode_cursor(cursor.encode())[0] < timezone.now()
+    late = results[regular_user][0]
+    Result.objects.filter(pk=late.pk).update(
+        modification_date=timezone.now() - timedelta(seconds=30),
+    )
+    data = sync(api, cursor)
+    assert [x['id'] for x in data['changes']] == [
+        late.pk,
+    ] + [r.pk for r in results[regular_user][1:]]
+
+    # Pages are not held back.
+    data = sync(api, page_size=1)
+    assert data['more']
+    assert data['changes'][0]['id'] == late.pk
+    data = sync(api, data['cursor'], page_size=1)
+    assert data['changes'][0]['id'] == results[regular_user][1].pk
+
+
+@mark.usefixtures('results')
+def test_idle(api, mocker, regular_user):
+    # Sessions would expire along with the cursor.
+    api.force_authenticate(regular_user)
+    now = timezone.now()
+    cursor = sync(api)['cursor']
+
+    # The cursor of a client without changes doesn't expire.
+    for days in range(30, 150, 30):
+        mocker.patch(
+            'frami.api.changes.timezone.now',
+            return_value=now + timedelta(days=days),
+        )
+        data = sync(api, cursor)
+        assert data['changes'] == []
+        date = decode_cursor(data['cursor'].encode())[0]
+        assert date == now + timedelta(days=days)
+        cursor = data['cursor']
+
+
+def test_expired(api, settings, regular_user, results):
+    assert api.login(username=regular_user.username, password='password')
+    days = settings.TOMBSTONE_RETENTION_DAYS
+    since = timezone.now() - timedelta(days=days + 1)
+    cursor = KeysetPagination.encode_cursor([since, 0, 0])
+    res = api.get(url, {'since': cursor})
+    assert res.status_code == status.HTTP_404_NOT_FOUND
+
+    results[regular_user][0].delete()
+    Tombstone.objects.update(creation_date=since)
+    kept = results[regular_user][1].pk
+    results[regular_user][1].delete()
+    out = StringIO()
+    call_command('prunetombstones', stdout=out)
+    assert out.getvalue() == 'pruned 1 tombstones\n'
+    assert Tombstone.objects.get().target_id == kept
+
+
+def test_permissions(api, admin_user, regular_user):
+    Answer.objects.create(
+        question=Question.objects.create(creator=admin_user),
+        creator=admin_user,
+    )
+    assert api.login(username=regular_user.username, password='password')
+    assert sync(api)['changes'] == []
+
+    assert api.login(username=admin_user.username, password='password')
+    data = sync(api)
+    assert [x['model'] for x in data['changes']] == ['question', 'answer']
+
+
+def test_invalid(api, regular_user):
+    assert api.login(username=regular_user.username, password='password')
+    for since in ['x', 'WzFd', 'WyJ4IiwgMSwgMV0=']:
+        res = api.get(url, {'since': since})
+        assert res.status_code == status.HTTP_404_NOT_FOUND, res.data
+
+    api.logout()
+    res = api.get(url)
+    assert res.status_code == status.HTTP_403_FORBIDDEN
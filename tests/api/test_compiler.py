@@ -0,0 +1,130 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.utils import timezone
+from pytest import mark
+from rest_framework.renderers import JSONRenderer
+
+from frami.api.compiler import compile_serializer
+from frami.api.models import (
+    Answer,
+    Appointment,
+    AppointmentRequest,
+    Prescription,
+    PrescriptionRequest,
+    Question,
+    Result,
+    UserNotification,
+)
+from frami.api.serializers import (
+    AnswerSerializer,
+    AppointmentRequestSerializer,
+    AppointmentSerializer,
+    GroupNotificationSerializer,
+    PrescriptionRequestSerializer,
+    PrescriptionSerializer,
+    QuestionSerializer,
+    ResultSerializer,
+    UserNotificationSerializer,
+    UserSerializer,
+)
+
+
+def render(data):
+    return JSONRenderer().render(data)
+
+
+def create(admin_user, user):
+    now = timezone.now()
+    Appointment.objects.create(
+        patient=user,
+        staff=admin_user,
+        creator=admin_user,
+        start_date=now,
+        end_date=now,
+        note='note for {}'.format(user.username),
+    )
+    AppointmentRequest.objects.create(
+        creator=user,
+        start_date=now,
+        end_date=now,
+        subject='åäö "x"',
+        message='',
+    )
+    prescription = Prescription.objects.create(
+        patient=user,
+        creator=admin_user,
+        medication='medication',
+        refill=3,
+    )
+    PrescriptionRequest.objects.create(
+        prescription=prescription,
+        creator=user,
+    )
+    Prescription.objects.create(patient=user, creator=admin_user)
+    question = Question.objects.create(creator=user)
+    Answer.objects.create(question=question, creator=admin_user)
+
+
+@mark.parametrize(
+    'serializer_class',
+    [
+        AnswerSerializer,
+        AppointmentRequestSerializer,
+        AppointmentSerializer,
+        PrescriptionRequestSerializer,
+        PrescriptionSerializer,
+        ResultSerializer,
+    ],
+)
+@mark.usefixtures('results')
+def test_identical(admin_user, regular_user, serializer_class):
+    create(admin_user, regular_user)
+    create(admin_user, admin_user)
+
+    represent = compile_serializer(serializer_class())
+    assert represent
+
+    queryset = serializer_class.Meta.model.objects.order_by('id')
+    rows = queryset.values_list(*represent.lookups)
+    expected = render(serializer_class(queryset, many=True).data)
+    assert render([represent(row) for row in rows]) == expected
+    assert len(rows) > 1
+
+
+def test_trimmed(admin_user, regular_user):
+    create(admin_user, regular_user)
+    assert UserNotification.objects.exists()
+
+    serializer = UserNotificationSerializer()
+    assert not compile_serializer(serializer)
+    serializer.fields.pop('target')
+
+    represent = compile_serializer(serializer)
+    assert represent
+    queryset = UserNotification.objects.order_by('id')
+    rows = queryset.values_list(*represent.lookups)
+    expected = [serializer.to_representation(x) for x in queryset]
+    assert render([represent(row) for row in rows]) == render(expected)
+
+
+@mark.parametrize(
+    'serializer_class',
+    [
+        GroupNotificationSerializer,
+        QuestionSerializer,
+        UserSerializer,
+    ],
+)
+def test_not_compiled(serializer_class):
+    assert compile_serializer(serializer_class()) is None
+
+
+@mark.django_db
+def test_benchmark():
+    out = StringIO()
+    call_command('benchmark', 'serializers', rows=5, repeat=1, stdout=out)
+    lines = out.getvalue().splitlines()
+    assert len(lines) == 6
+    assert all('rows=5 ' in line for line in lines)
+    assert not Result.objects.exists()
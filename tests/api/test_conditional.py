@@ -0,0 +1,119 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import http_date
+from pytest import fixture, mark
+from rest_framework import status
+
+from frami.api.models import Answer, Question, Result
+
+url = '/api/result/'
+
+
+@fixture(autouse=True)
+def conditional(settings):
+    settings.CONDITIONAL_REQUESTS = True
+
+
+def get(api, path, **headers):
+    with CaptureQueriesContext(connection) as ctx:
+        res = api.get(path, **headers)
+    return [q['sql'] for q in ctx.captured_queries if 'api_' in q['sql']], res
+
+
+def test_etag(api, admin_user, regular_user, results):
+    assert api.login(username=regular_user.username, password='password')
+    _, res = get(api, url)
+    assert res.status_code == status.HTTP_200_OK
+    etag = res['ETag']
+
+    queries, res = get(api, url, HTTP_IF_NONE_MATCH=etag)
+    assert res.status_code == status.HTTP_304_NOT_MODIFIED
+    assert not res.content
+    # A single aggregate besides authentication.
+    assert len(queries) == 1
+    assert 'MAX' in queries[0]
+
+    # Query parameters are part of the ETag.
+    _, res = get(api, url + '?page_size=1', HTTP_IF_NONE_MATCH=etag)
+    assert res.status_code == status.HTTP_200_OK
+
+    # Changes to rows of other patients are not visible.
+    Result.objects.create(patient=admin_user, creator=admin_user)
+    _, res = get(api, url, HTTP_IF_NONE_MATCH=etag)
+    assert res.status_code == status.HTTP_304_NOT_MODIFIED
+
+    result = results[regular_user][0]
+    result.kind = 'changed'
+    result.save()
+    _, res = get(api, url, HTTP_IF_NONE_MATCH=etag)
+    assert res.status_code == status.HTTP_200_OK
+    etag = res['ETag']
+
+    result.delete()
+    _, res = get(api, url, HTTP_IF_NONE_MATCH=etag)
+    assert res.status_code == status.HTTP_200_OK
+    assert len(res.data) == 2
+
+
+def test_last_modified(api, regular_user, results):
+    assert api.login(username=regular_user.username, password='password')
+    result = results[regular_user][0]
+    _, res = get(api, '{}{}/'.format(url, result.pk))
+    assert res.status_code == status.HTTP_200_OK
+    assert 'Last-Modified' not in res
+
+    # Deletions don't move a timestamp.
+    result.delete()
+    _, res = get(api, url, HTTP_IF_MODIFIED_SINCE=http_date())
+    assert res.status_code == status.HTTP_200_OK
+    assert len(res.data) == 2
+
+
+@mark.usefixtures('results')
+def test_rename(api, admin_user, regular_user):
+    assert api.login(username=regular_user.username, password='password')
+    _, res = get(api, url)
+    etag = res['ETag']
+
+    # Results render the name of their creator.
+    admin_user.username = 'renamed'
+    admin_user.save()
+    _, res = get(api, url, HTTP_IF_NONE_MATCH=etag)
+    assert res.status_code == status.HTTP_200_OK
+    assert res.data[0]['creator'] == 'renamed'
+
+
+def test_detail(api, admin_user, regular_user):
+    assert api.login(username=regular_user.username, password='password')
+    _, res = get(api, '{}{}/'.format(url, 'x'), HTTP_IF_NONE_MATCH='*')
+    assert res.status_code == status.HTTP_403_FORBIDDEN
+
+    result = Result.objects.create(patient=admin_user, creator=admin_user)
+    _, res = get(api, '{}{}/'.format(url, result.pk), HTTP_IF_NONE_MATCH='*')
+    assert res.status_code == status.HTTP_403_FORBIDDEN
+
+
+def test_relations(api, admin_user, regular_user):
+    question = Question.objects.create(creator=regular_user)
+    assert api.login(username=regular_user.username, password='password')
+    _, res = get(api, '/api/question/')
+    etag = res['ETag']
+
+    answer = Answer.objects.create(question=question, creator=admin_user)
+    _, res = get(api, '/api/question/', HTTP_IF_NONE_MATCH=etag)
+    assert res.status_code == status.HTTP_200_OK
+    etag = res['ETag']
+
+    answer.delete()
+    _, res = get(api, '/api/question/', HTTP_IF_NONE_MATCH=etag)
+    assert res.status_code == status.HTTP_200_OK
+    assert res.data[0]['answers'] == []
+
+
+@mark.usefixtures('results')
+def test_disabled(api, settings, regular_user):
+    settings.CONDITIONAL_REQUESTS = False
+    assert api.login(username=regular_user.username, password='password')
+    _, res = get(api, url)
+    assert res.status_code == status.HTTP_200_OK
+    assert 'ETag' not in res
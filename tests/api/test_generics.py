@@ -0,0 +1,140 @@
+import json
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from pytest import mark
+from rest_framework import status
+
+from frami.api.mixins import ListModelMixin
+from frami.api.models import (
+    Answer,
+    Appointment,
+    Prescription,
+    Question,
+    Result,
+)
+
+
+def count(api, url):
+    with CaptureQueriesContext(connection) as ctx:
+        res = api.get(url)
+    assert res.status_code == status.HTTP_200_OK, res.data
+    return len(ctx), len(res.data)
+
+
+def create(admin_user, user):
+    Appointment.objects.create(
+        patient=user,
+        staff=admin_user,
+        creator=admin_user,
+        start_date=timezone.now(),
+        end_date=timezone.now(),
+    )
+    Prescription.objects.create(patient=user, creator=admin_user)
+    Result.objects.create(patient=user, creator=admin_user)
+    question = Question.objects.create(creator=user)
+    for _ in range(2):
+        Answer.objects.create(question=question, creator=admin_user)
+
+
+@mark.parametrize(
+    'url',
+    [
+        '/api/appointment/',
+        '/api/question/',
+        '/api/user/',
+        '/api/user-notification/',
+        '/api/group-notification/',
+    ],
+)
+def test_constant_queries(api, admin_user, regular_user, extra_users, url):
+    assert api.login(username=admin_user.username, password='password')
+
+    create(admin_user, regular_user)
+    few, n = count(api, url)
+    for user in extra_users:
+        create(admin_user, user)
+    many, m = count(api, url)
+
+    assert few == many
+    assert n <= m
+
+
+@mark.parametrize(
+    'url',
+    [
+        '/api/appointment/',
+        '/api/question/',
+        '/api/user/',
+        '/api/user-notification/',
+        '/api/group-notification/',
+    ],
+)
+def test_stream(api, admin_user, regular_user, extra_users, url, monkeypatch):
+    monkeypatch.setattr(ListModelMixin, 'stream_chunk_size', 2)
+    assert api.login(username=admin_user.username, password='password')
+
+    for user in [regular_user] + extra_users:
+        create(admin_user, user)
+    res = api.get(url, {'stream': 'true'})
+    assert res.status_code == status.HTTP_200_OK
+    assert res.streaming
+    data = json.loads(b''.join(res.streaming_content).decode())
+
+    res = api.get(url, {'page_size': 1000})
+    assert data == json.loads(res.content.decode())
+    assert data
+
+
+@mark.parametrize(
+    'url, fields',
+    [
+        ('/api/appointment/', ['id', 'staff', 'start_date']),
+        ('/api/result/', ['creator', 'patient']),
+        ('/api/question/', ['id', 'answers']),
+        ('/api/user/', ['username', 'groups']),
+        ('/api/user-notification/', ['uuid', 'target', 'user']),
+        ('/api/group-notification/', ['event', 'group', 'read']),
+    ],
+)
+def test_fields(api, admin_user, regular_user, extra_users, url, fields):
+    assert api.login(username=admin_user.username, password='password')
+
+    for user in [regular_user] + extra_users:
+        create(admin_user, user)
+    full = api.get(url).data
+    few, _ = count(api, url)
+
+    with CaptureQueriesContext(connection) as ctx:
+        res = api.get(url, {'fields': ','.join(fields + ['x'])})
+    assert res.status_code == status.HTTP_200_OK, res.data
+    assert res.data
+    assert [{k: x[k] for k in fields} for x in full] == res.data
+    assert len(ctx) <= few
+
+
+def test_fields_only(api, admin_user, regular_user):
+    assert api.login(username=admin_user.username, password='password')
+    create(admin_user, regular_user)
+
+    with CaptureQueriesContext(connection) as ctx:
+        res = api.get('/api/appointment/', {'fields': 'id'})
+    assert res.status_code == status.HTTP_200_OK, res.data
+    assert [list(x) for x in res.data] == [['id']]
+    assert 'note' not in ctx.captured_queries[-1]['sql']
+
+    res = api.patch(
+        '/api/appointment/{}/?fields=id'.format(res.data[0]['id']),
+        {'note': 'x'},
+    )
+    assert res.status_code == status.HTTP_200_OK, res.data
+    assert res.data['note'] == 'x'
+
+    prescription = Prescription.objects.get()
+    res = api.get(
+        '/api/prescription/{}/'.format(prescription.pk),
+        {'fields': 'medication,refill_request'},
+    )
+    assert res.status_code == status.HTTP_200_OK, res.data
+    assert res.data == {'medication': '', 'refill_request': None}
@@ -0,0 +1,177 @@
+from datetime import datetime, timedelta
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.utils import timezone
+from pytest import fixture, raises
+from rest_framework import status
+
+from frami.api import scheduling
+from frami.api.matching import match
+from frami.api.models import (
+    Appointment,
+    AppointmentRequest,
+    Notification,
+    UserNotification,
+)
+from frami.api.scheduling import Schedule
+
+url = '/api/appointment-request/match/'
+day = datetime(2030, 1, 1, tzinfo=timezone.utc)
+
+
+@fixture(autouse=True)
+def clear():
+    # Primary keys are reused between tests.
+    cache.clear()
+    scheduling._schedules.clear()  # pylint: disable=W0212
+
+
+def hours(start, end):
+    return day + timedelta(hours=start), day + timedelta(hours=end)
+
+
+def request(pk, creator_id, start, end, staff_id=None):
+    return AppointmentRequest(
+        pk=pk,
+        creator_id=creator_id,
+        staff_id=staff_id,
+        start_date=day + timedelta(hours=start),
+        end_date=day + timedelta(hours=end),
+    )
+
+
+def create(user, start, end, staff=None):
+    start, end = hours(start, end)
+    return AppointmentRequest.objects.create(
+        creator=user,
+        staff=staff,
+        start_date=start,
+        end_date=end,
+        subject='subject',
+        message='message',
+    )
+
+
+def test_match():
+    schedules = {
+        10: Schedule([(*hours(9, 10), 1)]),
+        20: Schedule([(*hours(8, 12), 2)]),
+    }
+    busy = {3: Schedule([(*hours(8, 9), 3)])}
+    requests = [
+        request(1, 1, 8, 13),
+        # Loose deadlines yield to tight ones.
+        request(2, 2, 10, 12),
+        # The creator is busy until 9.
+        request(3, 3, 8, 11),
+        # Only staff 20 is accepted.
+        request(4, 4, 8, 14, staff_id=20),
+        # Nothing fits.
+        request(5, 5, 9, 10),
+    ]
+    assignments = match(
+        requests,
+        schedules,
+        busy,
+        *hours(8, 13),
+        timedelta(hours=1),
+    )
+    assert [(r.pk, staff, slot.hour) for r, staff, slot in assignments] == [
+        (1, 10, 8),
+        (3, 10, 10),
+        (2, 10, 11),
+        (4, 20, 12),
+    ]
+    assert len(busy[3]) == 2
+
+
+def test_endpoint(api, admin_user, regular_user, extra_users):
+    Appointment.objects.create(
+        patient=extra_users[0],
+        staff=admin_user,
+        creator=admin_user,
+        start_date=day + timedelta(hours=9),
+        end_date=day + timedelta(hours=10),
+    )
+    first = create(regular_user, 8, 11)
+    second = create(regular_user, 8, 11)
+    third = create(extra_users[1], 8, 9)
+    late = create(extra_users[2], 12, 13)
+
+    assert api.login(username=admin_user.username, password='password')
+    start, end = hours(8, 11)
+    data = {'start': start.isoformat(), 'end': end.isoformat(), 'duration': 60}
+    res = api.post(url, data)
+    assert res.status_code == status.HTTP_201_CREATED, res.data
+    assert [(x['patient'], x['start_date']) for x in res.data] == [
+        (extra_users[1].username, '2030-01-01T08:00:00Z'),
+        (regular_user.username, '2030-01-01T10:00:00Z'),
+    ]
+
+    for r in [first, second, third, late]:
+        r.refresh_from_db()
+    assert first.appointment.pk == res.data[1]['id']
+    assert third.appointment.pk == res.data[0]['id']
+    assert second.appointment is None
+    assert late.appointment is None
+
+    notifications = UserNotification.objects.filter(
+        event=Notification.CREATED,
+        target_name='appointment',
+        target_id=first.appointment.pk,
+    )
+    assert {x.user for x in notifications} == {admin_user, regular_user}
+
+    # The schedule sees the bulk insert.
+    slots = scheduling.get_schedule(admin_user.pk).free(
+        *hours(8, 11),
+        timedelta(hours=1),
+    )
+    assert not list(slots)
+
+    # Matched requests are not matched again.
+    res = api.post(url, data)
+    assert res.status_code == status.HTTP_201_CREATED, res.data
+    assert res.data == []
+
+
+def test_invalid(api, admin_user, regular_user):
+    start, end = hours(8, 11)
+    data = {'start': start.isoformat(), 'end': end.isoformat(), 'duration': 60}
+
+    assert api.login(username=regular_user.username, password='password')
+    res = api.post(url, data)
+    assert res.status_code == status.HTTP_403_FORBIDDEN
+
+    assert api.login(username=admin_user.username, password='password')
+    for params in [{'start': end.isoformat()}, {'duration': 0}, {'end': ''}]:
+        res = api.post(url, dict(data, **params))
+        assert res.status_code == status.HTTP_400_BAD_REQUEST, params
+
+
+def test_command(admin_user, regular_user):
+    create(regular_user, 8, 11, staff=admin_user)
+    start, end = hours(8, 11)
+    out = StringIO()
+    call_command(
+        'matchrequests',
+        start=start.isoformat(),
+        end=end.isoformat(),
+        creator=admin_user.username,
+        stdout=out,
+    )
+    assert out.getvalue() == 'created=1\n'
+    appointment = Appointment.objects.get()
+    assert appointment.staff == admin_user
+    assert appointment.start_date == day + timedelta(hours=8)
+    assert appointment.end_date == day + timedelta(minutes=8 * 60 + 30)
+
+    with raises(CommandError):
+        call_command(
+            'matchrequests',
+            start='invalid',
+            end=end.isoformat(),
+            creator=admin_user.username,
+        )
@@ -1,9 +1,21 @@
+from importlib import import_module
 from uuid import uuid4
 
+from django.apps import apps
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from rest_framework import status
 
-from frami.api.models import GroupNotification, Result, UserNotification
+from frami.api.access import get_access
+from frami.api.models import (
+    GroupNotification,
+    GroupNotificationMark,
+    GroupNotificationReceipt,
+    Question,
+    Result,
+    UserNotification,
+)
 from frami.api.serializers import (
     GroupNotificationSerializer,
     UserNotificationSerializer,
@@ -451,3 +463,149 @@ def test_update_result(api, regular_user, extra_users, results):
             )
             res = api.patch(user_url_pk.format(pk=result.pk), data)
             assert res.status_code == status.HTTP_403_FORBIDDEN, res.data
+
+
+def test_snapshot(api, settings, admin_user, regular_user):
+    settings.NOTIFICATION_SNAPSHOTS = True
+    results = [
+        Result.objects.create(patient=regular_user, creator=admin_user)
+        for _ in range(3)
+    ]
+    UserNotification.objects.create(
+        user=regular_user,
+        uuid=uuid4(),
+        target=results[0],
+    )
+
+    assert api.login(username=regular_user.username, password='password')
+    res = api.get(user_url)
+    assert res.status_code == status.HTTP_200_OK, res.data
+    want = res.json()
+
+    res = api.get(user_url, {'snapshot': 'true'})
+    assert res.status_code == status.HTTP_200_OK, res.data
+    assert res.json() == want
+
+    # Deleted targets are rendered from their snapshot.
+    results[1].delete()
+    res = api.get(user_url)
+    assert res.status_code == status.HTTP_200_OK, res.data
+    assert res.json() == want
+
+
+def test_snapshot_queries(api, settings, admin_user, extra_users):
+    settings.NOTIFICATION_SNAPSHOTS = True
+    for user in extra_users:
+        Question.objects.create(creator=user)
+
+    assert api.login(username=admin_user.username, password='password')
+    with CaptureQueriesContext(connection) as ctx:
+        res = api.get(group_url)
+    assert res.status_code == status.HTTP_200_OK, res.data
+    full = len(ctx)
+
+    with CaptureQueriesContext(connection) as ctx:
+        res = api.get(group_url, {'snapshot': '1'})
+    assert res.status_code == status.HTTP_200_OK, res.data
+    assert len(ctx) < full
+    assert len(res.data) == len(extra_users)
+    for x in res.data:
+        assert 'answers' in x['target']
+
+
+def test_group_read_per_user(api, admin_user, create_user, regular_user):
+    other = create_user('other-admin', 'admin')
+    questions = [
+        Question.objects.create(creator=regular_user) for _ in range(3)
+    ]
+    n = GroupNotification.objects.get(target_id=questions[1].pk)
+
+    assert api.login(username=admin_user.username, password='password')
+    res = api.patch(group_url_pk.format(pk=n.pk), {'read': True})
+    assert res.status_code == status.HTTP_200_OK, res.data
+    assert res.data['read'] is True
+    res = api.get(group_url, {'read': 'false'})
+    assert len(res.data) == 2
+    res = api.get(group_url + 'unread-count/')
+    assert res.data == {'count': 2}
+
+    assert api.login(username=other.username, password='password')
+    res = api.get(group_url)
+    assert [x['read'] for x in res.data] == [False] * 3
+    res = api.get(group_url + 'unread-count/')
+    assert res.data == {'count': 3}
+
+    res = api.post(group_url + 'read-all/')
+    assert res.status_code == status.HTTP_204_NO_CONTENT
+    res = api.get(group_url, {'read': 'true'})
+    assert len(res.data) == 3
+
+    assert api.login(username=admin_user.username, password='password')
+    res = api.get(group_url + 'unread-count/')
+    assert res.data == {'count': 2}
+
+    assert api.login(username=regular_user.username, password='password')
+    res = api.post(group_url + 'read-all/')
+    assert res.status_code == status.HTTP_403_FORBIDDEN
+
+
+def test_group_read_compaction(admin_user, regular_user):
+    for _ in range(3):
+        Question.objects.create(creator=regular_user)
+    a, b, c = GroupNotification.objects.order_by('pk')
+
+    def state():
+        mark = GroupNotificationMark.objects.filter(user=admin_user).first()
+        receipts = GroupNotificationReceipt.objects.filter(user=admin_user)
+        notifications = GroupNotification.objects.with_read(
+            admin_user,
+            get_access(admin_user).group_ids,
+        ).order_by('pk')
+        return (
+            mark.last_read if mark else 0,
+            set(receipts.values_list('notification_id', 'read')),
+            [n.user_read for n in notifications],
+        )
+
+    b.set_read(admin_user, True)
+    assert state() == (0, {(b.pk, True)}, [False, True, False])
+
+    a.set_read(admin_user, True)
+    assert state() == (b.pk, set(), [True, True, False])
+
+    b.set_read(admin_user, False)
+    assert state() == (b.pk, {(b.pk, False)}, [True, False, False])
+
+    b.set_read(admin_user, True)
+    assert state() == (b.pk, set(), [True, True, False])
+
+    c.set_read(admin_user, False)
+    assert state() == (b.pk, set(), [True, True, False])
+
+    # Notifications below the mark stay unread.
+    a.set_read(admin_user, False)
+    c.set_read(admin_user, True)
+    assert state() == (c.pk, {(a.pk, False)}, [False, True, True])
+
+
+def test_group_read_migration(admin_user, regular_user):
+    migration = import_module(
+        'frami.api.migrations.0013_groupnotification_receipts'
+    )
+    for _ in range(4):
+        Question.objects.create(creator=regular_user)
+    a, _, c, _ = GroupNotification.objects.order_by('pk')
+    GroupNotification.objects.filter(pk__in=[a.pk, c.pk]).update(read=True)
+
+    migration.add_marks(apps, None)
+    marks = GroupNotificationMark.objects.all()
+    assert [(m.user, m.last_read) for m in marks] == [(admin_user, a.pk)]
+    receipts = GroupNotificationReceipt.objects.all()
+    assert [(r.user, r.notification_id, r.read) for r in receipts] == [
+        (admin_user, c.pk, True),
+    ]
+    notifications = GroupNotification.objects.with_read(
+        admin_user,
+        get_access(admin_user).group_ids,
+    ).order_by('pk')
+    assert [n.user_read for n in notifications] == [True, False, True, False]
@@ -0,0 +1,107 @@
+import json
+
+from pytest import fixture, mark
+from rest_framework import status
+
+from frami.api.models import Notification, Question, Result
+
+url = '/api/notification-stream/'
+
+
+@fixture
+def stream(settings):
+    settings.NOTIFICATION_STREAM_INTERVAL = 0
+    settings.NOTIFICATION_STREAM_TIMEOUT = 0
+
+
+def parse(res):
+    assert res.status_code == status.HTTP_200_OK
+    assert res['Content-Type'] == 'text/event-stream'
+    content = b''.join(res.streaming_content).decode()
+    events = []
+    for chunk in content.split('\n\n'):
+        fields = dict(
+            line.split(': ', 1)
+            for line in chunk.splitlines()
+            if not line.startswith(':')
+        )
+        if 'id' in fields:
+            fields['data'] = json.loads(fields['data'])
+            events.append(fields)
+    return events
+
+
+@mark.usefixtures('stream')
+def test_unauthenticated(api):
+    res = api.get(url)
+    assert res.status_code == status.HTTP_403_FORBIDDEN
+
+
+@mark.usefixtures('stream', 'results')
+def test_only_new(api, regular_user):
+    assert api.login(username=regular_user.username, password='password')
+    assert not parse(api.get(url))
+
+
+@mark.usefixtures('stream')
+def test_last_event_id(api, regular_user, results):
+    assert api.login(username=regular_user.username, password='password')
+    events = parse(api.get(url, HTTP_LAST_EVENT_ID='0'))
+    assert len(events) == len(results[regular_user])
+    for event, result in zip(events, results[regular_user]):
+        assert event['event'] == 'user-notification'
+        assert event['data']['target']['id'] == result.pk
+        assert event['data']['user'] == regular_user.username
+
+    last = events[1]['id']
+    events = parse(api.get(url, {'last_event_id': last}))
+    assert len(events) == 1
+    assert events[0]['data']['target']['id'] == results[regular_user][2].pk
+
+
+def test_batch(api, settings, mocker, regular_user, results):
+    settings.NOTIFICATION_STREAM_INTERVAL = 0
+    settings.NOTIFICATION_STREAM_TIMEOUT = 1
+    settings.NOTIFICATION_STREAM_BATCH = 2
+    # Two polls for the first stream, one for the second.
+    mocker.patch(
+        'frami.api.views.time.monotonic',
+        side_effect=[0, 0, 2, 0, 0],
+    )
+
+    # The backlog is sent a batch per poll until the stream is closed.
+    assert api.login(username=regular_user.username, password='password')
+    events = parse(api.get(url, HTTP_LAST_EVENT_ID='0'))
+    ids = [e['data']['target']['id'] for e in events]
+    assert ids == [r.pk for r in results[regular_user]]
+
+    settings.NOTIFICATION_STREAM_TIMEOUT = 0
+    events = parse(api.get(url, HTTP_LAST_EVENT_ID='0'))
+    assert len(events) == 2
+
+
+@mark.usefixtures('stream')
+def test_group(api, admin_user, regular_user):
+    r = Result.objects.create(patient=admin_user, creator=admin_user)
+    last = Notification.objects.order_by('-pk').first().pk
+    q = Question.objects.create(creator=regular_user)
+
+    assert api.login(username=admin_user.username, password='password')
+    events = parse(api.get(url, HTTP_LAST_EVENT_ID=str(last - 1)))
+    assert [e['event'] for e in events] == [
+        'user-notification',
+        'group-notification',
+    ]
+    assert events[0]['data']['target']['id'] == r.pk
+    assert events[1]['data']['target']['id'] == q.pk
+
+
+def test_keep_alive(api, settings, mocker, regular_user):
+    settings.NOTIFICATION_STREAM_INTERVAL = 0
+    settings.NOTIFICATION_STREAM_TIMEOUT = 1
+    mocker.patch('frami.api.views.time.monotonic', side_effect=[0, 0, 2])
+
+    assert api.login(username=regular_user.username, password='password')
+    res = api.get(url)
+    content = b''.join(res.streaming_content).decode()
+    assert content == 'retry: 0\n\n: keep-alive\n\n'
@@ -0,0 +1,87 @@
+from io import StringIO
+from uuid import uuid4
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from pytest import fixture, mark
+
+from frami.api.models import (
+    AppointmentRequest,
+    GroupNotification,
+    NotificationOutbox,
+    Result,
+    UserNotification,
+)
+from frami.api.notifications import drain, enqueue, get_lag
+
+
+@fixture(autouse=True)
+def outbox(settings):
+    settings.NOTIFICATION_OUTBOX = True
+
+
+def test_enqueue(results):
+    assert not UserNotification.objects.all()
+    assert not GroupNotification.objects.all()
+    assert len(NotificationOutbox.objects.all()) == len([
+        r for x in results.values() for r in x
+    ])
+    assert get_lag().total_seconds() >= 0
+
+
+def test_drain(admin_user, regular_user):
+    r = Result.objects.create(patient=regular_user, creator=admin_user)
+    AppointmentRequest.objects.create(
+        creator=regular_user,
+        staff=admin_user,
+        start_date=r.creation_date,
+        end_date=r.creation_date,
+    )
+
+    assert drain(1) == 1
+    assert UserNotification.objects.get(user=regular_user).target == r
+    assert not GroupNotification.objects.all()
+
+    assert drain(10) == 1
+    assert drain(10) == 0
+    assert UserNotification.objects.get(user=admin_user)
+    assert GroupNotification.objects.get()
+    assert get_lag() is None
+
+
+@mark.usefixtures('results')
+def test_drain_query_count():
+    count = NotificationOutbox.objects.count()
+    with CaptureQueriesContext(connection) as ctx:
+        assert drain(100) == count
+    inserts = [
+        q for q in ctx.captured_queries
+        if q['sql'].startswith('INSERT INTO "api_notification"')
+    ]
+    assert len(inserts) == 1
+    assert UserNotification.objects.count() == count
+
+
+def test_worker(results):
+    out = StringIO()
+    call_command(
+        'notificationworker',
+        once=True,
+        batch_size=5,
+        interval=0,
+        stdout=out,
+    )
+
+    assert not NotificationOutbox.objects.all()
+    assert 'processed=5' in out.getvalue()
+    for user, x in results.items():
+        assert len(UserNotification.objects.filter(user=user)) == len(x)
+
+
+def test_no_recipients(regular_user):
+    r = Result.objects.create(patient=regular_user, creator=regular_user)
+    NotificationOutbox.objects.all().delete()
+
+    enqueue(uuid4(), [], [], r)
+    assert not NotificationOutbox.objects.all()
@@ -0,0 +1,85 @@
+import re
+
+from rest_framework import status
+
+from frami.api.models import Result
+from frami.api.pagination import KeysetPagination
+
+url = '/api/result/'
+
+
+def next_link(res):
+    link = res.get('Link')
+    if link:
+        return re.match('<(.*)>; rel="next"', link).group(1)
+    return None
+
+
+def test_pages(api, admin_user, regular_user):
+    results = [
+        Result.objects.create(patient=regular_user, creator=admin_user)
+        for _ in range(7)
+    ]
+    # Rows with equal creation dates are ordered by id.
+    Result.objects.filter(pk__in=[r.pk for r in results[2:5]]).update(
+        creation_date=results[2].creation_date,
+    )
+
+    assert api.login(username=regular_user.username, password='password')
+    res = api.get(url, {'page_size': 3})
+    assert res.status_code == status.HTTP_200_OK, res.data
+    assert [x['id'] for x in res.data] == [r.pk for r in results[:3]]
+
+    # Rows created between requests are not skipped nor repeated.
+    results.append(
+        Result.objects.create(patient=regular_user, creator=admin_user)
+    )
+
+    res = api.get(next_link(res))
+    assert [x['id'] for x in res.data] == [r.pk for r in results[3:6]]
+
+    res = api.get(next_link(res))
+    assert [x['id'] for x in res.data] == [r.pk for r in results[6:]]
+    assert not next_link(res)
+
+
+def test_page_size(api, admin_user, regular_user):
+    for _ in range(3):
+        Result.objects.create(patient=regular_user, creator=admin_user)
+
+    assert api.login(username=regular_user.username, password='password')
+    assert len(api.get(url, {'page_size': 'x'}).data) == 3
+    assert len(api.get(url, {'page_size': 0}).data) == 1
+    assert not next_link(api.get(url, {'page_size': 3}))
+
+
+def test_unpaginated(api, monkeypatch, admin_user, regular_user):
+    monkeypatch.setattr(KeysetPagination, 'page_size', 2)
+    for _ in range(3):
+        Result.objects.create(patient=regular_user, creator=admin_user)
+
+    # Clients that don't ask for pages get every row.
+    assert api.login(username=regular_user.username, password='password')
+    res = api.get(url)
+    assert len(res.data) == 3
+    assert not next_link(res)
+    res = api.get(url, {'page_size': ''})
+    assert len(res.data) == 2
+    assert next_link(res)
+
+
+def test_invalid_cursor(api, regular_user):
+    assert api.login(username=regular_user.username, password='password')
+    for cursor in ['x', 'WzFd', 'WyJ4IiwgMV0=']:
+        res = api.get(url, {'cursor': cursor})
+        assert res.status_code == status.HTTP_404_NOT_FOUND, res.data
+
+
+def test_user_cursor(api, admin_user, extra_users):
+    assert api.login(username=admin_user.username, password='password')
+    res = api.get('/api/user/', {'page_size': 2})
+    ids = [x['id'] for x in res.data]
+    while next_link(res):
+        res = api.get(next_link(res))
+        ids += [x['id'] for x in res.data]
+    assert ids == sorted([admin_user.pk] + [u.pk for u in extra_users])
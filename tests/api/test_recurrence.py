@@ -0,0 +1,209 @@
+# pylint: disable=W0621
+from datetime import datetime, timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+from pytest import fixture, mark
+from rest_framework import status
+
+from frami.api import scheduling
+from frami.api.models import Appointment, AppointmentException
+from frami.api.recurrence import expand, intersects, is_occurrence
+from frami.api.scheduling import get_schedule
+
+url = '/api/appointment/'
+url_occurrences = '/api/appointment/occurrences/'
+url_exception = '/api/appointment-exception/'
+day = datetime(2030, 1, 1, tzinfo=timezone.utc)
+
+
+@fixture(autouse=True)
+def clear():
+    # Primary keys are reused between tests.
+    cache.clear()
+    scheduling._schedules.clear()  # pylint: disable=W0212
+
+
+def at(days, hours=0):
+    return day + timedelta(days=days, hours=hours)
+
+
+@fixture
+def weekly(admin_user, regular_user):
+    # Ten weekly sessions from 9 to 10.
+    return Appointment.objects.create(
+        patient=regular_user,
+        staff=admin_user,
+        creator=admin_user,
+        start_date=at(0, 9),
+        end_date=at(0, 10),
+        recurrence_interval=7,
+        recurrence_end=at(63, 10),
+    )
+
+
+def test_expand(weekly):
+    occurrences = expand(weekly, at(0), at(100))
+    assert len(occurrences) == 10
+    assert occurrences[-1] == (at(63, 9), at(63, 10), at(63, 9))
+
+    # Only the occurrences in the range are expanded.
+    assert expand(weekly, at(7, 9), at(14, 9)) == [
+        (at(7, 9), at(7, 10), at(7, 9)),
+    ]
+    assert expand(weekly, at(7, 10), at(14, 9)) == []
+
+    AppointmentException.objects.create(appointment=weekly, date=at(7, 9))
+    AppointmentException.objects.create(
+        appointment=weekly,
+        date=at(14, 9),
+        start_date=at(15, 12),
+        end_date=at(15, 13),
+    )
+    assert expand(weekly, at(0), at(20)) == [
+        (at(0, 9), at(0, 10), at(0, 9)),
+        (at(15, 12), at(15, 13), at(14, 9)),
+    ]
+
+    assert is_occurrence(weekly, at(63, 9))
+    assert not is_occurrence(weekly, at(70, 9))
+    assert not is_occurrence(weekly, at(8, 9))
+
+
+def test_intersects():
+    assert intersects([(1, 5), (10, 12)], [(3, 4)])
+    assert intersects([(1, 2), (10, 12)], [(4, 6), (11, 15)])
+    assert not intersects([(1, 2), (10, 12)], [(2, 10), (12, 15)])
+    assert not intersects([], [(1, 2)])
+
+
+def test_occurrences(api, weekly, admin_user, regular_user, extra_users):
+    Appointment.objects.create(
+        patient=regular_user,
+        staff=admin_user,
+        creator=admin_user,
+        start_date=at(8, 9),
+        end_date=at(8, 10),
+    )
+    Appointment.objects.create(
+        patient=extra_users[0],
+        staff=admin_user,
+        creator=admin_user,
+        start_date=at(9, 9),
+        end_date=at(9, 10),
+    )
+
+    assert api.login(username=regular_user.username, password='password')
+    params = {'start': at(6).isoformat(), 'end': at(15).isoformat()}
+    res = api.get(url_occurrences, params)
+    assert res.status_code == status.HTTP_200_OK, res.data
+    assert [(x['id'], x['start_date'], x['occurrence']) for x in res.data] == [
+        (weekly.pk, '2030-01-08T09:00:00Z', '2030-01-08T09:00:00Z'),
+        (weekly.pk + 1, '2030-01-09T09:00:00Z', '2030-01-09T09:00:00Z'),
+        (weekly.pk, '2030-01-15T09:00:00Z', '2030-01-15T09:00:00Z'),
+    ]
+
+    # The rule is stored once.
+    res = api.get(url)
+    assert len(res.data) == 2
+
+    res = api.get(url_occurrences, {'start': at(6).isoformat()})
+    assert res.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@mark.usefixtures('weekly')
+def test_overlap(api, admin_user, regular_user):
+    assert api.login(username=admin_user.username, password='password')
+    data = {
+        'patient': regular_user.username,
+        'staff': admin_user.username,
+        'start_date': at(21, 9).isoformat(),
+        'end_date': at(21, 11).isoformat(),
+    }
+    res = api.post(url, data)
+    assert res.status_code == status.HTTP_400_BAD_REQUEST
+
+    # Between the occurrences.
+    data['start_date'] = at(22, 9).isoformat()
+    data['end_date'] = at(22, 11).isoformat()
+    res = api.post(url, data)
+    assert res.status_code == status.HTTP_201_CREATED, res.data
+
+    # A rule that hits the appointment at its fourth occurrence.
+    data['start_date'] = at(1, 9).isoformat()
+    data['end_date'] = at(1, 10).isoformat()
+    data['recurrence_interval'] = 7
+    data['recurrence_end'] = at(30).isoformat()
+    res = api.post(url, data)
+    assert res.status_code == status.HTTP_400_BAD_REQUEST
+
+    data['recurrence_end'] = at(20).isoformat()
+    res = api.post(url, data)
+    assert res.status_code == status.HTTP_201_CREATED, res.data
+
+    del data['recurrence_end']
+    res = api.post(url, data)
+    assert res.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_exception(api, weekly, admin_user, regular_user):
+    data = {'appointment': weekly.pk, 'date': at(7, 9).isoformat()}
+
+    assert api.login(username=regular_user.username, password='password')
+    res = api.post(url_exception, data)
+    assert res.status_code == status.HTTP_403_FORBIDDEN
+
+    assert api.login(username=admin_user.username, password='password')
+    modified = weekly.modification_date
+    res = api.post(url_exception, data)
+    assert res.status_code == status.HTTP_201_CREATED, res.data
+    weekly.refresh_from_db()
+    assert weekly.modification_date > modified
+    assert not expand(weekly, at(7), at(8))
+
+    invalid = [
+        dict(date=at(7, 10).isoformat()),
+        dict(date=at(70, 9).isoformat()),
+        dict(date=at(14, 9).isoformat(), start_date=at(14).isoformat()),
+        dict(
+            date=at(14, 9).isoformat(),
+            start_date=at(64).isoformat(),
+            end_date=at(65).isoformat(),
+        ),
+    ]
+    for params in invalid:
+        res = api.post(url_exception, dict(data, **params))
+        assert res.status_code == status.HTTP_400_BAD_REQUEST, params
+
+    # Moved onto the next occurrence.
+    data = {
+        'appointment': weekly.pk,
+        'date': at(14, 9).isoformat(),
+        'start_date': at(21, 9).isoformat(),
+        'end_date': at(21, 10).isoformat(),
+    }
+    res = api.post(url_exception, data)
+    assert res.status_code == status.HTTP_400_BAD_REQUEST
+
+    data['start_date'] = at(15, 9).isoformat()
+    data['end_date'] = at(15, 10).isoformat()
+    res = api.post(url_exception, data)
+    assert res.status_code == status.HTTP_201_CREATED, res.data
+
+    assert api.login(username=regular_user.username, password='password')
+    res = api.get(url_exception)
+    assert len(res.data) == 2
+
+
+def test_schedule(weekly, admin_user):
+    schedule = get_schedule(admin_user.pk)
+    assert weekly.pk in schedule
+    gaps = list(schedule.free(at(7, 8), at(7, 12), timedelta(hours=1)))
+    assert gaps == [(at(7, 8), at(7, 9)), (at(7, 10), at(7, 12))]
+
+    # Exceptions reload the schedule.
+    AppointmentException.objects.create(appointment=weekly, date=at(7, 9))
+    weekly.save(update_fields=['modification_date'])
+    schedule = get_schedule(admin_user.pk)
+    gaps = list(schedule.free(at(7, 8), at(7, 12), timedelta(hours=1)))
+    assert gaps == [(at(7, 8), at(7, 12))]
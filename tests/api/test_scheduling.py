@@ -0,0 +1,148 @@
+from datetime import datetime, timedelta
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+from pytest import fixture, mark
+from rest_framework import status
+
+from frami.api import scheduling
+from frami.api.models import Appointment
+from frami.api.scheduling import Schedule, get_schedule
+
+url = '/api/appointment/free-slots/'
+day = datetime(2030, 1, 1, tzinfo=timezone.utc)
+
+
+@fixture(autouse=True)
+def clear():
+    # Primary keys are reused between tests.
+    cache.clear()
+    scheduling._schedules.clear()  # pylint: disable=W0212
+
+
+def hours(start, end):
+    return day + timedelta(hours=start), day + timedelta(hours=end)
+
+
+def test_free():
+    schedule = Schedule([
+        (*hours(9, 10), 1),
+        (*hours(11, 12), 2),
+        (*hours(11, 13), 3),
+        (*hours(14, 15), 4),
+    ])
+    gaps = list(schedule.free(*hours(8, 16), timedelta(hours=1)))
+    assert gaps == [hours(8, 9), hours(10, 11), hours(13, 14), hours(15, 16)]
+
+    gaps = list(schedule.free(*hours(9, 15), timedelta(minutes=90)))
+    assert not gaps
+
+    # Long intervals that start before the range are considered.
+    schedule.add(*hours(0, 12), 5)
+    gaps = list(schedule.free(*hours(10, 16), timedelta(hours=1)))
+    assert gaps == [hours(13, 14), hours(15, 16)]
+
+    schedule.remove(5)
+    schedule.add(*hours(15, 16), 4)
+    assert len(schedule) == 4
+    gaps = list(schedule.free(*hours(13, 17), timedelta(hours=1)))
+    assert gaps == [hours(13, 15), hours(16, 17)]
+
+
+def create(admin_user, regular_user, start, end):
+    return Appointment.objects.create(
+        patient=regular_user,
+        staff=admin_user,
+        creator=admin_user,
+        start_date=start,
+        end_date=end,
+    )
+
+
+def test_endpoint(api, admin_user, regular_user):
+    create(admin_user, regular_user, *hours(9, 10))
+    create(admin_user, regular_user, *hours(12, 13))
+
+    assert api.login(username=regular_user.username, password='password')
+    start, end = hours(8, 17)
+    res = api.get(
+        url,
+        {
+            'staff': admin_user.username,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'duration': 120,
+        },
+    )
+    assert res.status_code == status.HTTP_200_OK, res.data
+    assert [(x['start'], x['end']) for x in res.data] == [
+        ('2030-01-01T10:00:00Z', '2030-01-01T12:00:00Z'),
+        ('2030-01-01T13:00:00Z', '2030-01-01T17:00:00Z'),
+    ]
+
+
+def test_invalid(api, admin_user, regular_user):
+    assert api.login(username=regular_user.username, password='password')
+    start, end = hours(8, 17)
+    invalid = [
+        {},
+        dict(staff=regular_user.username),
+        dict(end=start.isoformat(), start=end.isoformat()),
+        dict(duration=0),
+    ]
+    for params in invalid:
+        query = {
+            'staff': admin_user.username,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'duration': 60,
+        }
+        query.update(params)
+        if not params:
+            query = {}
+        res = api.get(url, query)
+        assert res.status_code == status.HTTP_400_BAD_REQUEST, params
+
+
+def test_signals(admin_user, regular_user):
+    appointment = create(admin_user, regular_user, *hours(9, 10))
+    schedule = get_schedule(admin_user.pk)
+    assert appointment.pk in schedule
+    assert get_schedule(admin_user.pk) is schedule
+
+    # Uncommitted changes reload the schedule.
+    appointment.end_date = day + timedelta(hours=11)
+    appointment.save()
+    schedule = get_schedule(admin_user.pk)
+    assert not list(schedule.free(*hours(10, 11), timedelta(minutes=1)))
+
+
+def test_update(admin_user, regular_user, create_user, monkeypatch):
+    other = create_user('other-staff', 'admin')
+    appointment = create(admin_user, regular_user, *hours(9, 10))
+    schedule = get_schedule(admin_user.pk)
+    other_schedule = get_schedule(other.pk)
+
+    # Run the commit hooks at once.
+    monkeypatch.setattr(transaction, 'on_commit', lambda f: f())
+    appointment.staff = other
+    appointment.save()
+    assert get_schedule(admin_user.pk) is schedule
+    assert get_schedule(other.pk) is other_schedule
+    assert appointment.pk not in schedule
+    assert appointment.pk in other_schedule
+
+    appointment.delete()
+    assert get_schedule(other.pk) is other_schedule
+    assert not other_schedule
+
+
+@mark.django_db
+def test_benchmark():
+    out = StringIO()
+    call_command('benchmark', 'schedule', rows=40, repeat=1, stdout=out)
+    assert out.getvalue().startswith('free-slots rows=20 ')
+    assert not Appointment.objects.exists()
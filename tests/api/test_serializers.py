@@ -1,10 +1,26 @@
 from uuid import uuid4
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from pytest import raises
 from rest_framework.serializers import ModelSerializer
 
-from frami.api.models import Notification, Result
-from frami.api.serializers import GenericFieldSerializer
+from frami.api.models import (
+    Answer,
+    Appointment,
+    Notification,
+    Question,
+    Result,
+    UserNotification,
+)
+from frami.api.prefetch import get_related, prefetch_generic
+from frami.api.serializers import (
+    GenericFieldSerializer,
+    PrescriptionSerializer,
+    UserNotificationSerializer,
+    UserSerializer,
+)
 
 
 class FieldSerializer(GenericFieldSerializer):  # pylint: disable=W0223
@@ -26,3 +42,54 @@ def test_generic_field(admin_user):
 
     with raises(Exception):
         s.data  # pylint: disable=W0104
+
+
+def test_notification_list(admin_user, regular_user, extra_users):
+    def create(user):
+        Result.objects.create(creator=admin_user, patient=user)
+        Appointment.objects.create(
+            creator=admin_user,
+            patient=user,
+            staff=admin_user,
+            start_date=timezone.now(),
+            end_date=timezone.now(),
+        )
+        q = Question.objects.create(creator=user)
+        Answer.objects.create(question=q, creator=admin_user)
+
+    def serialize(users):
+        queryset = UserNotification.objects.filter(user__in=users)
+        with CaptureQueriesContext(connection) as ctx:
+            data = UserNotificationSerializer(queryset, many=True).data
+        assert data == [UserNotificationSerializer(n).data for n in queryset]
+        return len(ctx)
+
+    for user in [regular_user] + extra_users:
+        create(user)
+
+    assert serialize([regular_user]) == serialize(extra_users)
+
+
+def test_get_related():
+    select, prefetch = get_related(UserSerializer())
+    assert not select
+    assert prefetch[0] == 'groups'
+    assert prefetch[1].prefetch_through == 'prescriptions'
+
+    select, prefetch = get_related(PrescriptionSerializer())
+    assert select == ['creator', 'refill_request']
+    assert not prefetch
+
+
+def test_prefetch_generic(admin_user):
+    a = Result.objects.create(creator=admin_user, patient=admin_user)
+    b = Result.objects.create(creator=admin_user, patient=admin_user)
+    notifications = list(Notification.objects.order_by('pk'))
+    b.delete()
+
+    prefetch_generic([], 'target', [])
+    prefetch_generic(notifications, 'target', [])
+    with CaptureQueriesContext(connection) as ctx:
+        assert notifications[0].target == a
+    assert not ctx
+    assert notifications[1].target is None
@@ -1,11 +1,18 @@
+from uuid import uuid4
+
+from django.contrib.auth.models import Group
+from django.db import connection
 from django.db.models.signals import post_delete, post_save
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from pytest import raises
 
+from frami.api import notifications, signals
 from frami.api.models import (
     AppointmentRequest,
     GroupNotification,
     Notification,
+    Question,
     Result,
     UserNotification,
 )
@@ -42,3 +49,38 @@ def test_get_signal_name():
 
     with raises(Exception):
         _get_signal_name(None)
+
+
+def test_notification_query_count(admin_user, regular_user, extra_users):
+    r = Result.objects.create(patient=regular_user, creator=admin_user)
+    groups = list(Group.objects.values_list('pk', flat=True))
+
+    def create(users):
+        with CaptureQueriesContext(connection) as ctx:
+            notifications.create_notifications(
+                uuid=uuid4(),
+                user_ids=[u.pk for u in users],
+                group_ids=groups,
+                target=r,
+            )
+        return len(ctx)
+
+    assert create([regular_user]) == 1
+    assert create([admin_user] + extra_users) == 1
+    assert len(UserNotification.objects.all()) == 8
+    assert len(GroupNotification.objects.all()) == 2 * len(groups)
+    for n in UserNotification.objects.filter(user=admin_user):
+        assert n.target == r
+
+
+def test_group_cache(regular_user):
+    Question.objects.create(creator=regular_user)
+    assert signals._group_ids  # pylint: disable=W0212
+
+    group = Group.objects.create(name='other')
+    assert not signals._group_ids  # pylint: disable=W0212
+
+    Question.objects.create(creator=regular_user)
+    group.delete()
+    assert not signals._group_ids  # pylint: disable=W0212
+    assert len(GroupNotification.objects.all()) == 2
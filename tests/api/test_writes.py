@@ -0,0 +1,228 @@
+# pylint: disable=W0212,W0621
+import threading
+
+from django.db import IntegrityError, OperationalError, transaction
+from pytest import fixture, mark, raises
+from rest_framework import status
+
+from frami.api import writes
+from frami.api.models import Result
+from frami.api.writes import Coordinator, QueueFull, WriteTimeout
+from frami.sharding import shard_for_user
+
+url = '/api/result/'
+url_stats = '/api/write-queue/'
+
+
+@fixture
+def coordinator(settings):
+    settings.WRITE_QUEUE_SIZE = 10
+    writes._coordinator = None  # pylint: disable=W0212
+    yield writes.get_coordinator()
+    writes._coordinator = None  # pylint: disable=W0212
+
+
+def wait(coordinator, name, value):
+    while coordinator.get_stats()[name] < value:
+        pass
+
+
+@mark.usefixtures('committed_db')
+def test_batch(admin_user, regular_user):
+    coordinator = Coordinator(10, 5, 0)
+    gate = threading.Event()
+    results = {}
+
+    def create(i):
+        if i == 0:
+            gate.wait()
+        if i == 3:
+            raise ValueError(i)
+        return Result.objects.create(
+            kind=str(i),
+            result='result',
+            patient=regular_user,
+            creator=admin_user,
+        ).kind
+
+    def submit(i):
+        try:
+            results[i] = coordinator.submit(lambda: create(i))
+        except ValueError as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=submit, args=(0, ))]
+    threads[0].start()
+    wait(coordinator, 'batches', 1)
+    threads += [threading.Thread(target=submit, args=(i, )) for i in (1, 2, 3)]
+    for thread in threads[1:]:
+        thread.start()
+    wait(coordinator, 'depth', 3)
+    gate.set()
+    for thread in threads:
+        thread.join()
+
+    # The failing write is rolled back alone.
+    assert [results[i] for i in range(3)] == ['0', '1', '2']
+    assert isinstance(results[3], ValueError)
+    assert sorted(Result.objects.values_list('kind', flat=True)) == [
+        '0',
+        '1',
+        '2',
+    ]
+
+    stats = coordinator.get_stats()
+    assert stats['writes'] == 4
+    assert stats['batches'] == 2
+    assert stats['max_depth'] == 3
+    assert stats['depth'] == 0
+
+
+@mark.usefixtures('committed_db')
+def test_retry():
+    attempts = []
+
+    def locked():
+        attempts.append(None)
+        if len(attempts) < 3:
+            raise OperationalError('database is locked')
+        return len(attempts)
+
+    coordinator = Coordinator(10, 5, 2)
+    assert coordinator.submit(locked) == 3
+    assert coordinator.get_stats()['retries'] == 2
+
+    attempts.clear()
+    coordinator = Coordinator(10, 5, 1)
+    with raises(OperationalError):
+        coordinator.submit(locked)
+    assert coordinator.get_stats()['failures'] == 1
+
+
+@mark.usefixtures('committed_db')
+def test_full():
+    coordinator = Coordinator(1, 1, 0)
+    gate = threading.Event()
+    thread = threading.Thread(target=coordinator.submit, args=(gate.wait, ))
+    thread.start()
+    wait(coordinator, 'batches', 1)
+    thread2 = threading.Thread(target=coordinator.submit, args=(gate.wait, ))
+    thread2.start()
+    wait(coordinator, 'depth', 1)
+
+    with raises(QueueFull):
+        coordinator.submit(lambda: None)
+    gate.set()
+    thread.join()
+    thread2.join()
+    assert coordinator.get_stats()['failures'] == 1
+
+
+@mark.usefixtures('committed_db')
+def test_commit_error(admin_user):
+    coordinator = Coordinator(10, 5, 0)
+
+    def dangling():
+        return Result.objects.create(
+            kind='kind',
+            result='result',
+            patient_id=admin_user.pk + 100,
+            creator=admin_user,
+        ).pk
+
+    # Foreign keys are checked on commit.
+    with raises(IntegrityError):
+        coordinator.submit(dangling)
+    assert not Result.objects.exists()
+
+    def hook():
+        transaction.on_commit(lambda: 1 / 0)
+
+    with raises(ZeroDivisionError):
+        coordinator.submit(hook)
+
+    # The writer survives failed commits.
+    assert coordinator.submit(lambda: 'ok') == 'ok'
+    assert coordinator.get_stats()['failures'] == 2
+
+
+@mark.usefixtures('committed_db')
+def test_timeout():
+    coordinator = Coordinator(10, 1, 0, timeout=0.01)
+    gate = threading.Event()
+    done = []
+    errors = []
+
+    def submit():
+        try:
+            coordinator.submit(gate.wait)
+        except WriteTimeout as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=submit)
+    thread.start()
+    wait(coordinator, 'batches', 1)
+
+    # Writes that time out in the queue are abandoned.
+    with raises(WriteTimeout):
+        coordinator.submit(lambda: done.append(None))
+    gate.set()
+    thread.join()
+    assert coordinator.submit(lambda: 'ok') == 'ok'
+    assert not done
+
+    # Writes that time out while running are not waited for.
+    assert len(errors) == 1
+
+
+@mark.usefixtures('committed_db', 'coordinator')
+def test_api(api, admin_user, regular_user):
+    assert api.login(username=admin_user.username, password='password')
+    data = {'patient': regular_user.pk, 'kind': 'k', 'result': 'r'}
+    res = api.post(url, data)
+    assert res.status_code == status.HTTP_201_CREATED, res.data
+    pk = res.data['id']
+
+    res = api.patch('{}{}/'.format(url, pk), {'kind': 'x'})
+    assert res.status_code == status.HTTP_200_OK, res.data
+    assert Result.objects.get(pk=pk).kind == 'x'
+
+    res = api.delete('{}{}/'.format(url, pk))
+    assert res.status_code == status.HTTP_204_NO_CONTENT
+    assert not Result.objects.filter(pk=pk).exists()
+
+    res = api.get(url_stats)
+    assert res.status_code == status.HTTP_200_OK
+    assert res.data['enabled']
+    assert res.data['writes'] == 3
+    assert res.data['failures'] == 0
+
+    assert api.login(username=regular_user.username, password='password')
+    res = api.get(url_stats)
+    assert res.status_code == status.HTTP_403_FORBIDDEN
+
+
+@mark.usefixtures('shards')
+def test_shards(api, coordinator, admin_user, extra_users):
+    patient = [u for u in extra_users if shard_for_user(u.pk) != 'default'][0]
+    assert api.login(username=admin_user.username, password='password')
+
+    # Writes of sharded models bypass the writer.
+    data = {'patient': patient.pk, 'kind': 'k', 'result': 'r'}
+    res = api.post(url, data)
+    assert res.status_code == status.HTTP_201_CREATED, res.data
+    result = Result.objects.get(pk=res.data['id'])
+    assert result._state.db == shard_for_user(patient.pk)
+    res = api.patch('{}{}/'.format(url, result.pk), {'kind': 'x'})
+    assert res.status_code == status.HTTP_200_OK, res.data
+    res = api.delete('{}{}/'.format(url, result.pk))
+    assert res.status_code == status.HTTP_204_NO_CONTENT
+    assert not Result.objects.using(result._state.db).exists()
+    assert coordinator.get_stats()['writes'] == 0
+
+
+def test_disabled(api, admin_user):
+    assert writes.get_coordinator() is None
+    assert api.login(username=admin_user.username, password='password')
+    res = api.get(url_stats)
+    assert res.data == {'enabled': False}
@@ -1,11 +1,14 @@
 # pylint: disable=W0621
 from django.contrib.auth.models import Group
+from django.core.management import call_command
+from django.db import connections
 from django.utils import timezone
 from pytest import fixture, mark
 from rest_framework.test import APIClient
 
 from frami.api.groups import create_groups
 from frami.api.models import AppointmentRequest, Result
+from frami.database import get_database
 
 
 @fixture
@@ -40,6 +43,38 @@ def results(admin_user, regular_user, extra_users):
     }
 
 
+@fixture
+def committed_db(transactional_db):  # pylint: disable=W0613
+    yield
+    # Flushing keeps the AUTOINCREMENT counters, which would shift the
+    # primary keys of later tests.
+    with connections['default'].cursor() as cursor:
+        cursor.execute('DELETE FROM sqlite_sequence')
+
+
+@fixture
+def shards(settings, tmpdir, committed_db):  # pylint: disable=W0613
+    # Shards attach the primary, which only sees committed rows.
+    aliases = ['shard1', 'shard2']
+    for alias in aliases:
+        connections.databases[alias] = get_database(
+            {},
+            str(tmpdir / '{}.sqlite3'.format(alias)),
+        )
+    settings.DATABASE_SHARDS = aliases
+    for alias in aliases:
+        call_command('migrate', database=alias, verbosity=0)
+        # Migrations enable the foreign key checks again.
+        connections[alias].close()
+    yield aliases
+    # Flushing the primary emits `post_migrate` after the shards are gone.
+    settings.DATABASE_SHARDS = []
+    for alias in aliases:
+        connections[alias].close()
+        del connections[alias]
+        del connections.databases[alias]
+
+
 @fixture
 def api():
     return APIClient()
@@ -0,0 +1,80 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db.utils import ConnectionHandler
+from pytest import mark, raises
+
+from frami.database import PROFILES, get_database
+
+
+def test_profiles():
+    database = get_database({}, '/x/db.sqlite3')
+    assert database == dict(PROFILES['sqlite'], NAME='/x/db.sqlite3')
+
+    config = {
+        'PROFILE': 'sqlite-wal',
+        'CONN_MAX_AGE': 60,
+        'PRAGMAS': dict(synchronous='full'),
+    }
+    database = get_database(config, '/x/db.sqlite3')
+    assert database['NAME'] == '/x/db.sqlite3'
+    assert database['CONN_MAX_AGE'] == 60
+    assert database['PRAGMAS']['journal_mode'] == 'wal'
+    assert database['PRAGMAS']['synchronous'] == 'full'
+    assert PROFILES['sqlite-wal']['PRAGMAS']['synchronous'] == 'normal'
+
+    config = {'PROFILE': 'postgresql', 'HOST': 'db', 'USER': 'frami'}
+    database = get_database(config, '/x/db.sqlite3')
+    assert database['ENGINE'] == 'django.db.backends.postgresql'
+    assert database['NAME'] == 'frami'
+    assert database['HOST'] == 'db'
+    assert 'PRAGMAS' not in database
+
+
+def test_invalid():
+    invalid = [
+        [],
+        dict(PROFILE='mysql'),
+        dict(PROFILE='sqlite', HOST='db'),
+        dict(PROFILE='postgresql', PRAGMAS={}),
+        dict(CONN_MAX_AGE='60'),
+        dict(PRAGMAS=[]),
+        dict(PRAGMAS=dict(foreign_keys=0)),
+        dict(PRAGMAS=dict(synchronous='off; DROP TABLE x')),
+    ]
+    for config in invalid:
+        with raises(ValueError):
+            get_database(config, '/x/db.sqlite3')
+
+
+@mark.django_db
+def test_pragmas(tmpdir):
+    config = {'PROFILE': 'sqlite-wal', 'PRAGMAS': {'cache_size': -1024}}
+    database = get_database(config, str(tmpdir / 'db.sqlite3'))
+    connection = ConnectionHandler({'default': database})['default']
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        assert cursor.fetchone() == ('wal', )
+        cursor.execute('PRAGMA synchronous')
+        assert cursor.fetchone() == (1, )
+        cursor.execute('PRAGMA cache_size')
+        assert cursor.fetchone() == (-1024, )
+        cursor.execute('PRAGMA busy_timeout')
+        assert cursor.fetchone() == (5000, )
+    connection.close()
+
+
+@mark.django_db
+def test_benchmark():
+    out = StringIO()
+    call_command(
+        'benchmark',
+        'database',
+        rows=40,
+        repeat=1,
+        threads=2,
+        stdout=out,
+    )
+    lines = out.getvalue().splitlines()
+    assert lines[0].startswith('sqlite threads=2 errors=0 rows=40 ')
+    assert lines[1].startswith('sqlite-wal threads=2 errors=0 rows=40 ')
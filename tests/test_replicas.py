@@ -0,0 +1,112 @@
+# pylint: disable=W0621
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.utils import timezone
+from pytest import fixture, mark
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from frami.api.models import AppointmentRequest, Result
+from frami.database import get_database
+from frami.replicas import replicate
+
+url_request = '/api/appointment-request/'
+url_result = '/api/result/'
+
+
+@fixture
+def replica(settings, tmpdir, committed_db):  # pylint: disable=W0613
+    # The backup API can't copy a database in an open transaction, so
+    # the test commits.
+    connections.databases['replica'] = get_database(
+        {},
+        str(tmpdir / 'replica.sqlite3'),
+    )
+    settings.DATABASE_REPLICAS = ['replica']
+    yield 'replica'
+    connections['replica'].close()
+    del connections['replica']
+    del connections.databases['replica']
+
+
+def create_result(admin_user, regular_user):
+    return Result.objects.create(
+        kind='kind',
+        result='result',
+        patient=regular_user,
+        creator=admin_user,
+    )
+
+
+def test_router(api, replica, settings, admin_user, regular_user):
+    first = create_result(admin_user, regular_user)
+    replicate()
+    second = create_result(admin_user, regular_user)
+
+    # Reads are served by the replica until it catches up.
+    assert api.login(username=regular_user.username, password='password')
+    res = api.get(url_result)
+    assert res.status_code == status.HTTP_200_OK
+    assert [x['id'] for x in res.data] == [first.pk]
+
+    # Sessions that write read from the primary.
+    data = {
+        'start_date': timezone.now().isoformat(),
+        'end_date': timezone.now().isoformat(),
+        'subject': 'subject',
+        'message': 'message',
+    }
+    res = api.post(url_request, data)
+    assert res.status_code == status.HTTP_201_CREATED, res.data
+    res = api.get(url_request)
+    assert len(res.data) == 1
+    res = api.get(url_result)
+    assert [x['id'] for x in res.data] == [first.pk, second.pk]
+
+    # Until the pin expires.
+    settings.REPLICA_PIN_SECONDS = 0
+    res = api.post(url_request, data)
+    assert res.status_code == status.HTTP_201_CREATED, res.data
+    res = api.get(url_request)
+    assert not res.data
+
+    out = StringIO()
+    call_command('replicate', once=True, stdout=out)
+    assert out.getvalue().startswith('replicated in ')
+    res = api.get(url_request)
+    assert len(res.data) == 2
+
+    # Writes go to the primary.
+    res = api.delete('{}{}/'.format(url_request, res.data[0]['id']))
+    assert res.status_code == status.HTTP_204_NO_CONTENT
+    assert AppointmentRequest.objects.count() == 1
+    assert AppointmentRequest.objects.using(replica).count() == 2
+
+
+@mark.usefixtures('replica')
+def test_response_cache(api, settings, create_user, admin_user, regular_user):
+    settings.RESPONSE_CACHE_TIMEOUT = 60
+    cache.clear()
+    first = create_result(admin_user, regular_user)
+    replicate()
+
+    reader = APIClient()
+    other_admin = create_user('adm2', 'admin')
+    assert reader.login(username=other_admin.username, password='password')
+    assert api.login(username=admin_user.username, password='password')
+    data = {'patient': regular_user.pk, 'kind': 'kind', 'result': 'result'}
+    res = api.post(url_result, data)
+    assert res.status_code == status.HTTP_201_CREATED, res.data
+
+    # Responses from the lagging replica aren't cached for the scope.
+    res = reader.get(url_result)
+    assert [x['id'] for x in res.data] == [first.pk]
+    res = api.get(url_result)
+    assert len(res.data) == 2
+    replicate()
+    res = reader.get(url_result)
+    assert len(res.data) == 2
+    cache.clear()
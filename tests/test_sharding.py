@@ -0,0 +1,235 @@
+# pylint: disable=W0212,W0621
+import json
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.db import connections
+from django.utils import timezone
+from pytest import fixture, mark, raises
+from rest_framework import status
+
+from frami.api.models import (
+    Answer,
+    Appointment,
+    AppointmentRequest,
+    Prescription,
+    Question,
+    Result,
+)
+from frami.api.scheduling import get_schedule, has_overlap
+from frami.sharding import SHARD_BITS, get_shards, shard_for_user
+
+url_result = '/api/result/'
+url_changes = '/api/changes/'
+url_user = '/api/user/'
+
+
+@fixture
+def sharded_results(
+        shards,  # pylint: disable=W0613
+        admin_user,
+        regular_user,
+        extra_users,
+):
+    return [
+        Result.objects.create(
+            kind='kind {}'.format(i),
+            result='result',
+            patient=user,
+            creator=admin_user,
+        ) for i, user in enumerate([regular_user] + extra_users)
+    ]
+
+
+def test_route(sharded_results, admin_user, regular_user):
+    results = sharded_results
+    for result in results:
+        alias = shard_for_user(result.patient_id)
+        assert result._state.db == alias
+        assert result.pk >> SHARD_BITS == get_shards().index(alias)
+        assert Result.objects.get(pk=result.pk).kind == result.kind
+    assert len({r._state.db for r in results}) == 3
+
+    # Children follow their parent.
+    question = Question.objects.create(
+        subject='subject',
+        message='message',
+        creator=regular_user,
+    )
+    answer = Answer.objects.create(
+        message='message',
+        question=question,
+        creator=admin_user,
+    )
+    assert answer._state.db == question._state.db
+    assert Answer.objects.get(pk=answer.pk).question.subject == 'subject'
+    assert Answer.objects.get(pk=answer.pk).creator == admin_user
+
+    # Shards only hold the patient-scoped tables.
+    tables = connections['shard1'].introspection.table_names()
+    assert 'api_result' in tables
+    assert 'auth_user' not in tables
+
+
+def test_api(api, sharded_results, admin_user, regular_user, extra_users):
+    results = sharded_results
+    other = results[1]
+    assert other.patient == extra_users[0]
+
+    assert api.login(username=regular_user.username, password='password')
+    res = api.get(url_result)
+    assert [x['id'] for x in res.data] == [results[0].pk]
+    res = api.get('{}{}/'.format(url_result, other.pk))
+    assert res.status_code == status.HTTP_403_FORBIDDEN
+
+    # Lists of admins are merged from every shard.
+    assert api.login(username=admin_user.username, password='password')
+    res = api.get(url_result)
+    assert [x['id'] for x in res.data] == [r.pk for r in results]
+    assert res.data[1]['creator'] == admin_user.username
+
+    pks = []
+    next_url = url_result + '?page_size=4'
+    while next_url:
+        res = api.get(next_url)
+        assert len(res.data) <= 4
+        pks += [x['id'] for x in res.data]
+        next_url = res.get('Link', '')[1:].partition('>')[0]
+    assert pks == [r.pk for r in results]
+
+    assert stream(api) == api.get(url_result).data
+
+    res = api.patch('{}{}/'.format(url_result, other.pk), {'kind': 'x'})
+    assert res.status_code == status.HTTP_200_OK, res.data
+    other.refresh_from_db()
+    assert other.kind == 'x'
+
+    res = api.get(url_changes, {'page_size': 100})
+    changes = [x for x in res.data['changes'] if x['model'] == 'result']
+    assert len(changes) == len(results)
+
+    res = api.delete('{}{}/'.format(url_result, other.pk))
+    assert res.status_code == status.HTTP_204_NO_CONTENT
+    assert not Result.objects.filter(pk=other.pk).exists()
+
+
+@mark.usefixtures('sharded_results')
+def test_stream(api, extra_users):
+    # Streamed lists are read from the shard of the patient.
+    for user in extra_users:
+        assert api.login(username=user.username, password='password')
+        data = api.get(url_result).data
+        assert len(data) == 1
+        assert stream(api) == data
+
+
+@mark.usefixtures('shards')
+def test_prescriptions(api, admin_user, regular_user, extra_users):
+    patients = [regular_user] + extra_users
+    prescriptions = {
+        user.pk: Prescription.objects.create(
+            medication='medication',
+            quantity='quantity',
+            patient=user,
+            creator=admin_user,
+        ).pk
+        for user in patients
+    }
+    assert len({shard_for_user(user.pk) for user in patients}) == 3
+
+    # Prescriptions of users are read from the shard of each user.
+    assert api.login(username=admin_user.username, password='password')
+    res = api.get(url_user)
+    rendered = {x['id']: x['prescriptions'] for x in res.data}
+    for pk, prescription in prescriptions.items():
+        assert [p['id'] for p in rendered[pk]] == [prescription]
+    for user in patients:
+        res = api.get('{}{}/'.format(url_user, user.pk))
+        assert [p['id'] for p in res.data['prescriptions']] == [
+            prescriptions[user.pk],
+        ]
+
+
+def stream(api):
+    res = api.get(url_result, {'stream': 'true'})
+    assert res.status_code == status.HTTP_200_OK
+    return json.loads(b''.join(res.streaming_content).decode())
+
+
+@mark.usefixtures('shards')
+def test_schedule(admin_user, regular_user, extra_users):
+    start = timezone.now().replace(microsecond=0) + timedelta(days=1)
+    appointments = [
+        Appointment.objects.create(
+            patient=user,
+            staff=admin_user,
+            creator=admin_user,
+            start_date=start + timedelta(hours=i),
+            end_date=start + timedelta(hours=i, minutes=30),
+        ) for i, user in enumerate([regular_user] + extra_users[:2])
+    ]
+    assert len({a._state.db for a in appointments}) == 3
+
+    schedule = get_schedule(admin_user.pk)
+    assert all(a.pk in schedule for a in appointments)
+    for appointment in appointments:
+        intervals = [(appointment.start_date, appointment.end_date)]
+        assert has_overlap(intervals, admin_user.pk, None)
+        assert not has_overlap(intervals, admin_user.pk, None, appointment.pk)
+
+
+@mark.usefixtures('shards')
+def test_check_rows(admin_user, extra_users):
+    call_command('migrate', database='shard1', verbosity=0)
+
+    # Rows that were created before sharding are refused.
+    patient = [u for u in extra_users if shard_for_user(u.pk) != 'default'][0]
+    Result.objects.using('default').create(
+        kind='kind',
+        result='result',
+        patient=patient,
+        creator=admin_user,
+    )
+    with raises(ValueError):
+        call_command('migrate', database='shard1', verbosity=0)
+
+
+def test_delete_user(shards, sharded_results, admin_user, regular_user):
+    result = [r for r in sharded_results[1:] if r._state.db != 'default'][0]
+    patient = result.patient
+    appointment = Appointment.objects.create(
+        patient=patient,
+        staff=admin_user,
+        creator=admin_user,
+        start_date=timezone.now(),
+        end_date=timezone.now() + timedelta(hours=1),
+    )
+    request = AppointmentRequest.objects.create(
+        staff=admin_user,
+        creator=regular_user,
+        start_date=timezone.now(),
+        end_date=timezone.now(),
+        subject='subject',
+        message='message',
+        appointment=appointment,
+    )
+
+    # Rows of the patient are deleted from their shard.
+    patient.delete()
+    assert not Result.objects.using(result._state.db).filter(
+        pk=result.pk,
+    ).exists()
+    assert not Appointment.objects.using(appointment._state.db).exists()
+    request.refresh_from_db()
+    assert request.appointment_id is None
+
+    # Rows that other users created are handed to the deleted user.
+    admin_user.delete()
+    creators = {
+        r.creator.username
+        for queryset in [Result.objects.using(alias) for alias in shards]
+        for r in queryset
+    }
+    assert creators == {'deleted'}
+    request.refresh_from_db()
+    assert request.staff.username == 'deleted'